@@ -0,0 +1,125 @@
+"""DOM提取微基准：统计逐属性提取（旧）与批量页面内求值（新）的 Playwright 往返次数
+
+用法: python benchmarks/bench_dom_extraction.py --sections 6 --products 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playwright.async_api import async_playwright
+from playwright._impl._connection import Channel
+from category_parser import get_third_level_categories, get_all_category_products
+
+
+class RoundTripCounter:
+    """统计发往浏览器驱动的协议消息数（每条消息即一次往返）"""
+
+    def __init__(self):
+        self.count = 0
+        self._originals = {}
+
+    def __enter__(self):
+        for name in ('send', 'send_return_as_dict', 'send_no_reply'):
+            original = getattr(Channel, name, None)
+            if original is None:
+                continue
+            self._originals[name] = original
+            setattr(Channel, name, self._wrap(original))
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self._originals.items():
+            setattr(Channel, name, original)
+
+    def _wrap(self, original):
+        counter = self
+
+        def wrapper(channel, *args, **kwargs):
+            counter.count += 1
+            return original(channel, *args, **kwargs)
+        return wrapper
+
+
+def build_menu_html(sections, products):
+    """生成与菜单页 DOM 结构一致的合成页面"""
+    parts = ['<div data-e2e="Cold Coffee" id="tile">Cold Coffee</div><div class="baseMenu___UpTAi">']
+    for s in range(sections):
+        parts.append(f'<section class="pb4 lg-pb6" id="section-{s}"><ul class="grid grid--compactGutter">')
+        for p in range(products):
+            href = f"/menu/product/{s}{p:03d}/iced?parent=%2Fdrinks"
+            if p % 2:
+                link = f'<a class="prodTile" href="{href}" data-e2e="Product {s}-{p}">x</a>'
+            else:
+                link = f'<a class="prodTile" href="{href}"><span class="hiddenVisually">Product {s}-{p}</span></a>'
+            parts.append(f'<li class="gridItem">{link}</li>')
+        parts.append('</ul></section>')
+    parts.append('</div>')
+    return ''.join(parts)
+
+
+async def legacy_extract(page, second_level_category):
+    """旧实现：逐个 section / li / 属性分别往返"""
+    await second_level_category['element'].click()
+    base_menu_div = await page.query_selector('div.baseMenu___UpTAi')
+    categories = []
+    for section in await base_menu_div.query_selector_all('section.pb4.lg-pb6[id]'):
+        section_id = await section.get_attribute('id')
+        product_list = await section.query_selector('ul.grid.grid--compactGutter')
+        product_count = len(await product_list.query_selector_all('li.gridItem')) if product_list else 0
+        links = []
+        for item in await product_list.query_selector_all('li.gridItem'):
+            link = await item.query_selector('a.prodTile[href^="/menu/product/"]') or await item.query_selector('a.block.linkOverlay__primary[href^="/menu/product/"]')
+            if link:
+                href = await link.get_attribute('href')
+                name = await link.get_attribute('data-e2e')
+                if not name:
+                    hidden_span = await link.query_selector('span.hiddenVisually')
+                    name = await hidden_span.text_content() if hidden_span else href
+                links.append({'name': name.strip(), 'href': href})
+        categories.append({'id': section_id, 'product_count': product_count, 'products': links})
+    return categories
+
+
+async def batched_extract(page, second_level_category):
+    """新实现：三级类别与全部产品链接各一次页面内求值"""
+    categories = await get_third_level_categories(page, second_level_category)
+    products = await get_all_category_products(page, categories)
+    for category in categories:
+        category['products'] = products[category['id']]
+    return categories
+
+
+async def measure(page, name, extractor):
+    second_level_category = {'name': 'Cold Coffee', 'element': await page.query_selector('#tile')}
+    with RoundTripCounter() as counter:
+        started = time.perf_counter()
+        categories = await extractor(page, second_level_category)
+        elapsed = time.perf_counter() - started
+    product_total = sum(len(c['products']) for c in categories)
+    print(f"{name:<8} 类别={len(categories)} 产品={product_total} 往返={counter.count} 耗时={elapsed * 1000:.1f}ms")
+    return counter.count
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="DOM提取往返次数微基准")
+    parser.add_argument('--sections', type=int, default=6)
+    parser.add_argument('--products', type=int, default=20)
+    args = parser.parse_args()
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page()
+        await page.set_content(build_menu_html(args.sections, args.products))
+
+        before = await measure(page, 'legacy', legacy_extract)
+        after = await measure(page, 'batched', batched_extract)
+        print(f"往返次数减少: {before} -> {after}（{before / max(after, 1):.1f}x）")
+        await browser.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,210 @@
+"""端到端基准：在离线测试站点上运行 main_scraper，统计每分钟产品数、每个产品的往返次数和峰值内存
+
+每个规模在独立进程中运行，结果与 baseline.json 比较，任一指标退化超过阈值时以非零状态退出；
+缺少基线的规模只提示，在基准机器上用 --update-baseline 记录后才参与比较。浏览器内存需要 psutil
+用法: python benchmarks/bench_scraper.py --products 60 600 --latency-ms 30 --jitter-ms 10
+      python benchmarks/bench_scraper.py --products 60 --update-baseline
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import psutil
+except ImportError:  # 浏览器内存为可选指标，未安装 psutil 时不记录也不比较
+    psutil = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_dom_extraction import RoundTripCounter
+from fixture_site import FixtureSite, build_catalog, start_fixture_site
+from crawl_state import CrawlState
+from main import main_scraper
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# 指标及其方向：True 表示越大越好（内存以浏览器进程树为准，爬虫本身的Python进程内存只作参考）
+METRICS = {
+    'products_per_minute': True,
+    'round_trips_per_product': False,
+    'peak_browser_rss_mb': False,
+}
+
+
+def peak_rss_mb(who):
+    """getrusage 峰值内存（Linux 单位为KB，macOS 为字节）"""
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class BrowserMemorySampler:
+    """后台线程定时汇总浏览器进程树的 RSS，记录峰值
+
+    Chromium 由 Playwright 驱动进程启动，浏览器、GPU 和每个渲染进程各自独立；
+    getrusage(RUSAGE_CHILDREN) 只给出其中单个进程的峰值，这里对驱动进程之下的所有进程求和
+    """
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def sample(self):
+        total = 0
+        for driver in psutil.Process().children():
+            for process in driver.children(recursive=True):
+                try:
+                    total += process.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    pass
+        return total
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.peak = max(self.peak, self.sample())
+            except psutil.Error:
+                pass
+
+    def __enter__(self):
+        if psutil:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def peak_mb(self):
+        return round(self.peak / 1024 / 1024, 1) if psutil else None
+
+
+async def run_scenario(args, product_count):
+    site = FixtureSite(build_catalog(product_count, args.sold_out_every), args.latency_ms, args.jitter_ms)
+    server, base_url = start_fixture_site(site)
+    workdir = tempfile.mkdtemp(prefix='bench_scraper_')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    config = {
+        'base_url': base_url,
+        'headless': True,
+        'csv_filename': 'bench',
+        'state_db': os.path.join(workdir, 'crawl_state.db'),
+        'concurrency': args.concurrency,
+        'price_mode': args.price_mode,
+        'cart_batch_size': args.batch_size,
+    }
+    try:
+        with RoundTripCounter() as counter, BrowserMemorySampler() as memory:
+            started = time.perf_counter()
+            await main_scraper(full_menu=True, config=config)
+            elapsed = time.perf_counter() - started
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+
+    state = CrawlState(config['state_db'])
+    summary = state.summary()
+    state.close()
+    done = summary.get('done', 0)
+    return {
+        'products': product_count,
+        'done': done,
+        'failed': summary.get('failed', 0),
+        'elapsed_s': round(elapsed, 1),
+        'products_per_minute': round(done / elapsed * 60, 2) if elapsed else 0,
+        'round_trips_per_product': round(counter.count / max(done, 1), 1),
+        'http_requests_per_product': round(site.requests / max(done, 1), 1),
+        # 每个规模独占一个进程，峰值不受其他规模影响
+        'peak_rss_mb': peak_rss_mb(resource.RUSAGE_SELF),
+        'peak_browser_rss_mb': memory.peak_mb(),
+        'workdir': workdir,
+    }
+
+
+def run_scenario_process(args, product_count):
+    """子进程入口：运行一个规模"""
+    return asyncio.run(run_scenario(args, product_count))
+
+
+def scenario_key(args, product_count):
+    return (f"p{product_count}_lat{args.latency_ms:g}_jit{args.jitter_ms:g}"
+            f"_c{args.concurrency}_b{args.batch_size}_{args.price_mode}")
+
+
+def compare(result, baseline, threshold):
+    """返回退化超过阈值的指标说明列表"""
+    regressions = []
+    for metric, higher_is_better in METRICS.items():
+        old, new = baseline.get(metric), result.get(metric)
+        if not old or new is None:
+            # 基线或本次缺少该指标（如未安装 psutil）时不比较
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > threshold:
+            regressions.append(f"{metric}: {old} -> {new}（{change:+.1%}）")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="main_scraper 端到端基准")
+    parser.add_argument('--products', type=int, nargs='+', default=[60], help="菜单产品总数（可多个规模）")
+    parser.add_argument('--sold-out-every', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--price-mode', default='cart')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.15, help="允许的退化比例")
+    parser.add_argument('--update-baseline', action='store_true', help="用本次结果覆盖基线")
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+
+    failed = False
+    for product_count in sorted(args.products):
+        key = scenario_key(args, product_count)
+        # spawn 启动全新的进程，每个规模的内存峰值互不累计
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            result = executor.submit(run_scenario_process, args, product_count).result()
+        print(f"\n[{key}] 完成 {result['done']}/{result['products']} 失败 {result['failed']} "
+              f"用时 {result['elapsed_s']}s 每分钟产品数 {result['products_per_minute']} "
+              f"往返/产品 {result['round_trips_per_product']} HTTP请求/产品 {result['http_requests_per_product']} "
+              f"浏览器峰值内存 {result['peak_browser_rss_mb']}MB（爬虫进程 {result['peak_rss_mb']}MB）")
+
+        if result['done'] + result['failed'] < result['products']:
+            print(f"[{key}] 有产品未被处理")
+            failed = True
+        if args.update_baseline:
+            baselines[key] = {metric: result[metric] for metric in METRICS}
+        elif key not in baselines:
+            print(f"[{key}] 没有基线，跳过比较（在基准机器上使用 --update-baseline 记录并提交 baseline.json）")
+        else:
+            regressions = compare(result, baselines[key], args.threshold)
+            for regression in regressions:
+                print(f"[{key}] 性能退化: {regression}")
+            failed = failed or bool(regressions)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+        print(f"基线已更新: {args.baseline}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
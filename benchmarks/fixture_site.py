@@ -0,0 +1,398 @@
+"""离线测试站点：复现爬虫依赖的菜单页、类别网格、产品页、加购弹窗、购物车和售罄页面的 DOM 结构
+
+用法: python benchmarks/fixture_site.py --products 200 --latency-ms 50 --jitter-ms 20 --port 8765
+然后: STARBUCKS_BASE_URL=http://127.0.0.1:8765 python main.py
+"""
+import argparse
+import html
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# 菜单结构：(主类别 section id, 主类别名称, [(二级类别, [三级类别, ...]), ...])
+MENU_LAYOUT = [
+    ('drinks', 'Drinks', [
+        ('Cold Coffee', ['Cold Brew', 'Nitro Cold Brew', 'Iced Coffee', 'Iced Shaken Espresso']),
+        ('Hot Coffee', ['Americanos', 'Brewed Coffee', 'Cappuccinos', 'Lattes']),
+        ('Hot Tea', ['Chai Tea', 'Black Tea', 'Green Tea']),
+        ('Frappuccino Blended Beverage', ['Coffee Frappuccino', 'Creme Frappuccino']),
+    ]),
+    ('food', 'Food', [
+        ('Breakfast', ['Hot Breakfast', 'Oatmeal And Yogurt']),
+        ('Bakery', ['Bagels', 'Croissants', 'Muffins And Breads']),
+    ]),
+    ('at-home-coffee', 'At Home Coffee', [
+        ('Whole Bean', ['Blonde Roast', 'Medium Roast', 'Dark Roast']),
+    ]),
+]
+
+# 饮品规格：(规格名, 容量文本, 价格增量, 卡路里增量)
+DRINK_SIZES = [('Tall', '12 fl oz', 0.0, 0), ('Grande', '16 fl oz', 0.5, 40), ('Venti', '24 fl oz', 1.0, 90)]
+
+
+def slugify(name):
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def build_catalog(product_count, sold_out_every=10, seed=0, shared_every=7):
+    """生成菜单目录：产品按轮转方式分配到所有三级类别，每 sold_out_every 个产品有一个售罄
+
+    每 shared_every 个产品有一个同时出现在另一个主类别的三级类别中（链接的 ?parent= 不同，产品相同）
+    """
+    rng = random.Random(seed)
+    thirds = [(main_id, main_name, second, third)
+              for main_id, main_name, seconds in MENU_LAYOUT
+              for second, third_names in seconds
+              for third in third_names]
+    products = {}
+    for index in range(product_count):
+        main_id, main_name, second, third = thirds[index % len(thirds)]
+        product_id = 100 + index
+        base_price = round(rng.uniform(2.5, 5.5), 2)
+        base_calories = rng.randrange(5, 300, 5)
+        if main_id == 'drinks':
+            sizes = [{'name': name, 'volume': volume, 'price': round(base_price + extra_price, 2),
+                      'calories': base_calories + extra_calories}
+                     for name, volume, extra_price, extra_calories in DRINK_SIZES]
+        else:
+            sizes = [{'name': 'Standard', 'volume': '', 'price': base_price, 'calories': base_calories}]
+        products[product_id] = {
+            'id': product_id,
+            'name': f"{third} {index // len(thirds) + 1}",
+            'main': main_id,
+            'second': second,
+            'third': third,
+            'sizes': sizes,
+            'sold_out': bool(sold_out_every) and index % sold_out_every == sold_out_every - 1,
+            'also': [],
+        }
+        if shared_every and index % shared_every == shared_every - 1:
+            others = [placement for placement in thirds if placement[0] != main_id]
+            other_main, _, other_second, other_third = others[index % len(others)]
+            products[product_id]['also'].append((other_main, other_second, other_third))
+    return products
+
+
+MENU_SCRIPT = """
+document.addEventListener('click', async (event) => {
+    const tile = event.target.closest('li[data-e2e="tile"] div[data-e2e]');
+    if (!tile) return;
+    const old = document.querySelector('div.baseMenu___UpTAi');
+    if (old) old.remove();
+    const main = tile.closest('section').id;
+    const response = await fetch(`/menu/category?main=${encodeURIComponent(main)}&second=${encodeURIComponent(tile.dataset.e2e)}`);
+    document.getElementById('menu-content').innerHTML = await response.text();
+});
+"""
+
+PRODUCT_SCRIPT = """
+const product = JSON.parse(document.getElementById('product-data').textContent);
+const select = document.querySelector('select[data-e2e="size-selector"]');
+const calories = document.querySelector('span[data-e2e="calories"]');
+const dialog = document.getElementById('added-dialog');
+// 与线上页面一样在加载后请求产品接口（network 定价模式捕获该响应）
+fetch(`/bff/ordering/product/${product.id}`);
+if (select) {
+    select.addEventListener('change', () => {
+        const size = product.sizes.find(s => s.name === select.value);
+        setTimeout(() => { calories.textContent = `${size.calories} calories`; }, UI_DELAY_MS);
+    });
+}
+document.querySelector('button[data-e2e="add-to-order-button"]').addEventListener('click', async () => {
+    const response = await fetch('/api/cart/add', {method: 'POST', headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({product_id: product.id, size: select ? select.value : 'Standard'})});
+    if (response.ok) {
+        dialog.hidden = false;
+    }
+});
+dialog.querySelector('button[aria-label="Close"]').addEventListener('click', () => {
+    setTimeout(() => { dialog.hidden = true; }, UI_DELAY_MS);
+});
+"""
+
+CART_SCRIPT = """
+document.addEventListener('click', async (event) => {
+    const button = event.target.closest('button[data-e2e="decreaseQuantityButton"]');
+    if (!button) return;
+    const response = await fetch('/api/cart/decrease', {method: 'POST', headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({key: button.dataset.key})});
+    document.getElementById('cart-items').innerHTML = await response.text();
+});
+"""
+
+
+def product_state(product):
+    """产品在嵌入状态中的节点：编号、名称、slug、售罄标记和规格列表"""
+    return {
+        'productNumber': product['id'],
+        'name': product['name'],
+        'slug': slugify(product['name']),
+        'isSoldOut': product['sold_out'],
+        'sizes': [{'sizeCode': s['name'], 'price': s['price'], 'calories': str(s['calories'])}
+                  for s in product['sizes']],
+    }
+
+
+def _page(title, body, script=''):
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(title)}</title></head>'
+            f'<body>{body}<script>{script}</script></body></html>')
+
+
+class FixtureSite:
+    """测试站点状态：菜单目录、每个会话（Cookie）独立的门店选择和购物车、延迟配置和请求计数
+
+    与真实站点一样，会话需先打开带 storeNumber 的菜单页选择门店，否则加购被拒绝（无法定价）
+    """
+
+    def __init__(self, products, latency_ms=0, jitter_ms=0, ui_delay_ms=20, recorded=None):
+        self.products = products
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.ui_delay_ms = ui_delay_ms
+        self.carts = {}
+        self.stores = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        # 录制的接口响应 {路径: JSON载荷}，优先于生成的页面返回
+        self.recorded = recorded or {}
+
+    def delay(self):
+        """模拟网络延迟并计数请求"""
+        with self.lock:
+            self.requests += 1
+        seconds = (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def related(self, product, count=2):
+        """推荐产品：按编号紧随其后的 count 个产品（循环）"""
+        ids = sorted(self.products)
+        index = ids.index(product['id'])
+        return [self.products[ids[(index + offset) % len(ids)]] for offset in range(1, count + 1)
+                if ids[(index + offset) % len(ids)] != product['id']]
+
+    def product_api(self, product):
+        """产品接口载荷：产品节点和推荐产品节点（推荐产品的规格和价格不应算到当前产品）"""
+        return {
+            'product': product_state(product),
+            'recommendations': [product_state(related) for related in self.related(product)],
+        }
+
+    def menu_html(self):
+        sections = []
+        for main_id, main_name, seconds in MENU_LAYOUT:
+            tiles = ''.join(f'<li data-e2e="tile"><div data-e2e="{html.escape(second)}">{html.escape(second)}</div></li>'
+                            for second, _ in seconds)
+            sections.append(f'<section class="pb4 lg-pb6" id="{main_id}"><h2 class="heading2">{html.escape(main_name)}</h2>'
+                            f'<ul>{tiles}</ul></section>')
+        return _page('Menu', ''.join(sections) + '<div id="menu-content"></div>', MENU_SCRIPT)
+
+    def category_html(self, main_id, second):
+        layout = next((s for m, _, seconds in MENU_LAYOUT if m == main_id for s in seconds if s[0] == second), None)
+        if not layout:
+            return '<div class="baseMenu___UpTAi"></div>'
+        parts = ['<div class="baseMenu___UpTAi">']
+        for third in layout[1]:
+            items = []
+            for product in self.products.values():
+                placements = [(product['main'], product['second'], product['third'])] + list(product.get('also', []))
+                if (main_id, second, third) not in placements:
+                    continue
+                href = f"/menu/product/{product['id']}/{slugify(product['name'])}?parent=%2F{main_id}"
+                # 交替使用两种产品链接结构（data-e2e 名称 / 隐藏文本名称）
+                if product['id'] % 2:
+                    link = f'<a class="prodTile" href="{href}" data-e2e="{html.escape(product["name"])}">x</a>'
+                else:
+                    link = (f'<a class="block linkOverlay__primary" href="{href}">'
+                            f'<span class="hiddenVisually">{html.escape(product["name"])}</span></a>')
+                items.append(f'<li class="gridItem">{link}</li>')
+            parts.append(f'<section class="pb4 lg-pb6" id="{slugify(third)}"><h2>{html.escape(third)}</h2>'
+                         f'<ul class="grid grid--compactGutter">{"".join(items)}</ul></section>')
+        parts.append('</div>')
+        return ''.join(parts)
+
+    def product_html(self, product):
+        first = product['sizes'][0]
+        selector = ''
+        if product['main'] == 'drinks':
+            options = ''.join(f'<option value="{s["name"]}">{s["name"]} {s["volume"]}</option>' for s in product['sizes'])
+            selector = f'<select data-e2e="size-selector">{options}</select>'
+        sold_out = '<p class="soldOut">Sold out at this store</p>' if product['sold_out'] else ''
+        # 与线上页面一样在 __NEXT_DATA__ 中嵌入产品状态（含推荐产品），供快速路径解析
+        next_data = {'props': {'pageProps': self.product_api(product)}}
+        body = (f'<h1>{html.escape(product["name"])}</h1>{sold_out}{selector}'
+                f'<div class="auxiliaryProductInfoFont___x"><span data-e2e="calories">{first["calories"]} calories</span></div>'
+                f'<button data-e2e="add-to-order-button">Add to order</button>'
+                f'<div id="added-dialog" hidden><p>Added to order</p><button aria-label="Close">x</button></div>'
+                f'<script id="product-data" type="application/json">{json.dumps(product)}</script>'
+                f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(next_data)}</script>')
+        return _page(product['name'], body, PRODUCT_SCRIPT.replace('UI_DELAY_MS', str(self.ui_delay_ms)))
+
+    def cart_items_html(self, session):
+        cart = self.carts.get(session, {})
+        if not cart:
+            return '<div>Start your next order</div>'
+        parts = []
+        for key, quantity in cart.items():
+            product_id, size_name = key.split('|', 1)
+            product = self.products[int(product_id)]
+            size = next(s for s in product['sizes'] if s['name'] == size_name)
+            parts.append(
+                f'<div data-e2e="cart-item"><h3 data-e2e="cart-item-name">{html.escape(product["name"])}</h3>'
+                f'<div data-e2e="option-price-line"><p>{size["name"]} {size["volume"]}</p></div>'
+                f'<span data-e2e="cart-item-price">${size["price"] * quantity:.2f}</span>'
+                f'<span>Qty {quantity}</span>'
+                f'<button data-e2e="decreaseQuantityButton" aria-label="Decrease amount" data-key="{html.escape(key)}">-</button></div>')
+        return ''.join(parts)
+
+    def cart_html(self, session):
+        with self.lock:
+            items = self.cart_items_html(session)
+        body = f'<h1>Your Order</h1><div data-e2e="cart-container"><div id="cart-items">{items}</div></div>'
+        return _page('Cart', body, CART_SCRIPT)
+
+    def select_store(self, session, store_number):
+        with self.lock:
+            self.stores[session] = store_number
+
+    def add_to_cart(self, session, product_id, size_name):
+        """加入购物车，返回购物车件数；会话未选择门店时返回 None"""
+        key = f"{product_id}|{size_name}"
+        with self.lock:
+            if session not in self.stores:
+                return None
+            cart = self.carts.setdefault(session, {})
+            cart[key] = cart.get(key, 0) + 1
+            return sum(cart.values())
+
+    def decrease(self, session, key):
+        with self.lock:
+            cart = self.carts.setdefault(session, {})
+            if key in cart:
+                cart[key] -= 1
+                if cart[key] <= 0:
+                    del cart[key]
+            return self.cart_items_html(session)
+
+
+PRODUCT_PATH_RE = re.compile(r'^/menu/product/(\d+)/')
+PRODUCT_API_RE = re.compile(r'^/bff/ordering/product/(\d+)$')
+
+
+def load_recorded(paths):
+    """读取录制文件：每个文件是 [{'url': ..., 'payload': ...}] 列表（与 ResponseCapture.payloads 结构相同）"""
+    recorded = {}
+    for path in paths or []:
+        with open(path, encoding='utf-8') as f:
+            for entry in json.load(f):
+                url = urlparse(entry['url'])
+                recorded[url.path + (f"?{url.query}" if url.query else '')] = entry['payload']
+    return recorded
+
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _session(self):
+            match = re.search(r'(?:^|;\s*)sid=([\w-]+)', self.headers.get('Cookie', ''))
+            return (match.group(1), False) if match else (uuid.uuid4().hex, True)
+
+        def _send(self, status, body, content_type='text/html; charset=utf-8', session=None):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            if session:
+                self.send_header('Set-Cookie', f"sid={session}; Path=/")
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端已超时断开（如快速路径的超时测试），无需写出
+                pass
+
+        def do_GET(self):
+            site.delay()
+            session, is_new = self._session()
+            new_session = session if is_new else None
+            url = urlparse(self.path)
+            match = PRODUCT_PATH_RE.match(url.path)
+            api_match = PRODUCT_API_RE.match(url.path)
+            if self.path in site.recorded or url.path in site.recorded:
+                payload = site.recorded.get(self.path, site.recorded.get(url.path))
+                self._send(200, json.dumps(payload), 'application/json')
+            elif api_match and int(api_match.group(1)) in site.products:
+                self._send(200, json.dumps(site.product_api(site.products[int(api_match.group(1))])), 'application/json')
+            elif url.path == '/menu':
+                store_number = parse_qs(url.query).get('storeNumber', [''])[0]
+                if store_number:
+                    site.select_store(session, store_number)
+                self._send(200, site.menu_html(), session=new_session)
+            elif url.path == '/menu/category':
+                query = parse_qs(url.query)
+                self._send(200, site.category_html(query.get('main', [''])[0], query.get('second', [''])[0]))
+            elif url.path == '/menu/cart':
+                self._send(200, site.cart_html(session), session=new_session)
+            elif match and int(match.group(1)) in site.products:
+                self._send(200, site.product_html(site.products[int(match.group(1))]), session=new_session)
+            else:
+                self._send(404, _page('Not found', '<h1>Not found</h1>'))
+
+        def do_POST(self):
+            site.delay()
+            session, _ = self._session()
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if self.path == '/api/cart/add':
+                count = site.add_to_cart(session, payload['product_id'], payload['size'])
+                if count is None:
+                    self._send(409, json.dumps({'error': 'store not selected'}), 'application/json')
+                else:
+                    self._send(200, json.dumps({'count': count}), 'application/json')
+            elif self.path == '/api/cart/decrease':
+                self._send(200, site.decrease(session, payload.get('key')))
+            else:
+                self._send(404, '{}', 'application/json')
+
+    return Handler
+
+
+def start_fixture_site(site, host='127.0.0.1', port=0):
+    """在后台线程启动测试站点，返回 (server, base_url)；port=0 时自动分配端口"""
+    server = ThreadingHTTPServer((host, port), make_handler(site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线测试站点")
+    parser.add_argument('--products', type=int, default=100, help="菜单产品总数")
+    parser.add_argument('--sold-out-every', type=int, default=10, help="每N个产品一个售罄（0 表示没有售罄）")
+    parser.add_argument('--latency-ms', type=float, default=0, help="每个请求的固定延迟")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="每个请求额外的随机延迟上限")
+    parser.add_argument('--ui-delay-ms', type=float, default=20, help="切换规格、关闭弹窗后页面更新的延迟")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--recorded', nargs='*', help="录制的接口响应JSON文件，按其中的URL路径原样返回")
+    args = parser.parse_args()
+
+    site = FixtureSite(build_catalog(args.products, args.sold_out_every),
+                       args.latency_ms, args.jitter_ms, args.ui_delay_ms, load_recorded(args.recorded))
+    server, base_url = start_fixture_site(site, port=args.port)
+    print(f"测试站点已启动: {base_url}/menu （{args.products} 个产品），Ctrl+C 退出")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,171 @@
+import asyncio
+from playwright.async_api import Page
+from utils import log_error, bind_context, current_context
+from rate_controller import throttle
+from network_capture import normalize_name
+from selector_registry import FIRST_MATCH_JS, page_alternatives, record_hits
+from product_scraper import (open_product_page, add_sizes_to_cart, read_cart_items, match_size,
+                             get_sold_out_product_sizes, on_cart_page, open_cart)
+
+# 一次页面内求值清空购物车：循环点击减少按钮，每次等待条目内容变化后继续
+# 按钮和条目都按注册表备选查找，返回剩余条目数和每次查找命中的备选下标
+EMPTY_CART_JS = f"""async ([buttonAlternatives, itemAlternatives]) => {{
+    const first = {FIRST_MATCH_JS};
+    const findItems = () => {{
+        for (let i = 0; i < itemAlternatives.length; i++) {{
+            const items = document.querySelectorAll(itemAlternatives[i].css);
+            if (items.length) return [i, items];
+        }}
+        return [-1, []];
+    }};
+    const signature = () => Array.from(findItems()[1], el => el.innerText).join('||');
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+    const itemsIndex = findItems()[0];
+    const buttonHits = [];
+    for (let i = 0; i < 200; i++) {{
+        const [index, btn] = first(document, buttonAlternatives);
+        // 购物车已空时找不到按钮是正常结束，不算未命中
+        if (index >= 0 || findItems()[1].length) buttonHits.push(index);
+        if (!btn) break;
+        const before = signature();
+        btn.click();
+        for (let waited = 0; signature() === before && waited < 5000; waited += 50) {{
+            await sleep(50);
+        }}
+        if (signature() === before) break;
+    }}
+    return {{remaining: findItems()[1].length, itemsIndex, buttonHits}};
+}}"""
+
+
+def take_batch(queue: asyncio.Queue, batch_size):
+    """从队列取出最多 batch_size 个产品，同一批次内产品名称互不相同（同名产品放回队列留给后续批次）"""
+    batch = []
+    names = set()
+    deferred = []
+    while len(batch) < batch_size:
+        try:
+            product = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            break
+        name = normalize_name(product['name'])
+        if name in names:
+            deferred.append(product)
+            continue
+        names.add(name)
+        batch.append(product)
+    for product in deferred:
+        queue.put_nowait(product)
+        queue.task_done()
+    return batch
+
+
+def attribute_cart_items(cart_items, added):
+    """将购物车条目归属到 (产品, 规格)
+
+    added: {产品URL: {'product': 产品字典, 'sizes': {规格名: 卡路里}}}
+    先按产品名称确定产品（名称完全相等优先，其次取条目全文中包含的最长产品名），
+    再在该产品已加购的规格中匹配规格，因此不同产品的同名规格不会串价。
+    返回 ({产品URL: [(规格名, 价格)]}, 无法归属的条目列表)
+    """
+    attributed = {url: [] for url in added}
+    unattributed = []
+    names = {url: normalize_name(entry['product']['name']) for url, entry in added.items()}
+
+    for item in cart_items:
+        item_name = normalize_name(item.get('name'))
+        candidates = [url for url, name in names.items() if item_name and name == item_name]
+        if not candidates:
+            item_text = normalize_name(item.get('text'))
+            contained = [url for url, name in names.items() if name and name in item_text]
+            if contained:
+                longest = max(len(names[url]) for url in contained)
+                candidates = [url for url in contained if len(names[url]) == longest]
+        if len(candidates) != 1:
+            unattributed.append(item)
+            continue
+
+        url = candidates[0]
+        sizes = added[url]['sizes']
+        size_name = match_size(item.get('size_text') or item.get('text'), sizes.keys())
+        if size_name not in sizes and len(sizes) == 1:
+            size_name = next(iter(sizes))
+        attributed[url].append((size_name, (item.get('price') or "N/A").strip()))
+    return attributed, unattributed
+
+
+async def empty_cart(page: Page):
+    """一次操作清空购物车（当前不在购物车页面时先进入），返回剩余未清空的条目数"""
+    try:
+        if not on_cart_page(page):
+            await open_cart(page)
+        buttons = page_alternatives('decrease_quantity_button')
+        items = page_alternatives('cart_item')
+        # 页面内的连续点击作为一次调度许可；循环中等待条目刷新的耗时不是站点延迟，不参与速率反馈
+        async with throttle(page, measure=False):
+            raw = await page.evaluate(EMPTY_CART_JS, [buttons, items])
+        record_hits('decrease_quantity_button', buttons, raw['buttonHits'])
+        if raw['itemsIndex'] >= 0:
+            record_hits('cart_item', items, [raw['itemsIndex']])
+        remaining = raw['remaining']
+        if remaining:
+            log_error(f"购物车未完全清空，剩余 {remaining} 个条目")
+        return remaining
+    except Exception as e:
+        log_error(f"清空购物车出错: {str(e)}")
+        return -1
+
+
+async def scrape_product_batch(slot, products, history=None):
+    """将K个产品的所有规格加入同一个购物车，只读取一次购物车并归属价格
+
+    同一批次内产品名称必须互不相同（由调用方保证），返回 {产品URL: 规格行列表或该产品的异常}
+    """
+    rows_by_url = {}
+    added = {}
+    page = await slot.acquire()
+    healthy = False
+    cart_touched = False
+    try:
+        for product in products:
+            try:
+                sold_out, rows = await open_product_page(page, product, history)
+                if rows:
+                    rows_by_url[product['url']] = rows
+                    continue
+                if sold_out:
+                    rows_by_url[product['url']] = await get_sold_out_product_sizes(
+                        page, product['name'], product['url'], product['category'])
+                    continue
+                bind_context(phase='add_to_cart')
+                cart_touched = True
+                added[product['url']] = {'product': product, 'sizes': await add_sizes_to_cart(page, product)}
+            except Exception as e:
+                # 异常交给worker分类并登记到失败队列
+                e.phase = current_context().get('phase')
+                rows_by_url[product['url']] = e
+
+        if added:
+            bind_context(phase='cart_read')
+            cart_items = await read_cart_items(page)
+            attributed, unattributed = attribute_cart_items(cart_items, added)
+            for item in unattributed:
+                log_error(f"购物车条目无法归属到产品: {(item.get('text') or '').strip()[:80]}")
+            for url, entry in added.items():
+                product = entry['product']
+                rows_by_url[url] = [{
+                    "category": product['category'],
+                    "product_name": product['name'],
+                    "size": size_name,
+                    "calories": entry['sizes'].get(size_name, "N/A"),
+                    "price": price,
+                    "url": url
+                } for size_name, price in attributed[url]]
+        healthy = True
+        return rows_by_url
+    finally:
+        # 读购物车或归属出错时同样清空，避免遗留条目串到下一批
+        if cart_touched:
+            bind_context(phase='clear_cart')
+            await empty_cart(page)
+        await slot.release(page, healthy)
\ No newline at end of file
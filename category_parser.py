@@ -1,16 +1,29 @@
 from playwright.async_api import Page
 from utils import log_error
+from instrumentation import traced
+from page_handler import site_url
+from rate_controller import throttle
+from selector_registry import FIRST_MATCH_JS, page_alternatives, record_hits
 
+MAIN_CATEGORY_IDS = ['drinks', 'food', 'at-home-coffee']
+
+
+@traced('get_main_categories')
 async def get_main_categories(page: Page):
     """获取所有主类别（drinks, food, at-home-coffee）"""
     try:
+        # 一次页面内求值返回所有 section 的 id 和标题
+        sections = await page.eval_on_selector_all(
+            'section.pb4.lg-pb6',
+            """sections => sections.map(section => {
+                const heading = section.querySelector('h2.heading2');
+                return {id: section.getAttribute('id'), heading: heading ? heading.textContent : null};
+            })""")
         main_categories = []
-        sections = await page.query_selector_all('section.pb4.lg-pb6')
         for section in sections:
-            section_id = await section.get_attribute('id')
-            if section_id in ['drinks', 'food', 'at-home-coffee']:
-                heading = await section.query_selector('h2.heading2')
-                category_name = await heading.text_content() if heading else section_id.replace('-', ' ').title()
+            section_id = section['id']
+            if section_id in MAIN_CATEGORY_IDS:
+                category_name = section['heading'] or section_id.replace('-', ' ').title()
                 main_categories.append({
                     'id': section_id,
                     'name': category_name.strip()
@@ -23,6 +36,7 @@ async def get_main_categories(page: Page):
         log_error(error_msg)
         return []
 
+@traced('get_second_level_categories')
 async def get_second_level_categories(page: Page, main_category):
     """获取二级类别（如Cold Coffee, Hot Tea等）"""
     try:
@@ -56,49 +70,53 @@ async def get_second_level_categories(page: Page, main_category):
         return []
 
 
+@traced('get_third_level_categories')
 async def get_third_level_categories(page: Page, second_level_category):
     """获取三级类别（如Cold Brew, Nitro Cold Brew等）"""
     try:
         print(f"已进入{second_level_category['name']}类别页面")
 
         # 1. 点击二级类别元素（确保元素可点击）
-        await second_level_category['element'].click()
+        async with throttle(page):
+            await second_level_category['element'].click()
 
         # 2. 等待三级类别容器加载（超时 30 秒，可调整）
         await page.wait_for_selector('div.baseMenu___UpTAi', timeout=30000)
 
-        # 3. 定位三级类别容器
-        base_menu_div = await page.query_selector('div.baseMenu___UpTAi')
-        if not base_menu_div:
-            print("未找到三级类别容器 div.baseMenu___UpTAi")
-            return []
-
-        # 4. 在容器内查询三级类别 sections
-        sections = await base_menu_div.query_selector_all('section.pb4.lg-pb6[id]')
+        # 3. 一次页面内求值提取所有三级类别 section 的 id 和产品数量
+        third_level_selector = 'div.baseMenu___UpTAi section.pb4.lg-pb6[id]'
+        sections = await page.eval_on_selector_all(
+            third_level_selector,
+            """sections => sections.map(section => {
+                const productList = section.querySelector('ul.grid.grid--compactGutter');
+                return {
+                    id: section.getAttribute('id'),
+                    product_count: productList ? productList.querySelectorAll('li.gridItem').length : 0
+                };
+            })""")
         if not sections:
             print("容器内未找到三级类别 sections")
             return []
 
-        # 5. 提取三级类别信息
+        # 4. 一次查询取回与上面顺序一致的 section 元素
+        elements = await page.query_selector_all(third_level_selector)
+
+        # 5. 组装三级类别信息
         third_level_categories = []
-        for section in sections:
-            section_id = await section.get_attribute('id')
+        for section, element in zip(sections, elements):
+            section_id = section['id']
             if not section_id:
                 continue
 
             # 提取类别名称（id 转标题，如 cold-brew → Cold Brew）
             category_name = section_id.replace('-', ' ').title()
 
-            # 提取产品数量（ul 下的 li 数量）
-            product_list = await section.query_selector('ul.grid.grid--compactGutter')
-            product_count = len(await product_list.query_selector_all('li.gridItem')) if product_list else 0
-
             third_level_categories.append({
                 'id': section_id,
                 'name': category_name.strip(),
                 'full_category': f"{second_level_category['name']}/{category_name.strip()}",
-                'product_count': product_count,
-                'element': section
+                'product_count': section['product_count'],
+                'element': element
             })
 
         print(f"在{second_level_category['name']}下找到{len(third_level_categories)}个三级类别")
@@ -108,4 +126,59 @@ async def get_third_level_categories(page: Page, second_level_category):
         error_msg = f"获取三级类别失败: {str(e)}"
         print(error_msg)
         log_error(error_msg)
-        return []
\ No newline at end of file
+        return []
+
+
+# 在页面内提取一个产品网格的所有链接（链接元素按注册表中 product_link 的备选依次尝试），返回纯JSON
+PRODUCT_LINKS_JS = f"""(productList, alternatives) => {{
+    if (!productList) return [];
+    const first = {FIRST_MATCH_JS};
+    return Array.from(productList.querySelectorAll('li.gridItem'), item => {{
+        const [hit, link] = first(item, alternatives);
+        if (!link) return {{hit}};
+        let name = link.getAttribute('data-e2e');
+        if (!name) {{
+            const hiddenSpan = link.querySelector('span.hiddenVisually');
+            name = hiddenSpan ? hiddenSpan.textContent : null;
+        }}
+        return {{href: link.getAttribute('href'), name: name, hit}};
+    }});
+}}"""
+
+
+def _to_product_links(raw_links, category_name, alternatives):
+    """记录链接选择器命中情况，并将页面返回的原始链接记录转换为产品字典"""
+    record_hits('product_link', alternatives, [link['hit'] for link in raw_links])
+    return [{
+        'name': (link['name'] or link['href'].split('/')[-2].replace('-', ' ').title()).strip(),
+        'url': site_url(link['href']),
+        'category': category_name
+    } for link in raw_links if link.get('href')]
+
+
+@traced('get_category_products')
+async def get_category_products(section, category_name):
+    """从三级类别 section 中提取产品链接（名称、URL、所属类别），单次页面内求值"""
+    alternatives = page_alternatives('product_link')
+    raw_links = await section.evaluate(
+        f"(section, alternatives) => ({PRODUCT_LINKS_JS})(section.querySelector('ul.grid.grid--compactGutter'), alternatives)",
+        alternatives)
+    return _to_product_links(raw_links, category_name, alternatives)
+
+
+@traced('get_all_category_products')
+async def get_all_category_products(page: Page, third_level_categories):
+    """一次页面内求值提取所有三级类别的产品链接，返回 {section id: 产品列表}"""
+    alternatives = page_alternatives('product_link')
+    raw = await page.evaluate(
+        f"""([ids, alternatives]) => {{
+            const extract = {PRODUCT_LINKS_JS};
+            const result = {{}};
+            for (const id of ids) {{
+                const section = document.querySelector(`div.baseMenu___UpTAi section[id="${{id}}"]`);
+                result[id] = section ? extract(section.querySelector('ul.grid.grid--compactGutter'), alternatives) : [];
+            }}
+            return result;
+        }}""", [[c['id'] for c in third_level_categories], alternatives])
+    return {c['id']: _to_product_links(raw.get(c['id'], []), c['full_category'], alternatives)
+            for c in third_level_categories}
\ No newline at end of file
@@ -0,0 +1,211 @@
+from playwright.async_api import Page
+from utils import log_error
+from page_handler import open_main_menu
+from waits import wait_for_grid_ready
+from rate_controller import throttle
+from network_capture import product_key
+from category_parser import (get_main_categories, get_second_level_categories, get_third_level_categories,
+                             get_category_products, get_all_category_products)
+
+
+async def build_category_tree(page: Page, main_category_name, second_category_name):
+    """遍历一次菜单页，构建类别树索引
+
+    索引中只保存稳定的定位信息（主类别 section id、二级类别 data-e2e 名称、三级类别 section id、产品href），
+    不保存会失效的 ElementHandle；所有三级类别的产品链接在这一次遍历中全部收集完成
+    """
+    if not await open_main_menu(page):
+        return None
+
+    main_categories = await get_main_categories(page)
+    if not main_categories:
+        print("未找到任何主类别")
+        return None
+
+    main_category = next((c for c in main_categories if c['name'] == main_category_name), None)
+    if not main_category:
+        print(f"未找到主类别: {main_category_name}")
+        print(f"可用主类别: {[c['name'] for c in main_categories]}")
+        return None
+    print(f"找到目标主类别: {main_category['name']}")
+
+    second_level_categories = await get_second_level_categories(page, main_category)
+    second_category = next((c for c in second_level_categories if c['name'] == second_category_name), None)
+    if not second_category:
+        print(f"在{main_category['name']}下未找到二级类别: {second_category_name}")
+        print(f"可用的二级类别: {[c['name'] for c in second_level_categories]}")
+        return None
+    print(f"找到目标二级类别: {second_category['name']}")
+
+    tree = {
+        'main': {'id': main_category['id'], 'name': main_category['name']},
+        'second': {'name': second_category['name']},
+        'categories': []
+    }
+    if not await collect_branch(page, tree, second_category):
+        return None
+    return tree
+
+
+async def collect_branch(page: Page, tree, second_category) -> bool:
+    """点击二级类别，收集其下所有三级类别及产品链接到 tree['categories']"""
+    third_level_categories = await get_third_level_categories(page, second_category)
+    if not third_level_categories:
+        print(f"在{second_category['name']}下未找到三级类别")
+        return False
+
+    products_by_id = await get_all_category_products(page, third_level_categories)
+    for category in third_level_categories:
+        products = products_by_id[category['id']]
+        tree['categories'].append({
+            'id': category['id'],
+            'name': category['name'],
+            'full_category': category['full_category'],
+            'product_count': category['product_count'],
+            'products': products
+        })
+
+    # 懒加载导致链接不完整的类别：重新定位后补采
+    for category in tree['categories']:
+        if len(category['products']) < category['product_count']:
+            await refresh_category_products(page, tree, category)
+    return True
+
+
+async def build_full_menu_tree(page: Page):
+    """全菜单模式：遍历所有主类别、二级类别和三级类别，返回每个二级类别分支的类别树列表"""
+    if not await open_main_menu(page):
+        return []
+    main_categories = await get_main_categories(page)
+
+    # 先在同一页面上记录所有二级类别的稳定名称，再逐个导航采集
+    trees = []
+    for main_category in main_categories:
+        for second_category in await get_second_level_categories(page, main_category):
+            trees.append({
+                'main': {'id': main_category['id'], 'name': main_category['name']},
+                'second': {'name': second_category['name']},
+                'categories': []
+            })
+
+    branches = []
+    for tree in trees:
+        try:
+            tile = await resolve_second_level_element(page, tree)
+            if not tile:
+                log_error(f"未找到二级类别: {tree['main']['name']}/{tree['second']['name']}")
+                continue
+            if await collect_branch(page, tree, {'name': tree['second']['name'], 'element': tile}):
+                branches.append(tree)
+        except Exception as e:
+            log_error(f"采集分支 {tree['main']['name']}/{tree['second']['name']} 失败: {str(e)}")
+    return branches
+
+
+def dedupe_categories(branches):
+    """合并所有分支的三级类别，跨类别去重产品
+
+    每个产品（按 product_key，忽略各类别不同的 ?parent=）只保留在其第一次出现的类别中，
+    'category' 字段记录全部所属类别（以 " | " 分隔）；类别 id 加上主/二级前缀，保证不同分支下同名 section 不冲突
+    """
+    memberships = {}
+    for tree in branches:
+        for category in tree['categories']:
+            for product in category['products']:
+                names = memberships.setdefault(product_key(product), [])
+                if product['category'] not in names:
+                    names.append(product['category'])
+
+    categories = []
+    seen = set()
+    for tree in branches:
+        for category in tree['categories']:
+            products = []
+            for product in category['products']:
+                key = product_key(product)
+                if key in seen:
+                    continue
+                seen.add(key)
+                products.append(dict(product, category=" | ".join(memberships[key])))
+            categories.append(dict(category,
+                                   id=f"{tree['main']['id']}/{tree['second']['name']}/{category['id']}",
+                                   product_count=len(products),
+                                   products=products))
+    return categories
+
+
+def dedupe_products(products):
+    """产品前沿按 product_key 去重，保留首次出现"""
+    unique = {}
+    for product in products:
+        unique.setdefault(product_key(product), product)
+    return list(unique.values())
+
+
+def print_crawl_plan(branches):
+    """打印爬取计划：每个分支下各三级类别的产品数及去重后的总数"""
+    print("\n===== 爬取计划 =====")
+    total = 0
+    unique_urls = set()
+    for tree in branches:
+        branch_total = sum(len(c['products']) for c in tree['categories'])
+        total += branch_total
+        print(f"{tree['main']['name']} / {tree['second']['name']}: {branch_total} 个产品")
+        for category in tree['categories']:
+            print(f"    {category['name']}: {len(category['products'])}")
+            unique_urls.update(p['url'] for p in category['products'])
+    print(f"合计 {total} 个产品条目，去重后 {len(unique_urls)} 个产品")
+
+
+async def resolve_second_level_element(page: Page, tree):
+    """根据主类别 id 和二级类别名称定位二级类别元素，当前页面找不到时回到主菜单再找"""
+    selector = f'section#{tree["main"]["id"]} li[data-e2e="tile"] div[data-e2e="{tree["second"]["name"]}"]'
+    tile = await page.query_selector(selector)
+    if tile:
+        return tile
+    if not await open_main_menu(page):
+        return None
+    return await page.query_selector(selector)
+
+
+async def navigate_to_second_category(page: Page, tree) -> bool:
+    """完整重新导航：回到主菜单并点击二级类别（仅作为兜底）"""
+    if not await open_main_menu(page):
+        return False
+    tile = await resolve_second_level_element(page, tree)
+    if not tile:
+        log_error(f"重新导航失败：未找到二级类别 {tree['second']['name']}")
+        return False
+    async with throttle(page):
+        await tile.click()
+    await page.wait_for_selector('div.baseMenu___UpTAi', timeout=30000)
+    return True
+
+
+async def resolve_category_element(page: Page, tree, category_id):
+    """根据 section id 重新解析三级类别元素
+
+    先在当前页面直接查询（廉价），找不到时才完整重新导航
+    """
+    section = await page.query_selector(f'div.baseMenu___UpTAi section#{category_id}')
+    if section:
+        return section
+    if not await navigate_to_second_category(page, tree):
+        return None
+    return await page.query_selector(f'div.baseMenu___UpTAi section#{category_id}')
+
+
+async def refresh_category_products(page: Page, tree, category):
+    """滚动到类别位置等待懒加载后，重新收集该类别的产品链接"""
+    try:
+        section = await resolve_category_element(page, tree, category['id'])
+        if not section:
+            log_error(f"无法重新定位三级类别: {category['id']}")
+            return
+        await section.scroll_into_view_if_needed()
+        await wait_for_grid_ready(page, category['id'])
+        products = await get_category_products(section, category['full_category'])
+        if len(products) > len(category['products']):
+            category['products'] = products
+    except Exception as e:
+        log_error(f"补采类别 {category['id']} 产品失败: {str(e)}")
\ No newline at end of file
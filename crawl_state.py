@@ -0,0 +1,172 @@
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    full_category TEXT,
+    position INTEGER,
+    status TEXT DEFAULT 'pending',
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS products (
+    url TEXT PRIMARY KEY,
+    name TEXT,
+    category TEXT,
+    category_id TEXT,
+    position INTEGER,
+    status TEXT DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    failure_reason TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS rows (
+    url TEXT,
+    size TEXT,
+    category TEXT,
+    product_name TEXT,
+    calories TEXT,
+    price TEXT,
+    PRIMARY KEY (url, size)
+);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    url TEXT PRIMARY KEY,
+    name TEXT,
+    category TEXT,
+    phase TEXT,
+    error_class TEXT,
+    message TEXT,
+    kind TEXT,
+    attempts INTEGER,
+    updated_at REAL
+);
+"""
+
+
+class CrawlState:
+    """本地SQLite爬取状态：类别前沿、已发现的产品URL、已完成的 (产品, 规格) 行以及每个URL的失败原因"""
+
+    def __init__(self, path='crawl_state.db'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def reset(self, target):
+        """清空所有状态（--fresh），并记录本次爬取目标"""
+        with self.conn:
+            for table in ('meta', 'categories', 'products', 'rows', 'dead_letters'):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('target', ?)", (target,))
+
+    def target(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'target'").fetchone()
+        return row['value'] if row else None
+
+    def save_categories(self, categories):
+        """记录类别前沿及每个类别下发现的产品（已存在的记录保持原状态）"""
+        now = time.time()
+        with self.conn:
+            for position, category in enumerate(categories):
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO categories (id, name, full_category, position, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (category['id'], category['name'], category['full_category'], position, now))
+                for product_position, product in enumerate(category['products']):
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO products (url, name, category, category_id, position, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (product['url'], product['name'], product['category'], category['id'], product_position, now))
+
+    def load_categories(self):
+        """从状态库恢复类别前沿（含产品列表），结构与类别树中的类别一致"""
+        categories = []
+        for row in self.conn.execute("SELECT * FROM categories ORDER BY position"):
+            products = [{'name': p['name'], 'url': p['url'], 'category': p['category']} for p in self.conn.execute(
+                "SELECT name, url, category FROM products WHERE category_id = ? ORDER BY position", (row['id'],))]
+            categories.append({
+                'id': row['id'],
+                'name': row['name'],
+                'full_category': row['full_category'],
+                'product_count': len(products),
+                'products': products
+            })
+        return categories
+
+    def is_done(self, url):
+        row = self.conn.execute("SELECT status FROM products WHERE url = ?", (url,)).fetchone()
+        return row is not None and row['status'] == 'done'
+
+    def pending_products(self, products):
+        """过滤出尚未完成的产品"""
+        return [p for p in products if not self.is_done(p['url'])]
+
+    def mark_product_done(self, url, rows):
+        """在同一事务中写入产品的全部规格行并标记完成（同时移出失败队列）"""
+        with self.conn:
+            self.conn.execute("DELETE FROM rows WHERE url = ?", (url,))
+            self.conn.execute("DELETE FROM dead_letters WHERE url = ?", (url,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rows (url, size, category, product_name, calories, price) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(url, r['size'], r['category'], r['product_name'], r['calories'], r['price']) for r in rows])
+            self.conn.execute(
+                "UPDATE products SET status = 'done', attempts = attempts + 1, failure_reason = NULL, updated_at = ? "
+                "WHERE url = ?", (time.time(), url))
+
+    def mark_product_failed(self, url, reason, product=None, phase=None, error_class=None, kind='transient'):
+        """标记失败，并在失败队列中记录结构化信息（阶段、异常类型、暂时性/永久性、尝试次数）"""
+        now = time.time()
+        product = product or {}
+        with self.conn:
+            self.conn.execute(
+                "UPDATE products SET status = 'failed', attempts = attempts + 1, failure_reason = ?, updated_at = ? "
+                "WHERE url = ?", (reason, now, url))
+            self.conn.execute(
+                "INSERT INTO dead_letters (url, name, category, phase, error_class, message, kind, attempts, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE((SELECT attempts FROM products WHERE url = ?), 1), ?) "
+                "ON CONFLICT (url) DO UPDATE SET phase = excluded.phase, error_class = excluded.error_class, "
+                "message = excluded.message, kind = excluded.kind, attempts = excluded.attempts, "
+                "updated_at = excluded.updated_at",
+                (url, product.get('name'), product.get('category'), phase, error_class, reason, kind, url, now))
+
+    def mark_category_done(self, category_id):
+        """类别下所有产品都完成时标记类别完成"""
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS n FROM products WHERE category_id = ? AND status != 'done'", (category_id,)).fetchone()
+        if row['n'] == 0:
+            with self.conn:
+                self.conn.execute("UPDATE categories SET status = 'done', updated_at = ? WHERE id = ?",
+                                  (time.time(), category_id))
+
+    def dead_letters(self, kind=None, below_attempts=None):
+        """失败队列中的条目，可按类型和尝试次数上限筛选"""
+        query = "SELECT * FROM dead_letters WHERE 1 = 1"
+        params = []
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        if below_attempts:
+            query += " AND attempts < ?"
+            params.append(below_attempts)
+        return [dict(row) for row in self.conn.execute(query + " ORDER BY updated_at", params)]
+
+    def summary(self):
+        counts = {row['status']: row['n'] for row in self.conn.execute(
+            "SELECT status, COUNT(*) AS n FROM products GROUP BY status")}
+        return counts
+
+    def completed_rows(self):
+        """按类别和产品顺序返回所有已完成的行（恢复时用于重建输出，保证不重复、不缺失）"""
+        for row in self.conn.execute(
+                "SELECT r.* FROM rows r JOIN products p ON p.url = r.url "
+                "JOIN categories c ON c.id = p.category_id ORDER BY c.position, p.position, r.rowid"):
+            yield dict(row)
\ No newline at end of file
@@ -0,0 +1,78 @@
+import asyncio
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+from utils import log_error
+
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# Playwright 报错中表示网络/导航层面问题的片段（重试可能成功）
+TRANSIENT_MESSAGES = ('net::', 'ERR_', 'Navigation', 'navigation', 'Target closed', 'has been closed',
+                      'Execution context was destroyed')
+
+
+class SelectorMissingError(Exception):
+    """页面已加载但缺少依赖的元素（页面结构变化或产品页异常），重试无意义"""
+
+
+class EmptyResultError(Exception):
+    """页面流程走完但没有提取到任何规格（多为购物车未及时渲染）"""
+
+
+def classify_failure(error):
+    """暂时性：超时、导航/网络错误、空结果；永久性：缺少元素及其他未知异常"""
+    if isinstance(error, SelectorMissingError):
+        return PERMANENT
+    if isinstance(error, (PlaywrightTimeoutError, EmptyResultError, asyncio.TimeoutError, ConnectionError)):
+        return TRANSIENT
+    if isinstance(error, PlaywrightError) and any(m in str(error) for m in TRANSIENT_MESSAGES):
+        return TRANSIENT
+    return PERMANENT
+
+
+def record_failure(state, product, error, phase):
+    """记录一次产品失败：结构化写入日志，并在状态库的失败队列中登记"""
+    kind = classify_failure(error)
+    error_class = type(error).__name__
+    log_error(f"产品{product['name']}爬取失败（{kind}）: {error_class}: {str(error)} | URL: {product['url']}",
+              phase=phase, url=product['url'], error_class=error_class, kind=kind)
+    if state:
+        state.mark_product_failed(product['url'], f"{error_class}: {str(error)}", product=product,
+                                  phase=phase, error_class=error_class, kind=kind)
+
+
+def dead_letter_category(entries, name):
+    """把失败队列条目组装成一个可直接交给 scrape_products_in_category 的类别"""
+    return {
+        'id': 'dead-letter',
+        'full_category': name,
+        'products': [{'name': e['name'], 'url': e['url'], 'category': e['category']} for e in entries]
+    }
+
+
+async def retry_transient_failures(state, scrape_category, max_attempts=3, base_delay=5.0):
+    """运行末尾按指数退避重试暂时性失败（每个产品最多尝试 max_attempts 次）
+
+    scrape_category 为接收类别字典的协程函数（由调用方绑定页面、输出和并发设置）
+    """
+    for retry_round in range(1, max_attempts):
+        entries = state.dead_letters(kind=TRANSIENT, below_attempts=max_attempts)
+        if not entries:
+            break
+        delay = base_delay * 2 ** (retry_round - 1)
+        print(f"\n{len(entries)} 个产品暂时性失败，{delay:.0f}s 后开始第{retry_round}轮重试")
+        await asyncio.sleep(delay)
+        await scrape_category(dead_letter_category(entries, f"失败重试第{retry_round}轮"))
+    print_dead_letter_summary(state)
+
+
+def print_dead_letter_summary(state):
+    entries = state.dead_letters()
+    if not entries:
+        return
+    counts = {}
+    for entry in entries:
+        key = (entry['kind'], entry['phase'], entry['error_class'])
+        counts[key] = counts.get(key, 0) + 1
+    print(f"\n===== 失败队列: {len(entries)} 个产品（可用 --retry-failed 单独重爬） =====")
+    for (kind, phase, error_class), count in sorted(counts.items(), key=lambda x: -x[1]):
+        print(f"{kind} / {phase} / {error_class}: {count}")
\ No newline at end of file
@@ -0,0 +1,121 @@
+import json
+import re
+from utils import log_error
+from page_handler import USER_AGENT
+from network_capture import find_product_node, node_size_records
+from rate_controller import throttle
+
+try:
+    import aiohttp
+except ImportError:  # 快速路径为可选功能，未安装 aiohttp 时只走 Playwright
+    aiohttp = None
+
+# 服务端渲染页面中嵌入的状态：<script id="__NEXT_DATA__"> 或 window.__XXX_STATE__ = {...}
+NEXT_DATA_RE = re.compile(r'<script[^>]+id="__NEXT_DATA__"[^>]*>(.*?)</script>', re.S)
+STATE_ASSIGN_RE = re.compile(r'window\.__(?:INITIAL_STATE|PRELOADED_STATE|BOOTSTRAP|APOLLO_STATE)__\s*=\s*')
+SOLD_OUT_RE = re.compile(r'"(?:isSoldOut|soldOut|outOfStock)"\s*:\s*true|"availability"\s*:\s*"(?:SoldOut|OutOfStock|UNAVAILABLE)"', re.I)
+
+
+def extract_embedded_states(html):
+    """提取页面中所有嵌入的JSON状态"""
+    states = []
+    for match in NEXT_DATA_RE.finditer(html):
+        try:
+            states.append(json.loads(match.group(1)))
+        except ValueError:
+            continue
+    decoder = json.JSONDecoder()
+    for match in STATE_ASSIGN_RE.finditer(html):
+        try:
+            state, _ = decoder.raw_decode(html, match.end())
+            states.append(state)
+        except ValueError:
+            continue
+    return states
+
+
+def node_sold_out(node):
+    """产品节点自身的售罄标记（只看节点上的标量字段，不看推荐等嵌套产品）"""
+    fields = {key: value for key, value in node.items() if not isinstance(value, (dict, list))}
+    return bool(SOLD_OUT_RE.search(json.dumps(fields)))
+
+
+def parse_product_page(html, product, require_price=True):
+    """把产品页嵌入状态解析为与 get_product_sizes / get_sold_out_product_sizes 相同的行字典
+
+    只取当前产品节点（按编号/名称/slug匹配）的规格列表和售罄标记，推荐等其他产品不参与；
+    无法完整提取（找不到产品节点、无规格，或要求价格但缺价格）时返回空列表
+    """
+    records = {}
+    sold_out = False
+    for state in extract_embedded_states(html):
+        node = find_product_node(state, product)
+        if node is None:
+            continue
+        sold_out = sold_out or node_sold_out(node)
+        for size_name, record in node_size_records(node).items():
+            target = records.setdefault(size_name, {'price': None, 'calories': None})
+            for field in ('price', 'calories'):
+                if target[field] is None:
+                    target[field] = record[field]
+    if not records:
+        return []
+
+    if not sold_out and require_price and any(r['price'] is None for r in records.values()):
+        return []
+    return [{
+        "category": product['category'],
+        "product_name": product['name'],
+        "size": size_name,
+        "calories": record['calories'] or "N/A",
+        "price": "soldout" if sold_out else (record['price'] or "N/A"),
+        "url": product['url']
+    } for size_name, record in records.items()]
+
+
+class FastPathClient:
+    """无浏览器快速路径：使用保持连接的 HTTP 连接池抓取产品页并解析嵌入状态"""
+
+    def __init__(self, pool_size=10, timeout=20, require_price=True):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.require_price = require_price
+        self.session = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def available(self):
+        return aiohttp is not None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'User-Agent': USER_AGENT, 'Accept': 'text/html,application/xhtml+xml'})
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def scrape_product(self, product):
+        """抓取并解析单个产品，失败时返回空列表（由调用方回退到 Playwright）
+
+        请求与浏览器导航共用调度器：先取得令牌桶许可，状态码和超时反馈给 AIMD 调整
+        """
+        try:
+            async with throttle(product['url']) as gate:
+                async with self.session.get(product['url']) as response:
+                    gate.status = response.status
+                    html = await response.text() if response.status == 200 else None
+            rows = parse_product_page(html, product, self.require_price) if html else []
+        except Exception as e:
+            log_error(f"快速路径抓取失败: {str(e)} | URL: {product['url']}")
+            rows = []
+        if rows:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return rows
\ No newline at end of file
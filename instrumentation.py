@@ -0,0 +1,189 @@
+import functools
+import json
+import os
+import time
+from collections import defaultdict
+from utils import current_context
+
+
+class Tracer:
+    """收集各阶段耗时；关闭时 span() 返回共享的空操作对象，开销可忽略"""
+
+    def __init__(self):
+        self.enabled = False
+        self.keep_samples = False
+        self.durations = defaultdict(list)
+        self.samples = []
+        self.products = 0
+        self.started_at = time.perf_counter()
+
+    def enable(self, keep_samples=False):
+        self.enabled = True
+        self.keep_samples = keep_samples
+        self.durations.clear()
+        self.samples = []
+        self.products = 0
+        self.started_at = time.perf_counter()
+
+    def record(self, phase, duration, tags):
+        self.durations[phase].append(duration)
+        if self.keep_samples:
+            self.samples.append({'phase': phase, 'duration': duration, **tags})
+
+
+tracer = Tracer()
+
+
+def configure_instrumentation(enabled, keep_samples=False):
+    """开启阶段计时；keep_samples 为 True 时在导出的JSON中保留每次计时的产品、类别标签"""
+    if enabled:
+        tracer.enable(keep_samples)
+    else:
+        tracer.enabled = False
+
+
+class _Span:
+    __slots__ = ('phase', 'tags', 'started')
+
+    def __init__(self, phase, tags):
+        self.phase = phase
+        self.tags = tags
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        tracer.record(self.phase, time.perf_counter() - self.started, self.tags)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(phase, **tags):
+    """计时一个阶段，可用于 with / async with；标签会合并当前任务绑定的日志上下文（产品、类别）"""
+    if not tracer.enabled:
+        return _NOOP
+    return _Span(phase, {**current_context(), **tags})
+
+
+def traced(phase):
+    """异步函数装饰器：整个函数调用计为一个阶段"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return await func(*args, **kwargs)
+            with span(phase):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_product(count=1):
+    if tracer.enabled:
+        tracer.products += count
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def timing_report():
+    """每个阶段的 p50/p95/max 以及每分钟产品数"""
+    elapsed = time.perf_counter() - tracer.started_at
+    phases = {}
+    for phase, values in tracer.durations.items():
+        phases[phase] = {
+            'count': len(values),
+            'sum_s': round(sum(values), 3),
+            'p50_s': round(_percentile(values, 0.5), 3),
+            'p95_s': round(_percentile(values, 0.95), 3),
+            'max_s': round(max(values), 3),
+        }
+    return {
+        'elapsed_s': round(elapsed, 1),
+        'products': tracer.products,
+        'products_per_minute': round(tracer.products / elapsed * 60, 2) if elapsed > 0 else 0,
+        'phases': phases,
+    }
+
+
+def _atomic_write(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def export_json(path, report=None):
+    report = report or timing_report()
+    if tracer.keep_samples:
+        report = dict(report, samples=tracer.samples)
+    _atomic_write(path, json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def export_prometheus(path, report=None, gauges=None):
+    """导出 Prometheus textfile 格式（node_exporter textfile collector 可直接读取）
+
+    gauges 为其他模块提供的额外指标 {名称: 值}，以 scraper_ 前缀导出
+    """
+    report = report or timing_report()
+    lines = [
+        '# HELP scraper_phase_duration_seconds Duration of scraper phases.',
+        '# TYPE scraper_phase_duration_seconds summary',
+    ]
+    for phase, stats in sorted(report['phases'].items()):
+        lines.append(f'scraper_phase_duration_seconds{{phase="{phase}",quantile="0.5"}} {stats["p50_s"]}')
+        lines.append(f'scraper_phase_duration_seconds{{phase="{phase}",quantile="0.95"}} {stats["p95_s"]}')
+        lines.append(f'scraper_phase_duration_seconds_sum{{phase="{phase}"}} {stats["sum_s"]}')
+        lines.append(f'scraper_phase_duration_seconds_count{{phase="{phase}"}} {stats["count"]}')
+    lines.append('# HELP scraper_phase_duration_max_seconds Slowest observation per phase.')
+    lines.append('# TYPE scraper_phase_duration_max_seconds gauge')
+    for phase, stats in sorted(report['phases'].items()):
+        lines.append(f'scraper_phase_duration_max_seconds{{phase="{phase}"}} {stats["max_s"]}')
+    lines.append('# HELP scraper_products_per_minute Products scraped per minute over the run.')
+    lines.append('# TYPE scraper_products_per_minute gauge')
+    lines.append(f'scraper_products_per_minute {report["products_per_minute"]}')
+    lines.append('# HELP scraper_products_total Products scraped in the run.')
+    lines.append('# TYPE scraper_products_total counter')
+    lines.append(f'scraper_products_total {report["products"]}')
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f'# TYPE scraper_{name} gauge')
+        lines.append(f'scraper_{name} {value}')
+    _atomic_write(path, '\n'.join(lines) + '\n')
+
+
+def print_timing_report(report=None):
+    report = report or timing_report()
+    if not report['phases']:
+        return
+    print("\n===== 阶段耗时统计 =====")
+    print(f"产品数: {report['products']} 用时: {report['elapsed_s']}s 每分钟产品数: {report['products_per_minute']}")
+    for phase, stats in sorted(report['phases'].items(), key=lambda x: -x[1]['sum_s']):
+        print(f"{phase}: 次数={stats['count']} p50={stats['p50_s']}s p95={stats['p95_s']}s max={stats['max_s']}s")
\ No newline at end of file
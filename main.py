@@ -1,13 +1,61 @@
+import argparse
 import asyncio
-import csv
-import time
 import re
+import time
 from playwright.async_api import async_playwright
 from tqdm import tqdm
-from utils import log_error
-from page_handler import open_main_menu, init_browser_context
-from category_parser import get_main_categories, get_second_level_categories, get_third_level_categories
-from product_scraper import scrape_products_in_category
+from utils import log_error, configure_logging, shutdown_logging, bind_context, capture_screenshot, flush_screenshots
+from page_handler import launch_browser, new_browser_context, DEFAULT_STORE
+from category_tree import build_category_tree, build_full_menu_tree, dedupe_categories, print_crawl_plan
+from crawl_state import CrawlState
+from dead_letter import dead_letter_category, retry_transient_failures, print_dead_letter_summary
+from output_writer import OutputWriter, build_sinks
+from price_history import PriceHistory, HistorySink, print_history_report
+from waits import print_wait_report
+from request_router import print_routing_report
+from rate_controller import print_rate_report
+from size_snapshot import print_size_report
+from selector_registry import print_selector_report
+from product_scraper import scrape_products_in_category, FIELDNAMES
+from fast_path import FastPathClient
+from page_pool import PagePool, print_pool_report, session_state_path, existing_state
+from run_setup import configure_run, export_timings
+from sharded_crawler import load_url_list, discover_frontier, run_sharded_crawl
+from store_matrix import parse_store_list, run_store_matrix
+
+
+DEFAULT_CONFIG = {
+    'main_category': 'Drinks',  # 主类别名称
+    'second_category': 'Cold Coffee',  # 二级类别名称
+    'third_category': None,
+    'csv_filename': 'Cold Coffee',
+    'concurrency': 3,  # 并发爬取产品的worker数（每个worker使用独立上下文和购物车）
+    'price_mode': 'cart',  # 价格提取方式：cart=加购后读购物车，network=读取接口响应（失败回退cart）
+    'jitter_ms': (0, 0),  # 模拟人工操作的随机停顿区间（毫秒），(0, 0) 表示关闭
+    'routing_profile': 'balanced',  # 请求拦截策略：aggressive / balanced / safe / off
+    'cart_batch_size': 1,  # cart模式下每次合并加购并读取一次购物车的产品数K（1表示逐个产品）
+    'state_db': 'crawl_state.db',  # 断点续爬状态库
+    'output_sinks': ['csv'],  # 输出目标：csv / jsonl / sqlite / parquet（可多选）
+    'fast_path': False,  # 先用HTTP直接抓取产品页嵌入状态（需安装 aiohttp），提取失败再回退 Playwright
+    'timing': False,  # 记录各阶段耗时，结束时输出 p50/p95/max 报告（JSON + Prometheus textfile）
+    'timing_samples': False,  # 在JSON报告中保留每次计时及其产品、类别标签
+    'base_url': None,  # 站点根地址，None 使用默认（或环境变量 STARBUCKS_BASE_URL），可指向本地测试站点
+    'headless': False,  # 无头模式运行浏览器
+    'page_max_uses': 50,  # 池中每个标签页最多复用的次数，之后关闭重开
+    'page_memory_limit_mb': 300,  # 标签页JS堆超过该值（MB）时回收，0 表示不按内存回收
+    'session_dir': 'session_state',  # 保存各上下文 storage_state（Cookie、门店选择）供下次热启动，None 表示不保存
+    'screenshot_interval_s': 30,  # 两次错误截图的最小间隔（秒）
+    'screenshot_max': 20,  # 每次运行最多保存的错误截图数，0 表示不截图
+    'rate_control': True,  # 所有导航和点击经过自适应调度（每主机令牌桶 + AIMD 并发上限）
+    'rate_initial': 4.0,  # 每个主机的初始速率（次/秒），之后按响应延迟和错误自动调整
+    'rate_max': 20.0,  # 每个主机的速率上限（次/秒）
+    'retry_max_attempts': 3,  # 暂时性失败（超时、导航错误）每个产品最多尝试的次数，运行末尾统一重试
+    'retry_base_delay_s': 5.0,  # 重试轮次的初始退避时间（秒），之后每轮翻倍
+    'size_snapshot': True,  # 一次读取页面水合状态/data属性中的所有规格卡路里，只对按需渲染的规格切换读取
+    'size_snapshot_verify': False,  # 每个规格仍切换读取并与快照核对，不一致时写入日志（用于验证快照路径）
+    'history_db': None,  # 版本化价格历史库路径（如 price_history.db），每次运行只写入变化的行并导出变化文件
+    'skip_unchanged': False  # 产品页内容指纹与上次运行一致时不再加购读价，直接沿用历史库中的当前版本
+}
 
 
 def sanitize_filename(name):
@@ -15,161 +63,211 @@ def sanitize_filename(name):
     return re.sub(r'[\\/*?:"<>|]', '_', name).strip()
 
 
-async def main_scraper():
-    config = {
-        'main_category': 'Drinks',  # 主类别名称
-        'second_category': 'Cold Coffee',  # 二级类别名称
-        'third_category': None,
-        'csv_filename': 'Cold Coffee'
-    }
-
-    # 生成合法的CSV文件名
+def get_output_name(config, full_menu=False):
+    """生成合法的输出文件名（不含扩展名，各输出目标自行添加）"""
+    if full_menu:
+        return "starbucks_full_menu"
     if config['csv_filename']:
-        csv_filename = sanitize_filename(config['csv_filename']) + '.csv'
+        return sanitize_filename(config['csv_filename'])
+    return f"starbucks_{sanitize_filename(config['second_category'])}"
+
+
+async def main_scraper(resume=False, full_menu=False, config=None, retry_failed=False):
+    """retry_failed=True 时只重爬状态库失败队列中的产品，并与上次已完成的行合并输出"""
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    output_name = get_output_name(config, full_menu)
+
+    configure_run(config)
+
+    # 初始化状态库：续爬时沿用同一目标的状态，否则从零开始
+    state = CrawlState(config['state_db'])
+    if full_menu:
+        target = "*"
     else:
-        csv_filename = f"starbucks_{sanitize_filename(config['second_category'])}.csv"
+        target = f"{config['main_category']}/{config['second_category']}/{config['third_category'] or '*'}"
+    if retry_failed:
+        # 沿用上次运行的状态库（目标以状态库为准）
+        resume = True
+    elif resume and state.target() != target:
+        print(f"状态库中的爬取目标与当前配置不一致（{state.target()}），改为全新爬取")
+        resume = False
+    if not resume:
+        state.reset(target)
+
+    # 初始化输出和日志：续爬时用已完成的行重建输出，保证不重复
+    sinks = build_sinks(config['output_sinks'], output_name, FIELDNAMES)
+    history_sink = None
+    if config['history_db']:
+        history = PriceHistory(config['history_db'], store=DEFAULT_STORE, skip_unchanged=config['skip_unchanged'])
+        history_sink = HistorySink(history, delta_path=f"{output_name}_delta_{time.strftime('%Y%m%d_%H%M%S')}.csv")
+        sinks.append(history_sink)
+    writer = OutputWriter(sinks)
+    await writer.start(fresh=True)
+    if resume:
+        await writer.write(list(state.completed_rows()))
+        print(f"续爬模式，已完成产品状态: {state.summary()}")
+    # 续爬时接着写同一个日志文件，否则把上次的日志轮转为备份
+    configure_logging(fresh=not resume)
 
-    # 初始化CSV和日志
-    fieldnames = ['category', 'product_name', 'size', 'calories', 'price', 'url']
-    with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-    with open('scrape_error_log.txt', 'w', encoding='utf-8') as f:
-        f.write("===== 爬取错误日志 =====\n")
+    # 无浏览器快速路径（可选）
+    fast_path = None
+    if config['fast_path']:
+        fast_path = FastPathClient(pool_size=config['concurrency'] * 2)
+        if fast_path.available:
+            await fast_path.start()
+        else:
+            print("未安装 aiohttp，快速路径已关闭")
+            fast_path = None
 
     async with async_playwright() as p:
         # 初始化浏览器
-        browser = await p.chromium.launch(
-            headless=False,
-            args=["--disable-blink-features=AutomationControlled", "--no-sandbox"]
-        )
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            viewport={"width": 1366, "height": 768}
-        )
-        await init_browser_context(context)
+        browser = await launch_browser(p, headless=config['headless'])
+        main_state_path = session_state_path(config['session_dir'], 'main')
+        context = await new_browser_context(browser, storage_state=existing_state(main_state_path))
         page = await context.new_page()
+        pool = await PagePool(browser, config['concurrency'], max_uses=config['page_max_uses'],
+                              memory_limit_mb=config['page_memory_limit_mb'],
+                              state_dir=config['session_dir'])
 
         try:
-            # 1. 打开主菜单
-            if not await open_main_menu(page):
-                print("无法进入主菜单，终止爬取")
-                return
-
-            # 2. 获取主类别
-            main_categories = await get_main_categories(page)
-            if not main_categories:
-                print("未找到任何主类别")
-                return
-
-            # 3. 查找目标主类别
-            target_main_category = next((c for c in main_categories if c['name'] == config['main_category']), None)
-            if not target_main_category:
-                print(f"未找到主类别: {config['main_category']}")
-                print(f"可用主类别: {[c['name'] for c in main_categories]}")
-                return
-            print(f"找到目标主类别: {target_main_category['name']}")
-
-            # 4. 获取二级类别并查找目标二级类别
-            second_level_categories = await get_second_level_categories(page, target_main_category)
-            target_second_category = next(
-                (c for c in second_level_categories if c['name'] == config['second_category']), None)
-            if not target_second_category:
-                print(f"在{target_main_category['name']}下未找到二级类别: {config['second_category']}")
-                print(f"可用的二级类别: {[c['name'] for c in second_level_categories]}")
-                return
-            print(f"找到目标二级类别: {target_second_category['name']}")
-
-            # 5. 获取并筛选三级类别
-            third_level_categories = await get_third_level_categories(page, target_second_category)
-            if not third_level_categories:
-                print(f"在{target_second_category['name']}下未找到三级类别")
-                return
+            # 每个池槽位启动时先打开一次门店菜单页，加购价格才带门店
+            await pool.start()
+            # 1. 续爬时直接从状态库恢复类别前沿；否则遍历一次菜单页，构建类别树索引（包含所有三级类别的产品链接）
+            bind_context(phase='catalog')
+            third_level_categories = state.load_categories() if resume else []
+            if retry_failed:
+                entries = state.dead_letters()
+                if not entries:
+                    print("失败队列为空，无需重爬")
+                    return
+                third_level_categories = [dead_letter_category(entries, "失败队列重爬")]
+            elif not third_level_categories and full_menu:
+                # 全菜单模式：遍历所有分支，打印计划后跨类别去重
+                branches = await build_full_menu_tree(page)
+                if not branches:
+                    print("构建全菜单类别树失败，终止爬取")
+                    return
+                print_crawl_plan(branches)
+                third_level_categories = dedupe_categories(branches)
+                state.save_categories(third_level_categories)
+            elif not third_level_categories:
+                tree = await build_category_tree(page, config['main_category'], config['second_category'])
+                if not tree:
+                    print("构建类别树失败，终止爬取")
+                    return
+                third_level_categories = tree['categories']
+                state.save_categories(third_level_categories)
 
-            # 如果指定了三级类别，则筛选
-            if config['third_category']:
+            # 2. 如果指定了三级类别，则筛选
+            if config['third_category'] and not full_menu and not retry_failed:
                 target_third_categories = [c for c in third_level_categories if config['third_category'] in c['name']]
                 if not target_third_categories:
-                    print(f"在{target_second_category['name']}下未找到包含'{config['third_category']}'的三级类别")
+                    print(f"在{config['second_category']}下未找到包含'{config['third_category']}'的三级类别")
                     print(f"可用的三级类别: {[c['name'] for c in third_level_categories]}")
                     return
             else:
                 target_third_categories = third_level_categories
 
-            # 计算总产品数
-            total_products = sum(c['product_count'] for c in target_third_categories if c['product_count'] > 0)
+            # 计算总产品数（只计未完成的产品）
+            total_products = sum(len(state.pending_products(c['products'])) for c in target_third_categories)
             if total_products == 0:
                 print("没有可爬取的产品")
                 return
 
+            async def scrape_category(category, progress_bar=None):
+                await scrape_products_in_category(page, category, writer, progress_bar,
+                                                  concurrency=config['concurrency'],
+                                                  price_mode=config['price_mode'],
+                                                  batch_size=config['cart_batch_size'],
+                                                  state=state,
+                                                  fast_path=fast_path,
+                                                  pool=pool,
+                                                  history=history_sink.history if history_sink else None)
+
             print(f"\n总共需要爬取 {total_products} 个产品")
-            print(f"数据将保存到: {csv_filename}")
+            print(f"数据将保存到: {output_name}（{', '.join(config['output_sinks'])}）")
             progress_bar = tqdm(total=total_products, desc="总体进度", position=0, leave=True)
 
-            # 6. 创建目标三级类别ID列表
-            target_category_ids = [c['id'] for c in target_third_categories]
-
-            # 7. 循环爬取每个三级类别
-            for category_id in target_category_ids:
-                # 每次循环前回到初始菜单
-                print(f"\n准备爬取类别ID: {category_id}")
-                if not await open_main_menu(page):
-                    log_error(f"无法返回主菜单，跳过类别 {category_id}")
-                    continue
-
-                # 重新获取主类别
-                main_categories = await get_main_categories(page)
-                if not main_categories:
-                    log_error("重新获取主类别失败")
-                    continue
-
-                # 重新获取目标主类别
-                target_main_category = next((c for c in main_categories if c['name'] == config['main_category']), None)
-                if not target_main_category:
-                    log_error(f"重新获取主类别失败: {config['main_category']}")
-                    continue
-
-                # 重新获取二级类别
-                second_level_categories = await get_second_level_categories(page, target_main_category)
-                if not second_level_categories:
-                    log_error(f"重新获取二级类别失败")
-                    continue
-
-                # 重新获取目标二级类别
-                target_second_category = next(
-                    (c for c in second_level_categories if c['name'] == config['second_category']), None)
-                if not target_second_category:
-                    log_error(f"重新获取二级类别失败: {config['second_category']}")
-                    continue
-
-                # 重新获取三级类别
-                third_level_categories = await get_third_level_categories(page, target_second_category)
-                if not third_level_categories:
-                    log_error(f"重新获取三级类别失败")
-                    continue
-
-                # 查找当前目标类别
-                current_category = next((c for c in third_level_categories if c['id'] == category_id), None)
-                if not current_category:
-                    log_error(f"未找到三级类别: {category_id}")
-                    continue
-
-                # 爬取当前类别
-                if current_category['product_count'] > 0:
-                    await scrape_products_in_category(page, current_category, progress_bar, csv_filename)
+            # 3. 循环爬取每个三级类别（产品链接已在索引中，无需重新遍历菜单）
+            for current_category in target_third_categories:
+                print(f"\n准备爬取类别ID: {current_category['id']}")
+                if current_category['products']:
+                    await scrape_category(current_category, progress_bar)
                 else:
                     print(f"类别 {current_category['name']} 无产品，跳过")
 
             progress_bar.close()
-            print(f"\n{config['second_category']}大类爬取完成！数据已保存到{csv_filename}")
+
+            # 4. 运行末尾按指数退避重试暂时性失败
+            await retry_transient_failures(state, scrape_category, max_attempts=config['retry_max_attempts'],
+                                           base_delay=config['retry_base_delay_s'])
+            if history_sink and not retry_failed:
+                history_sink.set_frontier([c['full_category'] for c in target_third_categories],
+                                          [p['url'] for c in target_third_categories for p in c['products']])
+            print(f"\n{'全菜单' if full_menu else config['second_category'] + '大类'}爬取完成！数据已保存到{output_name}")
 
         except Exception as e:
             log_error(f"全局错误: {str(e)}")
-            timestamp = int(time.time())
-            await page.screenshot(path=f"global_error_{timestamp}.png", full_page=True)
+            await capture_screenshot(page, "global_error")
+            print_dead_letter_summary(state)
         finally:
+            await flush_screenshots()
+            print_wait_report()
+            print_routing_report()
+            print_rate_report()
+            print_size_report()
+            print_selector_report()
+            export_timings(config, output_name)
+            await pool.close()
+            print_pool_report(pool)
+            if main_state_path:
+                try:
+                    await context.storage_state(path=main_state_path)
+                except Exception as e:
+                    log_error(f"保存会话状态失败: {str(e)}")
             await browser.close()
+            await writer.close()
+            if history_sink:
+                print_history_report(history_sink)
+            if fast_path:
+                print(f"快速路径命中 {fast_path.hits} 个产品，回退 Playwright {fast_path.misses} 个")
+                await fast_path.close()
+            state.close()
+            shutdown_logging()
 
 
 if __name__ == "__main__":
-    asyncio.run(main_scraper())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="星巴克菜单爬虫")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--resume', action='store_true', help="从状态库续爬，只处理未完成的产品")
+    mode.add_argument('--fresh', action='store_true', help="清空状态库，从零开始爬取（默认）")
+    mode.add_argument('--retry-failed', action='store_true',
+                      help="只重爬上次运行失败队列中的产品，并合并到上次的输出中（需与上次相同的 --full-menu 设置）")
+    parser.add_argument('--full-menu', action='store_true', help="一次爬取所有主类别/二级/三级类别，跨类别去重产品")
+    parser.add_argument('--shards', type=int, default=0, help="多进程分片爬取的进程数（每个进程独立浏览器）")
+    parser.add_argument('--urls', help="分片/多门店模式下的产品URL列表文件（每行一个URL），不指定则从类别树获取")
+    parser.add_argument('--stores', help="多门店价格矩阵模式：门店编号列表（逗号分隔，或 @文件 每行一个）")
+    parser.add_argument('--timing', action='store_true', help="记录各阶段耗时并在结束时导出报告")
+    parser.add_argument('--headless', action='store_true', help="无头模式运行浏览器（服务器环境）")
+    args = parser.parse_args()
+    if (args.shards or args.stores) and (args.resume or args.retry_failed):
+        # 分片/多门店模式不使用状态库：分片崩溃只在本次运行内重新分配，门店定价每次全量
+        parser.error("--shards / --stores 模式不支持 --resume 和 --retry-failed")
+    if args.timing:
+        DEFAULT_CONFIG['timing'] = True
+    if args.headless:
+        DEFAULT_CONFIG['headless'] = True
+
+    if args.shards or args.stores:
+        # 产品目录只发现一次，再交给分片进程或各门店的定价任务
+        if args.urls:
+            products = load_url_list(args.urls)
+        else:
+            products = asyncio.run(discover_frontier(DEFAULT_CONFIG, args.full_menu))
+        output_name = get_output_name(DEFAULT_CONFIG, args.full_menu)
+        if args.stores:
+            run_store_matrix(products, parse_store_list(args.stores), output_name, DEFAULT_CONFIG)
+        else:
+            run_sharded_crawl(products, args.shards, output_name, DEFAULT_CONFIG)
+    else:
+        asyncio.run(main_scraper(resume=args.resume, full_menu=args.full_menu, retry_failed=args.retry_failed))
\ No newline at end of file
@@ -0,0 +1,267 @@
+import asyncio
+import re
+from playwright.async_api import Page, Response
+from utils import log_error
+
+# 需要捕获的产品/定价/购物车接口（可按需替换；离线调试可用 benchmarks/fixture_site.py --recorded 回放录制的JSON）
+DEFAULT_URL_PATTERNS = [r'/bff/ordering/', r'/apiproxy/', r'/product', r'/pric', r'/cart']
+
+SIZE_LIST_KEYS = ('sizes', 'sizeOptions', 'servingSizes')
+SIZE_NAME_KEYS = ('sizeCode', 'sizeName', 'size', 'displayName', 'name')
+PRICE_KEYS = ('displayPrice', 'price', 'priceValue', 'basePrice', 'totalPrice', 'amount')
+CALORIE_KEYS = ('calories', 'displayCalories', 'calorie')
+NESTED_VALUE_KEYS = ('displayValue', 'value', 'amount', 'name', 'sizeCode')
+# 载荷中标识产品节点的字段：按编号、名称、链接/slug 与当前产品匹配
+PRODUCT_ID_KEYS = ('productNumber', 'productId', 'id', 'sku')
+PRODUCT_NAME_KEYS = ('name', 'productName', 'formattedName', 'displayName')
+PRODUCT_LINK_KEYS = ('slug', 'uri', 'url', 'href', 'productUrl')
+PRODUCT_PATH_RE = re.compile(r'/menu/product/([^/?#]+)(?:/([^/?#]+))?')
+
+
+class ResponseCapture:
+    """监听页面的 XHR/fetch 响应，缓存URL匹配的JSON载荷"""
+
+    def __init__(self, page: Page, url_patterns=None):
+        self.page = page
+        self.url_patterns = [re.compile(p, re.I) for p in (url_patterns or DEFAULT_URL_PATTERNS)]
+        self.payloads = []
+        self._pending = set()
+
+    def start(self):
+        self.page.on("response", self._on_response)
+
+    def stop(self):
+        self.page.remove_listener("response", self._on_response)
+
+    def _on_response(self, response: Response):
+        if response.request.resource_type not in ("xhr", "fetch"):
+            return
+        if not any(p.search(response.url) for p in self.url_patterns):
+            return
+        task = asyncio.ensure_future(self._read_json(response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _read_json(self, response: Response):
+        try:
+            payload = await response.json()
+        except Exception:
+            return
+        self.payloads.append({'url': response.url, 'payload': payload})
+
+    async def drain(self, timeout=5000):
+        """等待页面网络空闲并读取完所有已捕获响应的JSON"""
+        try:
+            await self.page.wait_for_load_state("networkidle", timeout=timeout)
+        except Exception:
+            pass
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+
+def _scalar(value):
+    """取出可展示的标量值，嵌套字典按 displayValue/value 等键继续查找"""
+    if isinstance(value, dict):
+        for key in NESTED_VALUE_KEYS:
+            if key in value:
+                return _scalar(value[key])
+        return None
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _first_value(record, keys):
+    for key in keys:
+        if key in record:
+            value = _scalar(record[key])
+            if value not in (None, ''):
+                return value
+    return None
+
+
+def _format_price(value):
+    if isinstance(value, (int, float)):
+        return f"${value:.2f}"
+    return str(value).strip()
+
+
+def _find_calories(record):
+    """卡路里可能直接在记录上，也可能在 nutrition 下"""
+    calories = _first_value(record, CALORIE_KEYS)
+    if calories is None and isinstance(record.get('nutrition'), dict):
+        calories = _first_value(record['nutrition'], CALORIE_KEYS)
+    return calories
+
+
+def _add_size_record(records, item):
+    size_name = _first_value(item, SIZE_NAME_KEYS)
+    if size_name is None:
+        return
+    price = _first_value(item, PRICE_KEYS)
+    calories = _find_calories(item)
+    if price is None and calories is None:
+        return
+    record = records.setdefault(str(size_name).strip(), {'price': None, 'calories': None})
+    if price is not None and record['price'] is None:
+        record['price'] = _format_price(price)
+    if calories is not None and record['calories'] is None:
+        record['calories'] = str(calories).strip()
+
+
+def _size_list(node):
+    for key in SIZE_LIST_KEYS:
+        if isinstance(node.get(key), list):
+            return node[key]
+    return None
+
+
+def extract_size_records(payload):
+    """从任意JSON载荷中递归提取规格记录，返回 {规格名: {'price':..., 'calories':...}}"""
+    records = {}
+
+    def walk(node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in SIZE_LIST_KEYS and isinstance(value, list):
+                    for item in value:
+                        if isinstance(item, dict):
+                            _add_size_record(records, item)
+                walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(payload)
+    return records
+
+
+def normalize_name(name):
+    """统一产品名称用于匹配（忽略大小写、商标符号和多余空白）"""
+    return re.sub(r'\s+', ' ', re.sub(r'[®™]', '', name or '')).strip().lower()
+
+
+def product_identity(product):
+    """产品的 (编号, slug, 规范化名称)，编号和 slug 取自产品URL /menu/product/<编号>/<slug>"""
+    match = PRODUCT_PATH_RE.search(product.get('url') or '')
+    return (match.group(1) if match else None, match.group(2) if match else None,
+            normalize_name(product.get('name')))
+
+
+def product_key(product):
+    """跨类别去重用的产品标识 <编号>/<slug>：同一产品在不同类别下的链接只有 ?parent= 不同"""
+    product_id, slug, _ = product_identity(product)
+    if product_id:
+        return f"{product_id}/{slug or ''}"
+    return (product.get('url') or '').split('?', 1)[0]
+
+
+def _path_id(link):
+    match = PRODUCT_PATH_RE.search(link)
+    return match.group(1) if match else None
+
+
+def _match_score(node, identity):
+    """节点与产品的匹配程度：编号 3，名称 2，slug 1，不匹配 0（产品链接中的编号不同视为其他产品）"""
+    product_id, slug, name = identity
+    links = [node[key] for key in PRODUCT_LINK_KEYS if isinstance(node.get(key), str)]
+    link_ids = {_path_id(link) for link in links} - {None}
+    if product_id:
+        if any(str(_scalar(node.get(key))) == product_id for key in PRODUCT_ID_KEYS if node.get(key) is not None):
+            return 3
+        if link_ids:
+            return 3 if product_id in link_ids else 0
+    if name and any(normalize_name(str(_scalar(node.get(key)) or '')) == name for key in PRODUCT_NAME_KEYS):
+        return 2
+    if slug and any(link.strip('/').split('/')[-1] == slug for link in links):
+        return 1
+    return 0
+
+
+def find_product_node(payload, product):
+    """在载荷中找到当前产品自己的节点（带规格列表、按编号/名称/slug匹配）
+
+    推荐、搭配等其他产品的节点会被忽略，找不到当前产品时返回None
+    """
+    identity = product_identity(product)
+    candidates = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if _size_list(node) is not None:
+                candidates.append(node)
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(payload)
+    best, best_score = None, 0
+    for node in candidates:
+        score = _match_score(node, identity)
+        if score > best_score:
+            best, best_score = node, score
+    # 唯一的带规格节点没有任何标识字段时（如按产品请求的定价接口）视为当前产品；标识不符的节点属于其他产品
+    identity_keys = PRODUCT_ID_KEYS + PRODUCT_NAME_KEYS + PRODUCT_LINK_KEYS
+    if best is None and len(candidates) == 1 and not any(key in candidates[0] for key in identity_keys):
+        best = candidates[0]
+    return best
+
+
+def node_size_records(node):
+    """只从节点自身的规格列表提取规格记录（不递归进入嵌套的其他产品）"""
+    records = {}
+    for item in _size_list(node) or []:
+        if isinstance(item, dict):
+            _add_size_record(records, item)
+    return records
+
+
+def product_size_records(payload, product):
+    """只从当前产品节点的规格列表提取规格记录，找不到该产品时返回空字典"""
+    node = find_product_node(payload, product)
+    return node_size_records(node) if node is not None else {}
+
+
+def merge_size_records(payloads, product=None):
+    """合并多个响应中的规格记录（先到的非空值优先）
+
+    提供 product 时每个响应只取当前产品节点的规格列表：宽泛的 /product、/pric 规则也会捕获推荐产品的响应，
+    不过滤时先到的推荐产品价格会占用同名规格
+    """
+    merged = {}
+    for entry in payloads:
+        if product is None:
+            records = extract_size_records(entry['payload'])
+        else:
+            records = product_size_records(entry['payload'], product)
+        for size_name, record in records.items():
+            target = merged.setdefault(size_name, {'price': None, 'calories': None})
+            for field in ('price', 'calories'):
+                if target[field] is None:
+                    target[field] = record[field]
+    return merged
+
+
+async def get_product_sizes_from_network(capture: ResponseCapture, product_name, product_url, category):
+    """从捕获的接口响应中直接读取各规格价格和卡路里（无需进入购物车）
+
+    任一规格缺少价格时返回空列表，由调用方回退到 DOM/购物车路径
+    """
+    try:
+        await capture.drain()
+        records = merge_size_records(capture.payloads, {'name': product_name, 'url': product_url})
+        if not records or any(r['price'] is None for r in records.values()):
+            return []
+        return [{
+            "category": category,
+            "product_name": product_name,
+            "size": size_name,
+            "calories": record['calories'] or "N/A",
+            "price": record['price'],
+            "url": product_url
+        } for size_name, record in records.items()]
+    except Exception as e:
+        log_error(f"接口响应解析失败: {str(e)} | URL: {product_url}")
+        return []
\ No newline at end of file
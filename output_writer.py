@@ -0,0 +1,215 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import sqlite3
+import time
+from utils import log_error
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet 输出为可选功能
+    pa = None
+    pq = None
+
+
+def _truncate_partial_line(path):
+    """截掉文件末尾未写完的半行（上次进程在写入中途崩溃时）"""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+class CsvSink:
+    """CSV输出，沿用现有 fieldnames"""
+
+    def __init__(self, path, fieldnames):
+        self.path = path
+        self.fieldnames = fieldnames
+
+    def open(self, fresh=True):
+        if fresh or not os.path.exists(self.path):
+            with open(self.path, 'w', newline='', encoding='utf-8') as f:
+                csv.DictWriter(f, fieldnames=self.fieldnames).writeheader()
+        else:
+            _truncate_partial_line(self.path)
+
+    def write_batch(self, rows):
+        # 整批先序列化到内存，再一次写入并 fsync
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.fieldnames, extrasaction='ignore')
+        writer.writerows(rows)
+        with open(self.path, 'a', newline='', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """JSON Lines 输出，每行一个规格记录"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self, fresh=True):
+        if fresh or not os.path.exists(self.path):
+            open(self.path, 'w', encoding='utf-8').close()
+        else:
+            _truncate_partial_line(self.path)
+
+    def write_batch(self, rows):
+        data = ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        pass
+
+
+class SqliteSink:
+    """SQLite输出，以 (url, size) 为键 upsert，每批一个事务"""
+
+    def __init__(self, path, fieldnames, table='products'):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.table = table
+        self.conn = None
+
+    def open(self, fresh=True):
+        # 写入在后台线程执行，连接允许跨线程使用（同一时间只有写入任务在用）
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        columns = ', '.join(f"{field} TEXT" for field in self.fieldnames)
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ({columns}, PRIMARY KEY (url, size))")
+            if fresh:
+                self.conn.execute(f"DELETE FROM {self.table}")
+
+    def write_batch(self, rows):
+        columns = ', '.join(self.fieldnames)
+        placeholders = ', '.join('?' for _ in self.fieldnames)
+        updates = ', '.join(f"{field} = excluded.{field}" for field in self.fieldnames if field not in ('url', 'size'))
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO {self.table} ({columns}) VALUES ({placeholders}) "
+                f"ON CONFLICT (url, size) DO UPDATE SET {updates}",
+                [tuple(row.get(field) for field in self.fieldnames) for row in rows])
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+
+
+class ParquetSink:
+    """Parquet列式输出：每次刷新写一个分片文件（先写临时文件再原子重命名）"""
+
+    def __init__(self, directory, fieldnames):
+        if pa is None:
+            raise RuntimeError("Parquet 输出需要安装 pyarrow")
+        self.directory = directory
+        self.fieldnames = fieldnames
+        self.part = 0
+
+    def open(self, fresh=True):
+        if fresh and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.part = len([f for f in os.listdir(self.directory) if f.endswith('.parquet')])
+
+    def write_batch(self, rows):
+        table = pa.table({field: [row.get(field) for row in rows] for field in self.fieldnames})
+        final_path = os.path.join(self.directory, f"part-{self.part:05d}.parquet")
+        tmp_path = final_path + '.tmp'
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, final_path)
+        self.part += 1
+
+    def close(self):
+        pass
+
+
+def build_sinks(kinds, base_name, fieldnames):
+    """按名称创建输出目标：csv / jsonl / sqlite / parquet"""
+    sinks = []
+    for kind in kinds:
+        if kind == 'csv':
+            sinks.append(CsvSink(f"{base_name}.csv", fieldnames))
+        elif kind == 'jsonl':
+            sinks.append(JsonlSink(f"{base_name}.jsonl"))
+        elif kind == 'sqlite':
+            sinks.append(SqliteSink(f"{base_name}.db", fieldnames))
+        elif kind == 'parquet':
+            sinks.append(ParquetSink(f"{base_name}_parquet", fieldnames))
+        else:
+            raise ValueError(f"未知的输出类型: {kind}")
+    return sinks
+
+
+class OutputWriter:
+    """单一写入任务：通过 asyncio 队列接收行，按条数或时间批量刷新到所有输出目标
+
+    文件I/O在线程中执行，不阻塞事件循环；同一产品的行总是在同一批中写出
+    """
+
+    def __init__(self, sinks, batch_size=200, flush_interval=2.0):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue()
+        self.rows_written = 0
+        self._task = None
+
+    async def start(self, fresh=True):
+        for sink in self.sinks:
+            await asyncio.to_thread(sink.open, fresh)
+        self._task = asyncio.create_task(self._run())
+
+    async def write(self, rows):
+        """提交一个产品的全部规格行"""
+        if rows:
+            await self.queue.put(list(rows))
+
+    async def close(self):
+        """刷新剩余数据并关闭所有输出目标"""
+        if self._task:
+            await self.queue.put(None)
+            await self._task
+            self._task = None
+        for sink in self.sinks:
+            sink.close()
+
+    async def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                rows = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                rows = []
+            if rows is None:
+                await self._flush(batch)
+                return
+            batch.extend(rows)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                await self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    async def _flush(self, batch):
+        if not batch:
+            return
+        for sink in self.sinks:
+            try:
+                await asyncio.to_thread(sink.write_batch, batch)
+            except Exception as e:
+                log_error(f"写入 {type(sink).__name__} 失败: {str(e)}")
+        self.rows_written += len(batch)
\ No newline at end of file
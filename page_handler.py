@@ -1,24 +1,77 @@
-from playwright.async_api import Page
+import os
+from urllib.parse import urlparse
+from playwright.async_api import Page, Browser, BrowserContext
 from utils import log_error
+from waits import wait_for_state
+from instrumentation import traced
+from rate_controller import gated_goto, record_timeout
+import request_router
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+VIEWPORT = {"width": 1366, "height": 768}
+
+# 站点根地址：可用环境变量 STARBUCKS_BASE_URL 或 configure_site() 指向本地测试站点
+BASE_URL = os.environ.get('STARBUCKS_BASE_URL', 'https://www.starbucks.com').rstrip('/')
+DEFAULT_STORE = "56450-290146"
+MENU_PATH = f"/menu?storeNumber={DEFAULT_STORE}&distance=0.2118&confirmedOrderingUnavailable={DEFAULT_STORE}"
+
+
+def configure_site(base_url):
+    """设置站点根地址（None 表示保持默认）"""
+    global BASE_URL
+    if base_url:
+        BASE_URL = base_url.rstrip('/')
+
+def site_url(path):
+    """站点内路径转为完整URL"""
+    return f"{BASE_URL}{path}"
+
+def site_host():
+    return urlparse(BASE_URL).hostname
+
+def menu_path(store_number=None):
+    """指定门店的菜单页路径（None 为默认门店）；打开后门店选择保存在所在上下文中"""
+    if not store_number or store_number == DEFAULT_STORE:
+        return MENU_PATH
+    return f"/menu?storeNumber={store_number}&confirmedOrderingUnavailable={store_number}"
+
+async def launch_browser(playwright, headless=False) -> Browser:
+    """启动 Chromium（规避自动化特征）"""
+    return await playwright.chromium.launch(
+        headless=headless,
+        args=["--disable-blink-features=AutomationControlled", "--no-sandbox", "--enable-precise-memory-info"]
+    )
+
+async def new_browser_context(browser: Browser, storage_state=None) -> BrowserContext:
+    """创建一个独立的浏览器上下文（独立Cookie和购物车）并完成初始化
+
+    storage_state 为上次保存的会话状态文件时热启动（沿用Cookie和门店选择）
+    """
+    context = await browser.new_context(user_agent=USER_AGENT, viewport=VIEWPORT, storage_state=storage_state)
+    await init_browser_context(context)
+    return context
 
 async def init_browser_context(context):
-    """初始化浏览器上下文（规避反爬）"""
+    """初始化浏览器上下文（规避反爬，安装请求拦截）"""
     await context.add_init_script("""
         Object.defineProperty(navigator, 'webdriver', {
             get: () => undefined
         })
     """)
+    await request_router.router.install(context)
 
-async def open_main_menu(page: Page) -> bool:
-    """打开主菜单页面并验证"""
+@traced('open_main_menu')
+async def open_main_menu(page: Page, store_number=None) -> bool:
+    """打开主菜单页面并验证（store_number 为空时使用默认门店）"""
+    path = menu_path(store_number)
     try:
-        MENU_URL = "https://www.starbucks.com/menu?storeNumber=56450-290146&distance=0.2118&confirmedOrderingUnavailable=56450-290146"
-        await page.goto(MENU_URL, timeout=60000, wait_until="domcontentloaded")
+        await gated_goto(page, site_url(path), timeout=60000, wait_until="domcontentloaded")
         print("已进入初始菜单页面")
         await page.wait_for_selector('section#drinks', timeout=30000)
-        await page.wait_for_timeout(2000)
+        await wait_for_state(page, 'menu_ready', 'section#drinks li[data-e2e="tile"]')
         return True
     except Exception as e:
+        record_timeout(site_url(path), e)
         error_msg = f"进入主菜单失败: {str(e)}"
         print(error_msg)
         log_error(error_msg)
@@ -0,0 +1,154 @@
+import os
+from playwright.async_api import Browser, BrowserContext, Page
+from utils import log_error
+from page_handler import new_browser_context, open_main_menu
+
+# 页面内读取JS堆占用（需 --enable-precise-memory-info 才是精确值，否则为量化值）
+HEAP_USAGE_JS = "() => performance.memory ? performance.memory.usedJSHeapSize : 0"
+
+
+def session_state_path(state_dir, name):
+    """会话状态文件路径；state_dir 为 None 时不保存会话"""
+    return os.path.join(state_dir, f"{name}.json") if state_dir else None
+
+
+def existing_state(path):
+    """存在已保存的会话状态时返回路径，供新上下文热启动"""
+    return path if path and os.path.exists(path) else None
+
+
+class PageSlot:
+    """池中的一个槽位：独立上下文（独立Cookie和购物车）加一个跨产品复用的标签页"""
+
+    def __init__(self, pool, index, context: BrowserContext):
+        self.pool = pool
+        self.index = index
+        self.context = context
+        self.page = None
+        self.generation = 0
+        self.uses = 0
+        self.peak_heap = 0
+
+    async def acquire(self) -> Page:
+        """取出本槽位的标签页，没有或已关闭时新开一个"""
+        if self.page is None or self.page.is_closed():
+            self.page = await self.context.new_page()
+            self.generation += 1
+            self.uses = 0
+            self.peak_heap = 0
+        return self.page
+
+    async def release(self, page: Page, healthy=True):
+        """归还标签页：使用次数或内存超限、或本次出错时回收（关闭后下次重新打开）"""
+        self.uses += 1
+        heap = 0
+        if healthy:
+            try:
+                heap = await page.evaluate(HEAP_USAGE_JS)
+            except Exception:
+                healthy = False
+            self.peak_heap = max(self.peak_heap, heap)
+        reason = None
+        if not healthy:
+            reason = 'error'
+        elif self.pool.memory_limit_mb and heap > self.pool.memory_limit_mb * 1024 * 1024:
+            reason = 'memory'
+        elif self.uses >= self.pool.max_uses:
+            reason = 'max_uses'
+        if reason:
+            await self.recycle(reason)
+
+    async def recycle(self, reason):
+        if self.page is None:
+            return
+        self.pool.record(self, reason)
+        try:
+            await self.page.close()
+        except Exception as e:
+            log_error(f"关闭池中标签页失败: {str(e)}")
+        self.page = None
+
+
+class PagePool:
+    """标签页池：每个worker一个槽位，标签页跨产品复用，按使用次数或JS堆占用回收以控制 Chromium 内存泄漏
+
+    state_dir 不为空时每个槽位的 storage_state（Cookie、门店选择等）在结束时保存，下次运行热启动；
+    新建的上下文在启动时先打开一次 store 门店的菜单页，保证槽位加购的价格带门店
+    """
+
+    def __init__(self, browser: Browser, size, max_uses=50, memory_limit_mb=0, state_dir=None,
+                 shared_context: BrowserContext = None, store=None):
+        self.browser = browser
+        self.store = store
+        self.size = 1 if shared_context else size
+        self.max_uses = max_uses
+        self.memory_limit_mb = memory_limit_mb
+        self.state_dir = state_dir
+        self.shared_context = shared_context
+        self.slots = []
+        self.history = []
+
+    async def start(self):
+        if self.state_dir:
+            os.makedirs(self.state_dir, exist_ok=True)
+        if self.shared_context:
+            self.slots = [PageSlot(self, 0, self.shared_context)]
+            return self
+        for index in range(self.size):
+            storage_state = existing_state(session_state_path(self.state_dir, f"slot{index}"))
+            context = await new_browser_context(self.browser, storage_state=storage_state)
+            slot = PageSlot(self, index, context)
+            self.slots.append(slot)
+            await self.select_store(slot)
+        return self
+
+    async def select_store(self, slot):
+        """门店选择保存在上下文中：打开一次门店菜单页，之后回收标签页也不会丢失"""
+        page = await slot.acquire()
+        opened = await open_main_menu(page, self.store)
+        await slot.release(page, opened)
+        if not opened:
+            raise RuntimeError(f"槽位{slot.index}无法打开门店 {self.store or '默认'} 的菜单页")
+
+    def record(self, slot, reason):
+        self.history.append({
+            'slot': slot.index,
+            'page': slot.generation,
+            'uses': slot.uses,
+            'peak_heap_mb': round(slot.peak_heap / 1024 / 1024, 1),
+            'reason': reason,
+        })
+
+    async def close(self):
+        """回收所有标签页，保存会话状态并关闭池自己创建的上下文"""
+        for slot in self.slots:
+            await slot.recycle('end')
+            if slot.context is self.shared_context:
+                continue
+            path = session_state_path(self.state_dir, f"slot{slot.index}")
+            try:
+                if path:
+                    await slot.context.storage_state(path=path)
+                await slot.context.close()
+            except Exception as e:
+                log_error(f"关闭槽位{slot.index}上下文失败: {str(e)}")
+        self.slots = []
+
+    def report(self):
+        return list(self.history)
+
+
+def print_pool_report(pool):
+    history = pool.report()
+    if not history:
+        return
+    print("\n===== 标签页池统计 =====")
+    recycled = {}
+    for entry in history:
+        recycled[entry['reason']] = recycled.get(entry['reason'], 0) + 1
+    print(f"共使用 {len(history)} 个标签页，回收原因: {recycled}")
+    for index in sorted({entry['slot'] for entry in history}):
+        pages = [entry for entry in history if entry['slot'] == index]
+        peaks = [entry['peak_heap_mb'] for entry in pages]
+        print(f"槽位{index}: {len(pages)} 个标签页，共使用 {sum(entry['uses'] for entry in pages)} 次，"
+              f"每页峰值JS堆 最大 {max(peaks)}MB 平均 {sum(peaks) / len(peaks):.1f}MB")
\ No newline at end of file
@@ -0,0 +1,325 @@
+import argparse
+import csv
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from playwright.async_api import Page
+from selector_registry import page_alternatives
+from network_capture import product_size_records
+from size_snapshot import SNAPSHOT_JS, STATE_KEYS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL,
+    finished_at REAL,
+    changed INTEGER DEFAULT 0,
+    unchanged INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS versions (
+    url TEXT,
+    size TEXT,
+    store TEXT,
+    category TEXT,
+    product_name TEXT,
+    calories TEXT,
+    price TEXT,
+    previous_calories TEXT,
+    previous_price TEXT,
+    valid_from REAL,
+    valid_to REAL,
+    run_id INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS versions_current ON versions (url, size, store) WHERE valid_to IS NULL;
+CREATE INDEX IF NOT EXISTS versions_key ON versions (url, size, store, valid_from);
+CREATE INDEX IF NOT EXISTS versions_valid ON versions (valid_from, valid_to);
+CREATE INDEX IF NOT EXISTS versions_run ON versions (run_id);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    url TEXT,
+    store TEXT,
+    fingerprint TEXT,
+    run_id INTEGER,
+    PRIMARY KEY (url, store)
+);
+"""
+
+DELTA_FIELDNAMES = ['category', 'product_name', 'size', 'store', 'calories', 'price',
+                    'previous_calories', 'previous_price', 'url']
+
+
+async def page_fingerprint(page: Page, product, sold_out=False):
+    """产品页内容指纹：规格选项、水合状态中本产品的规格记录、当前卡路里和售罄状态（一次页面内求值）"""
+    raw = await page.evaluate(SNAPSHOT_JS, [page_alternatives('calories'), STATE_KEYS])
+    records = {}
+    for state in raw['states']:
+        for size_name, record in product_size_records(state, product).items():
+            records.setdefault(size_name, record)
+    payload = json.dumps({'sizes': raw['sizes'], 'records': records, 'rendered': raw['rendered'],
+                          'sold_out': bool(sold_out)}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class PriceHistory:
+    """按 (url, 规格, 门店) 版本化的价格/卡路里历史库
+
+    每次运行只为发生变化的行写入新版本（valid_from 为本次运行开始时间），旧版本的 valid_to 同时关闭；
+    本次爬到的产品不再返回的规格、以及完整爬取的类别中已下架的产品，其当前版本同样关闭。
+    另外记录每个产品页的内容指纹，供 skip_unchanged 模式跳过未变化的产品。
+    store 为行中没有 store 字段时使用的门店（单门店爬取），多门店模式的行自带门店
+    """
+
+    def __init__(self, path='price_history.db', store='', skip_unchanged=False):
+        self.path = path
+        self.store = store
+        self.skip_unchanged = skip_unchanged
+        # 写入在输出任务的后台线程执行，指纹查询在事件循环中执行，共用连接时加锁
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.run_id = None
+        self.started_at = None
+        self.skipped = 0
+        self.removed = 0
+        self._seen = set()
+        self._pending_fingerprints = {}
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self):
+        self.started_at = time.time()
+        with self.lock, self.conn:
+            self.run_id = self.conn.execute("INSERT INTO runs (started_at) VALUES (?)", (self.started_at,)).lastrowid
+        return self.run_id
+
+    def finish_run(self):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), self.run_id))
+
+    def _close(self, url, size, store):
+        self.conn.execute(
+            "UPDATE versions SET valid_to = ? WHERE url = ? AND size = ? AND store = ? AND valid_to IS NULL",
+            (self.started_at, url, size, store))
+        self.removed += 1
+
+    def record_rows(self, rows):
+        """写入一批行：未变化的跳过，变化的关闭旧版本并插入新版本，返回变化行数
+
+        每批包含产品的全部规格行（输出任务按产品提交），该产品当前版本中本次未返回的规格视为下架并关闭
+        """
+        changed = 0
+        returned = {}
+        for row in rows:
+            returned.setdefault((row['url'], row.get('store') or self.store), set()).add(row['size'])
+        with self.lock, self.conn:
+            for (url, store), sizes in returned.items():
+                self._seen.add((url, store))
+                for current in self.conn.execute(
+                        "SELECT size FROM versions WHERE url = ? AND store = ? AND valid_to IS NULL",
+                        (url, store)).fetchall():
+                    if current['size'] not in sizes:
+                        self._close(url, current['size'], store)
+            for row in rows:
+                store = row.get('store') or self.store
+                key = (row['url'], row['size'], store)
+                current = self.conn.execute(
+                    "SELECT calories, price FROM versions WHERE url = ? AND size = ? AND store = ? AND valid_to IS NULL",
+                    key).fetchone()
+                if current and current['calories'] == row['calories'] and current['price'] == row['price']:
+                    continue
+                if current:
+                    self.conn.execute(
+                        "UPDATE versions SET valid_to = ? WHERE url = ? AND size = ? AND store = ? AND valid_to IS NULL",
+                        (self.started_at, *key))
+                self.conn.execute(
+                    "INSERT INTO versions (url, size, store, category, product_name, calories, price, "
+                    "previous_calories, previous_price, valid_from, valid_to, run_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                    (*key, row['category'], row['product_name'], row['calories'], row['price'],
+                     current['calories'] if current else None, current['price'] if current else None,
+                     self.started_at, self.run_id))
+                changed += 1
+            self.conn.execute("UPDATE runs SET changed = changed + ?, unchanged = unchanged + ? WHERE run_id = ?",
+                              (changed, len(rows) - changed, self.run_id))
+            # 产品行成功写出后才保存其指纹，失败的产品下次仍会完整爬取
+            for url in {row['url'] for row in rows}:
+                fingerprint = self._pending_fingerprints.pop(url, None)
+                if fingerprint:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO fingerprints (url, store, fingerprint, run_id) VALUES (?, ?, ?, ?)",
+                        (url, self.store, fingerprint, self.run_id))
+        return changed
+
+    def close_missing(self, category_names, frontier_urls, store=None):
+        """关闭已下架产品的当前版本：所属类别在本次完整爬取的 category_names 中、但不在本次产品前沿里的产品
+
+        爬取失败的产品仍在前沿中，不会被关闭；返回关闭的版本数
+        """
+        store = self.store if store is None else store
+        names = set(category_names)
+        closed = 0
+        with self.lock, self.conn:
+            for row in self.conn.execute(
+                    "SELECT url, size, category FROM versions WHERE store = ? AND valid_to IS NULL", (store,)).fetchall():
+                if row['url'] in frontier_urls or (row['url'], store) in self._seen:
+                    continue
+                # 跨类别去重的产品，其 category 为以 " | " 分隔的全部所属类别
+                if names.intersection((row['category'] or '').split(' | ')):
+                    self._close(row['url'], row['size'], store)
+                    closed += 1
+        return closed
+
+    def current_rows(self, product):
+        """产品在本门店的当前版本，结构与爬取得到的规格行一致"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT size, calories, price FROM versions WHERE url = ? AND store = ? AND valid_to IS NULL "
+                "ORDER BY rowid", (product['url'], self.store)).fetchall()
+        return [{
+            "category": product['category'],
+            "product_name": product['name'],
+            "size": row['size'],
+            "calories": row['calories'],
+            "price": row['price'],
+            "url": product['url']
+        } for row in rows]
+
+    async def reuse_if_unchanged(self, page: Page, product, sold_out=False):
+        """计算产品页指纹；skip_unchanged 模式下指纹与上次一致时直接返回历史中的当前版本，否则返回空列表"""
+        fingerprint = await page_fingerprint(page, product, sold_out)
+        with self.lock:
+            row = self.conn.execute("SELECT fingerprint FROM fingerprints WHERE url = ? AND store = ?",
+                                    (product['url'], self.store)).fetchone()
+        if self.skip_unchanged and row and row['fingerprint'] == fingerprint:
+            rows = self.current_rows(product)
+            if rows:
+                self.skipped += 1
+                return rows
+        self._pending_fingerprints[product['url']] = fingerprint
+        return []
+
+    def as_of(self, timestamp, url=None, store=None):
+        """某一时刻有效的版本（可按产品和门店筛选）"""
+        query = "SELECT * FROM versions WHERE valid_from <= ? AND (valid_to IS NULL OR valid_to > ?)"
+        params = [timestamp, timestamp]
+        if url:
+            query += " AND url = ?"
+            params.append(url)
+        if store is not None:
+            query += " AND store = ?"
+            params.append(store)
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(query + " ORDER BY url, store, size", params)]
+
+    def changes_since(self, run_id):
+        """指定运行之后（不含）写入的所有新版本，包含变化前的价格和卡路里"""
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(
+                "SELECT * FROM versions WHERE run_id > ? ORDER BY run_id, url, store, size", (run_id,))]
+
+    def export_delta(self, path, run_id=None):
+        """导出某次运行（默认本次）的变化行，返回行数；下架的规格/产品以空价格和卡路里输出，原值在 previous_* 中"""
+        run_id = run_id or self.run_id
+        with self.lock:
+            rows = [dict(row) for row in self.conn.execute(
+                "SELECT * FROM versions WHERE run_id = ? ORDER BY url, store, size", (run_id,))]
+            removed = self.conn.execute(
+                "SELECT v.* FROM versions v JOIN runs r ON r.run_id = ? WHERE v.valid_to = r.started_at "
+                "AND NOT EXISTS (SELECT 1 FROM versions n WHERE n.url = v.url AND n.size = v.size "
+                "AND n.store = v.store AND n.run_id = r.run_id) ORDER BY v.url, v.store, v.size", (run_id,)).fetchall()
+        rows += [dict(row, calories='', price='', previous_calories=row['calories'], previous_price=row['price'])
+                 for row in removed]
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=DELTA_FIELDNAMES, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        return len(rows)
+
+
+class HistorySink:
+    """输出目标：把每批行写入版本化历史库，关闭时导出本次运行的变化文件"""
+
+    def __init__(self, history: PriceHistory, delta_path=None):
+        self.history = history
+        self.delta_path = delta_path
+        self.changed = 0
+        self.frontier = None
+
+    def open(self, fresh=True):
+        self.history.start_run()
+
+    def write_batch(self, rows):
+        self.changed += self.history.record_rows(rows)
+
+    def set_frontier(self, category_names, urls, stores=None):
+        """登记本次完整爬取的类别和产品前沿，关闭时据此关闭已下架产品的版本；未登记时（如只重爬失败队列）不关闭"""
+        self.frontier = (set(category_names), set(urls), stores)
+
+    def close(self):
+        if self.frontier:
+            category_names, urls, stores = self.frontier
+            for store in stores or [None]:
+                self.history.close_missing(category_names, urls, store)
+        self.history.finish_run()
+        if self.delta_path:
+            self.history.export_delta(self.delta_path)
+        self.history.close()
+
+
+def print_history_report(sink: HistorySink):
+    history = sink.history
+    print(f"\n===== 价格历史（第{history.run_id}次运行） =====")
+    print(f"变化行: {sink.changed} 下架关闭: {history.removed} 指纹未变跳过的产品: {history.skipped}"
+          + (f" 变化文件: {sink.delta_path}" if sink.delta_path else ""))
+
+
+def _parse_time(value):
+    """接受时间戳或 ISO 日期（如 2026-10-01 / 2026-10-01T08:00）"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询价格历史库")
+    parser.add_argument('db', help="历史库路径")
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument('--as-of', help="输出该时刻有效的价格（时间戳或 ISO 日期）")
+    query.add_argument('--changes-since', type=int, help="输出该运行编号之后的所有变化")
+    query.add_argument('--delta', type=int, help="导出指定运行的变化文件")
+    parser.add_argument('--url', help="只查询该产品（--as-of）")
+    parser.add_argument('--store', help="只查询该门店（--as-of）")
+    parser.add_argument('--out', help="输出CSV路径，默认打印到标准输出")
+    args = parser.parse_args()
+
+    history = PriceHistory(args.db)
+    try:
+        if args.delta is not None:
+            path = args.out or f"delta_run{args.delta}.csv"
+            print(f"导出 {history.export_delta(path, args.delta)} 行到 {path}")
+            return
+        if args.as_of:
+            rows = history.as_of(_parse_time(args.as_of), args.url, args.store)
+        else:
+            rows = history.changes_since(args.changes_since)
+        fieldnames = DELTA_FIELDNAMES + ['valid_from', 'valid_to', 'run_id']
+        if args.out:
+            with open(args.out, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(rows)
+            print(f"已写入 {len(rows)} 行到 {args.out}")
+        else:
+            for row in rows:
+                print(json.dumps(row, ensure_ascii=False))
+    finally:
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,255 +1,414 @@
-import csv
-import random
-from playwright.async_api import Page, BrowserContext
-from utils import log_error
+import asyncio
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
+from utils import log_error, bind_context, current_context, capture_screenshot
+from page_handler import site_url
+from page_pool import PagePool, PageSlot
+from rate_controller import throttle, gated_goto, record_timeout, rate_status
+from dead_letter import SelectorMissingError, EmptyResultError, record_failure
+from category_parser import get_category_products
+from network_capture import ResponseCapture, get_product_sizes_from_network, normalize_name
+from output_writer import OutputWriter
+from size_snapshot import extractor
+from waits import (jitter, wait_for_text_change, wait_for_state, cart_signature, wait_for_cart_change,
+                   wait_for_cart_ready, wait_for_grid_ready)
+from selector_registry import (FIRST_MATCH_JS, click_named, read_text, page_alternatives,
+                               record_hits)
+from instrumentation import span, traced, record_product
 from tqdm import tqdm
-import time
 
+MAX_CART_CLICKS = 50
+
+# 购物车条目字段 → 注册表中的选择器名称
+CART_ITEM_FIELDS = {'name': 'cart_item_name', 'size_text': 'cart_item_size', 'price': 'cart_item_price'}
+
+
+@traced('size_switch')
+async def select_size(page: Page, select_element, size_name, wait_calories=True):
+    """切换到指定规格，并等待卡路里文本刷新（已是当前规格或 wait_calories=False 时不等待）"""
+    if select_element:
+        if await select_element.input_value() == size_name:
+            return
+        old_calories = await read_text(page, 'calories')
+        async with throttle(page):
+            await select_element.select_option(value=size_name)
+    else:
+        label = await page.query_selector(f'label[data-e2e="{size_name}"]') or await page.query_selector(f'label:has-text("{size_name}")')
+        if not label:
+            return
+        old_calories = await read_text(page, 'calories')
+        async with throttle(page):
+            await label.click()
+    if wait_calories:
+        await wait_for_text_change(page, 'calories_change', page_alternatives('calories'), old_calories)
+    await jitter.pause()
+
+
+async def collect_size_calories(page: Page, on_size=None, product=None):
+    """一次快照读取所有规格及卡路里，返回 {规格名: 卡路里}
+
+    只有快照中缺失（按需渲染）的规格才切换后读取页面；on_size 为切换到每个规格后调用的协程
+    （如加入购物车），此时仍逐个切换规格，但快照已有卡路里的规格不再等待卡路里刷新。
+    切换后读到的渲染值与快照不一致时以渲染值为准。任一规格失败即抛出，交给死信队列分类重试，
+    不能跳过后返回缺规格的结果（价格历史会把缺失的规格当作下架关闭）
+    """
+    with span('size_snapshot'):
+        snapshot = await extractor.snapshot(page, product)
+    select_element = await page.query_selector('select[data-e2e="size-selector"]')
+    size_calories_map = {}
+    current = snapshot['selected']
+    for size_name in snapshot['sizes']:
+        calories = snapshot['calories'].get(size_name)
+        # 当前规格的渲染值已在快照中读取（并核对），无需切换
+        render = extractor.needs_render(snapshot, size_name) and size_name != current
+        if render or (on_size and size_name != current):
+            extractor.switches += render
+            await select_size(page, select_element, size_name, wait_calories=render)
+            current = size_name
+        if render:
+            rendered = (await read_text(page, 'calories') or '').strip() or None
+            if calories is not None and rendered is not None:
+                extractor.compare(size_name, calories, rendered)
+            calories = rendered or calories
+        size_calories_map[size_name] = calories or "N/A"
+        if on_size:
+            await on_size(size_name)
+    return size_calories_map
+
+
+@traced('clear_cart')
 async def clear_cart(page: Page):
-    """清空购物车"""
+    """清空购物车（当前不在购物车页面时先进入，加购中途出错后也能清理）"""
     try:
+        if not on_cart_page(page):
+            await open_cart(page)
         # 检查是否已空
         if await page.query_selector('div:text("Start your next order")'):
             return
 
-        # 减少数量按钮
-        decrease_btns = await page.query_selector_all('button[data-e2e="decreaseQuantityButton"]') or await page.query_selector_all('button[aria-label*="Decrease amount"]')
-        for btn in decrease_btns:
-            await btn.click()
-            await page.wait_for_timeout(1000)
+        # 逐次点击减少数量按钮，每次等购物车内容更新后再点下一次（数量>1的条目需要多次点击）
+        for _ in range(MAX_CART_CLICKS):
+            signature = await cart_signature(page)
+            async with throttle(page):
+                clicked = await click_named(page, 'decrease_quantity_button')
+            if not clicked or not await wait_for_cart_change(page, signature):
+                break
     except Exception as e:
-        log_error(f"清理购物车出错: {str(e)}")
-        timestamp = int(time.time())
-        await page.screenshot(path=f"cart_error_{timestamp}.png", full_page=True)
+        log_error(f"清理购物车出错: {str(e)}", phase='clear_cart')
+        await capture_screenshot(page, "cart_error")
 
 async def get_sold_out_product_sizes(page: Page, product_name, product_url, category):
-    """获取售罄产品的规格信息"""
+    """获取售罄产品的规格信息（读取失败时抛出，由死信队列重试，不写入占位的规格行）"""
+    size_calories_map = await collect_size_calories(page, product={'name': product_name, 'url': product_url})
+    return [{
+        "category": category,
+        "product_name": product_name,
+        "size": size_name,
+        "calories": calories,
+        "price": "soldout",
+        "url": product_url
+    } for size_name, calories in size_calories_map.items()]
+
+async def add_sizes_to_cart(page: Page, product=None):
+    """逐个切换规格并加入购物车，返回 {规格名: 卡路里}"""
+    async def add_to_order(size_name):
+        with span('add_to_order'):
+            async with throttle(page):
+                clicked = await click_named(page, 'add_to_order_button')
+            if not clicked:
+                raise SelectorMissingError(f"规格{size_name}未找到Add to order按钮")
+            # 等待加购弹窗出现后关闭，并等待其消失
+            if await wait_for_state(page, 'dialog_open', 'button[aria-label="Close"]'):
+                close_btn = await page.query_selector('button[aria-label="Close"]')
+                if close_btn:
+                    async with throttle(page):
+                        await close_btn.click()
+                    await wait_for_state(page, 'dialog_close', 'button[aria-label="Close"]', state='hidden')
+
+    return await collect_size_calories(page, on_size=add_to_order, product=product)
+
+
+def on_cart_page(page: Page):
+    return page.url.split('?')[0].rstrip('/').endswith('/menu/cart')
+
+
+async def open_cart(page: Page):
+    """进入购物车页面并等待条目加载完成"""
+    await gated_goto(page, site_url("/menu/cart"), timeout=60000, wait_until="domcontentloaded")
+    for sel in ['h1:has-text("Your Order")', 'div[data-e2e="cart-container"]']:
+        try:
+            await page.wait_for_selector(sel, timeout=10000)
+            break
+        except:
+            continue
+    await wait_for_cart_ready(page)
+
+
+async def read_cart_items(page: Page):
+    """进入购物车页面，一次页面内求值读取所有条目的名称、规格文本、价格和全文"""
+    with span('cart_navigation'):
+        await open_cart(page)
+
+    with span('cart_parse'):
+        alternatives = {name: page_alternatives(name) for name in CART_ITEM_FIELDS.values()}
+        alternatives['cart_item'] = page_alternatives('cart_item')
+        raw = await page.evaluate(
+            f"""([fields, alternatives]) => {{
+                const first = {FIRST_MATCH_JS};
+                // 条目容器：第一个能匹配到元素的备选
+                let itemsIndex = -1, items = [];
+                alternatives.cart_item.some((alt, i) => {{
+                    items = document.querySelectorAll(alt.css);
+                    itemsIndex = items.length ? i : -1;
+                    return items.length > 0;
+                }});
+                return {{itemsIndex, items: Array.from(items, item => {{
+                    const result = {{text: item.innerText, hits: {{}}}};
+                    for (const [field, name] of Object.entries(fields)) {{
+                        const [index, el] = first(item, alternatives[name]);
+                        result[field] = el ? el.textContent : null;
+                        result.hits[name] = index;
+                    }}
+                    return result;
+                }})}};
+            }}""", [CART_ITEM_FIELDS, alternatives])
+
+    record_hits('cart_item', alternatives['cart_item'], [raw['itemsIndex']])
+    for name in CART_ITEM_FIELDS.values():
+        record_hits(name, alternatives[name], [item['hits'][name] for item in raw['items']])
+    return [{field: item[field] for field in ('name', 'size_text', 'price', 'text')} for item in raw['items']]
+
+
+def match_size(size_text, size_names):
+    """在购物车规格文本中匹配规格名称（取最长匹配，避免短名称误匹配），未匹配返回 Standard"""
+    size_text = (size_text or "").lower()
+    matched = [name for name in size_names if name.lower() in size_text]
+    return max(matched, key=len) if matched else "Standard"
+
+
+async def get_product_sizes(page: Page, product_name, product_url, category):
+    """获取正常产品的规格信息（异常向上抛出，由worker分类后登记到失败队列）"""
     results = []
-    try:
-        # 获取规格选项
-        size_options = []
-        select_element = await page.query_selector('select[data-e2e="size-selector"]')
-        if select_element:
-            options = await select_element.query_selector_all('option:not([disabled]):not([value=""])')
-            for option in options:
-                size_options.append((await option.get_attribute('value'), await option.text_content() or ''))
-        else:
-            size_container = await page.query_selector('form[data-e2e="size-selector"]')
-            if size_container:
-                radio_labels = await size_container.query_selector_all('label')
-                for label in radio_labels:
-                    size_name = await label.get_attribute("data-e2e") or (await label.text_content() or '').split()[0]
-                    size_options.append((size_name, ""))
-            else:
-                size_options = [("Standard", "")]
-
-        # 处理每个规格
-        for size_name, option_text in size_options:
-            try:
-                if select_element:
-                    await select_element.select_option(value=size_name)
-                else:
-                    label = await page.query_selector(f'label[data-e2e="{size_name}"]') or await page.query_selector(f'label:has-text("{size_name}")')
-                    if label:
-                        await label.click()
-
-                await page.wait_for_timeout(1000 + random.randint(500, 1500))
-                # 获取卡路里
-                calories_element = await page.query_selector('div[class*="auxiliaryProductInfoFont"] span[data-e2e="calories"]') or await page.query_selector('span[data-e2e="calories"]') or await page.query_selector('div:has-text("Calories") + div')
-                calories = await calories_element.text_content() if calories_element else "N/A"
-
-                results.append({
-                    "category": category,
-                    "product_name": product_name,
-                    "size": size_name,
-                    "calories": calories.strip() if calories else "N/A",
-                    "price": "soldout",
-                    "url": product_url
-                })
-            except Exception as e:
-                print(f"规格{size_name}处理失败：{str(e)}（跳过）")
-                continue
-        return results
-    except Exception as e:
-        log_error(f"获取售罄产品信息失败: {str(e)}")
-        return [{
+    bind_context(phase='add_to_cart')
+    size_calories_map = await add_sizes_to_cart(page, {'name': product_name, 'url': product_url})
+
+    # 从购物车提取价格
+    bind_context(phase='cart_read')
+    cart_items = await read_cart_items(page)
+    product_key = normalize_name(product_name)
+    for item in cart_items:
+        # 只认本产品的条目：上一个产品遗留在购物车中的条目不能算到当前产品头上
+        if normalize_name(item['name']) != product_key and product_key not in normalize_name(item['text']):
+            log_error(f"购物车条目不属于当前产品，已忽略: {(item.get('text') or '').strip()[:80]}",
+                      phase='cart_read')
+            continue
+        size_name_matched = match_size(item['size_text'], size_calories_map.keys())
+        price = item['price'] or "N/A"
+
+        results.append({
             "category": category,
             "product_name": product_name,
-            "size": "Standard",
-            "calories": "N/A",
-            "price": "soldout",
+            "size": size_name_matched,
+            "calories": size_calories_map.get(size_name_matched, "N/A"),
+            "price": price.strip(),
             "url": product_url
-        }]
+        })
+    return results
 
-async def get_product_sizes(page: Page, product_name, product_url, category):
-    """获取正常产品的规格信息"""
-    results = []
-    size_calories_map = {}
+FIELDNAMES = ['category', 'product_name', 'size', 'calories', 'price', 'url']
+
+
+async def open_product_page(page: Page, product, history=None):
+    """打开产品页、等待加购按钮并检查售罄（单产品与批量路径共用），返回 (是否售罄, 指纹未变时复用的规格行)
+
+    按钮一直不出现视为页面结构问题，抛出 SelectorMissingError（不重试）
+    """
+    with span('product_goto'):
+        bind_context(phase='product_goto')
+        await gated_goto(page, product['url'], timeout=60000, wait_until="domcontentloaded")
+        try:
+            await page.wait_for_selector('button[data-e2e="add-to-order-button"]', timeout=30000)
+        except PlaywrightTimeoutError as e:
+            raise SelectorMissingError("产品页未出现 Add to order 按钮") from e
+
+    with span('sold_out_check'):
+        bind_context(phase='sold_out_check')
+        sold_out = bool(await page.query_selector('text=/sold out/i'))
+    reused = None
+    if history:
+        with span('fingerprint'):
+            bind_context(phase='fingerprint')
+            reused = await history.reuse_if_unchanged(page, product, sold_out)
+    return sold_out, reused
+
+
+async def scrape_product(slot: PageSlot, product, price_mode='cart', history=None):
+    """用槽位中复用的标签页爬取单个产品，返回规格行列表
+
+    price_mode='network' 时优先从页面接口响应读取价格，读取失败再回退到购物车路径；
+    提供 history 且开启 skip_unchanged 时，页面指纹与上次一致的产品直接沿用历史中的当前版本
+    """
+    with span('product_tab_open'):
+        new_page = await slot.acquire()
+    healthy = False
+    cart_touched = False
+    capture = None
+    if price_mode == 'network':
+        capture = ResponseCapture(new_page)
+        capture.start()
     try:
-        # 获取规格选项
-        size_options = []
-        select_element = await page.query_selector('select[data-e2e="size-selector"]')
-        if select_element:
-            options = await select_element.query_selector_all('option:not([disabled]):not([value=""])')
-            for option in options:
-                size_options.append((await option.get_attribute('value'), await option.text_content() or ''))
-        else:
-            size_container = await page.query_selector('form[data-e2e="size-selector"]')
-            if size_container:
-                radio_labels = await size_container.query_selector_all('label')
-                for label in radio_labels:
-                    size_name = await label.get_attribute("data-e2e") or (await label.text_content() or '').split()[0]
-                    size_options.append((size_name, ""))
-            else:
-                size_options = [("Standard", "")]
-
-        # 处理规格并添加到购物车
-        for size_name, option_text in size_options:
-            try:
-                if select_element:
-                    await select_element.select_option(value=size_name)
-                else:
-                    label = await page.query_selector(f'label[data-e2e="{size_name}"]') or await page.query_selector(f'label:has-text("{size_name}")')
-                    if label:
-                        await label.click()
-
-                await page.wait_for_timeout(2000 + random.randint(500, 1500))
-                # 获取卡路里
-                calories_element = await page.query_selector('div[class*="auxiliaryProductInfoFont"] span[data-e2e="calories"]') or await page.query_selector('span[data-e2e="calories"]') or await page.query_selector('div:has-text("Calories") + div')
-                calories = await calories_element.text_content() if calories_element else "N/A"
-                size_calories_map[size_name] = calories.strip() if calories else "N/A"
-
-                # 添加到购物车
-                add_btn = await page.query_selector('button[data-e2e="add-to-order-button"]') or await page.query_selector('button:has-text("Add to order")')
-                if add_btn:
-                    await add_btn.click()
-                    await page.wait_for_timeout(2000)
-                    # 关闭弹窗
-                    close_btn = await page.query_selector('button[aria-label="Close"]')
-                    if close_btn:
-                        await close_btn.click()
-                        await page.wait_for_timeout(1000)
-                else:
-                    print("未找到Add to order按钮，跳过当前规格")
-                    continue
-            except Exception as e:
-                print(f"规格{size_name}处理失败：{str(e)}（跳过）")
-                continue
-
-        # 从购物车提取价格
-        await page.goto("https://www.starbucks.com/menu/cart", timeout=60000, wait_until="domcontentloaded")
-        for sel in ['h1:has-text("Your Order")', 'div[data-e2e="cart-container"]']:
-            try:
-                await page.wait_for_selector(sel, timeout=10000)
-                break
-            except:
-                continue
-        await page.wait_for_timeout(3000)
-
-        # 提取价格
-        cart_items = await page.query_selector_all('div[data-e2e="cart-item"]') or await page.query_selector_all('div[class*="cart-item"]')
-        for item in cart_items:
-            size_element = await item.query_selector('div[data-e2e="option-price-line"] p') or await item.query_selector('div[data-e2e="cart-item-size"]')
-            size_text = await size_element.text_content() if size_element else "N/A"
-            # 匹配规格名称
-            size_name_matched = "Standard"
-            for key in size_calories_map.keys():
-                if key.lower() in size_text.lower():
-                    size_name_matched = key
-                    break
-            # 获取价格
-            price_element = None
-            for sel in ['span[data-e2e="cart-item-price"]', 'div[class*="price"] span']:
-                price_element = await item.query_selector(sel)
-                if price_element:
-                    break
-            price = await price_element.text_content() if price_element else "N/A"
-
-            results.append({
-                "category": category,
-                "product_name": product_name,
-                "size": size_name_matched,
-                "calories": size_calories_map.get(size_name_matched, "N/A"),
-                "price": price.strip(),
-                "url": product_url
-            })
+        sold_out, results = await open_product_page(new_page, product, history)
+        if results:
+            healthy = True
+            return results
+        if sold_out:
+            results = await get_sold_out_product_sizes(new_page, product['name'], product['url'], product['category'])
+            healthy = True
+            return results
+
+        if capture:
+            bind_context(phase='network_price')
+            results = await get_product_sizes_from_network(capture, product['name'], product['url'], product['category'])
+            if results:
+                healthy = True
+                return results
+            print(f"接口响应中未取到完整价格，回退购物车路径: {product['name']}")
+
+        cart_touched = True
+        results = await get_product_sizes(new_page, product['name'], product['url'], product['category'])
+        healthy = True
         return results
-    except Exception as e:
-        log_error(f"获取产品规格失败: {str(e)}")
-        return []
+    finally:
+        if capture:
+            capture.stop()
+        # 仅加过购的产品需要清理购物车；中途出错也要清空，否则遗留条目会随上下文带给下一个产品并存入会话状态
+        if cart_touched:
+            bind_context(phase='clear_cart')
+            await clear_cart(new_page)
+        await slot.release(new_page, healthy)
 
-async def scrape_products_in_category(page: Page, category, progress_bar: tqdm = None,
-                                          csv_filename: str = 'starbucks_products.csv'):
-    """从类别爬取单个产品"""
+
+async def product_worker(worker_id, slot: PageSlot, queue: asyncio.Queue, progress_bar: tqdm,
+                         writer: OutputWriter, price_mode='cart', batch_size=1, state=None, fast_path=None,
+                         history=None):
+    """worker：从共享队列取产品并爬取，直到队列为空
+
+    batch_size > 1（仅 cart 模式）时每次取K个产品共用一次购物车读取；
+    提供 fast_path 时先尝试无浏览器HTTP抓取，提取不到的产品才走 Playwright
+    """
+    # cart_batch 依赖本模块的加购/读购物车函数，这里延迟导入避免循环引用
+    from cart_batch import take_batch, scrape_product_batch
+
+    while True:
+        batch = take_batch(queue, batch_size if price_mode == 'cart' else 1)
+        if not batch:
+            return
+        # 日志与计时上下文：本批内的记录都归到批内第一个产品及其类别
+        bind_context(product=batch[0]['name'], category=batch[0]['category'], phase='product')
+        try:
+            if progress_bar is None:
+                print(f"[worker {worker_id}] 爬取产品: {', '.join(p['name'] for p in batch)}")
+
+            rows_by_url = {}
+            browser_batch = batch
+            if fast_path:
+                for product in batch:
+                    rows_by_url[product['url']] = await fast_path.scrape_product(product)
+                browser_batch = [p for p in batch if not rows_by_url[p['url']]]
+
+            if len(browser_batch) == 1:
+                rows_by_url[browser_batch[0]['url']] = await scrape_product(slot, browser_batch[0], price_mode, history)
+            elif browser_batch:
+                rows_by_url.update(await scrape_product_batch(slot, browser_batch, history))
+            for product in batch:
+                rows = rows_by_url.get(product['url'], [])
+                # 批量模式下单个产品的异常以异常对象返回
+                if isinstance(rows, Exception) or not rows:
+                    error = rows if isinstance(rows, Exception) else EmptyResultError("未提取到任何规格")
+                    record_failure(state, product, error, getattr(error, 'phase', None) or current_context().get('phase'))
+                    continue
+                if state:
+                    # 先落库再提交输出：恢复时输出会由状态库重建，不会出现重复行
+                    state.mark_product_done(product['url'], rows)
+                await writer.write(rows)
+            await jitter.pause()
+        except Exception as e:
+            record_timeout(batch[0]['url'], e)
+            phase = current_context().get('phase')
+            for product in batch:
+                record_failure(state, product, e, phase)
+        finally:
+            for product in batch:
+                if progress_bar is not None:
+                    progress_bar.set_description(f"产品: {product['name'][:20]}...")
+                    progress_bar.update(1)
+                queue.task_done()
+            if progress_bar is not None and rate_status():
+                progress_bar.set_postfix_str(rate_status())
+            record_product(len(batch))
+
+
+async def scrape_products_in_category(page: Page, category, writer: OutputWriter, progress_bar: tqdm = None,
+                                          concurrency: int = 1,
+                                          price_mode: str = 'cart', batch_size: int = 1, state=None,
+                                          fast_path=None, pool: PagePool = None, history=None):
+    """从类别并发爬取产品
+
+    每个worker使用标签页池中的一个槽位（独立的BrowserContext和购物车），
+    避免 get_product_sizes / clear_cart 之间互相串价；未传入 pool 时为本类别临时创建
+    """
     try:
         category_name = category['full_category']
+        bind_context(category=category_name, phase='category')
         print(f"\n===== 开始爬取类别: {category_name} =====")
 
-        await category['element'].scroll_into_view_if_needed()
-        await page.wait_for_timeout(1500)
-
-        # 获取产品链接
-        product_list = await category['element'].query_selector('ul.grid.grid--compactGutter')
-        if not product_list:
-            print(f"在{category_name}下未找到产品网格")
-            return False
-
-        product_links = []
-        product_items = await product_list.query_selector_all('li.gridItem')
-        for item in product_items:
-            link = await item.query_selector('a.prodTile[href^="/menu/product/"]') or await item.query_selector('a.block.linkOverlay__primary[href^="/menu/product/"]')
-            if link:
-                href = await link.get_attribute('href')
-                product_name = await link.get_attribute('data-e2e')
-                if not product_name:
-                    hidden_span = await link.query_selector('span.hiddenVisually')
-                    product_name = await hidden_span.text_content() if hidden_span else href.split('/')[-2].replace('-', ' ').title()
-                product_links.append({
-                    'name': product_name.strip(),
-                    'url': f"https://www.starbucks.com{href}",
-                    'category': category_name
-                })
+        # 优先使用类别树索引中已收集的产品链接，否则从类别元素中提取
+        product_links = category.get('products')
+        if product_links is None:
+            await category['element'].scroll_into_view_if_needed()
+            await wait_for_grid_ready(page, category['id'])
+            product_links = await get_category_products(category['element'], category_name)
+            if not product_links:
+                print(f"在{category_name}下未找到产品网格")
+                return False
 
         print(f"在{category_name}下找到{len(product_links)}个产品")
+        if state:
+            product_links = state.pending_products(product_links)
+            print(f"其中未完成的产品: {len(product_links)}")
+            if not product_links:
+                state.mark_category_done(category['id'])
+                return True
 
-        # 爬取每个产品
-        fieldnames = ['category', 'product_name', 'size', 'calories', 'price', 'url']
+        # 构建共享产品队列
+        queue = asyncio.Queue()
         for product in product_links:
-            try:
-                if progress_bar:
-                    progress_bar.set_description(f"产品: {product['name'][:20]}...")
-                    progress_bar.update(1)
-                else:
-                    print(f"爬取产品: {product['name']}")
-
-                # 新标签页打开产品
-                context = page.context
-                new_page = await context.new_page()
-                await new_page.goto(product['url'], timeout=60000, wait_until="domcontentloaded")
-                await new_page.wait_for_selector('button[data-e2e="add-to-order-button"]', timeout=30000)
-
-                # 检查售罄
-                sold_out = await new_page.query_selector('text=/sold out/i')
-                if sold_out:
-                    results = await get_sold_out_product_sizes(new_page, product['name'], product['url'], product['category'])
-                else:
-                    results = await get_product_sizes(new_page, product['name'], product['url'], product['category'])
-                    await clear_cart(new_page)  # 仅正常产品需要清理购物车
-
-                # 写入CSV
-                with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    for result in results:
-                        writer.writerow(result)
-
-                await new_page.close()
-                await page.wait_for_timeout(1000)
-            except Exception as e:
-                log_error(f"产品{product['name']}爬取失败: {str(e)} | URL: {product['url']}")
-                continue
+            queue.put_nowait(product)
+
+        # 每个worker一个池槽位：单worker且无池时复用当前上下文
+        worker_count = max(1, min(concurrency, len(product_links)))
+        owned_pool = None
+        if pool is None:
+            browser = page.context.browser
+            shared_context = page.context if worker_count == 1 or browser is None else None
+            owned_pool = pool = PagePool(browser, worker_count, shared_context=shared_context)
+
+        try:
+            if owned_pool:
+                await owned_pool.start()
+            await asyncio.gather(*(
+                product_worker(slot.index, slot, queue, progress_bar, writer, price_mode, batch_size, state, fast_path,
+                               history)
+                for slot in pool.slots[:worker_count]
+            ))
+        finally:
+            if owned_pool:
+                await owned_pool.close()
 
+        if state:
+            state.mark_category_done(category['id'])
         print(f"===== 类别 {category_name} 爬取完成 =====")
         return True
     except Exception as e:
+        record_timeout(site_url("/menu"), e)
         log_error(f"爬取类别 {category_name} 失败: {str(e)}")
         return False
\ No newline at end of file
@@ -0,0 +1,235 @@
+import asyncio
+import time
+from urllib.parse import urlparse
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
+
+# 视为"站点在限流或过载"的响应状态码
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """单个主机的令牌桶：按 rate（次/秒）补充令牌，最多积累 capacity 个"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RateController:
+    """中心调度：每个主机一个令牌桶，所有导航和点击共享一个 AIMD 并发上限
+
+    成功且响应快时加性增加速率和并发上限；超时、429/5xx 时乘性减小（冷却期内只减一次）；
+    响应变慢（超过 latency_target）时小幅降低速率
+    """
+
+    def __init__(self, enabled=True, initial_rate=4.0, min_rate=0.2, max_rate=20.0, max_concurrency=3,
+                 latency_target=5.0, increase_step=0.5, decrease_factor=0.5, cooldown=2.0):
+        self.enabled = enabled
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.buckets = {}
+        self.successes = 0
+        self.slow = 0
+        self.failures = {}
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    def bucket(self, host):
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.initial_rate, capacity=max(1.0, self.initial_rate))
+        return self.buckets[host]
+
+    async def enter(self, host):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < max(1, int(self.limit)))
+            self.in_flight += 1
+        try:
+            await self.bucket(host).acquire()
+        except BaseException:
+            # 等令牌时被取消（如worker超时）要归还并发名额，否则在途数只增不减
+            async with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+            raise
+
+    async def exit(self, host, latency, failure=None):
+        """释放许可并反馈结果；latency 为 None 的许可（页面内的长循环）不参与延迟和成功反馈"""
+        async with self.condition:
+            self.in_flight -= 1
+            if failure:
+                self._on_failure(host, failure)
+            elif latency is None:
+                pass
+            elif latency > self.latency_target:
+                self.slow += 1
+                bucket = self.bucket(host)
+                bucket.rate = max(self.min_rate, bucket.rate * 0.9)
+            else:
+                self._on_success(host)
+            self.condition.notify_all()
+
+    def _on_success(self, host):
+        self.successes += 1
+        bucket = self.bucket(host)
+        bucket.rate = min(self.max_rate, bucket.rate + self.increase_step)
+        bucket.capacity = max(1.0, bucket.rate)
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def _on_failure(self, host, reason):
+        self.failures[reason] = self.failures.get(reason, 0) + 1
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        bucket = self.bucket(host)
+        bucket.rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+        bucket.capacity = max(1.0, bucket.rate)
+        bucket.tokens = min(bucket.tokens, bucket.capacity)
+        self.limit = max(1.0, self.limit * self.decrease_factor)
+
+    def metrics(self):
+        return {
+            'rates': {host: round(bucket.rate, 2) for host, bucket in self.buckets.items()},
+            'concurrency_limit': round(self.limit, 2),
+            'in_flight': self.in_flight,
+            'successes': self.successes,
+            'slow': self.slow,
+            'failures': dict(self.failures),
+        }
+
+    def status_text(self):
+        rate = sum(bucket.rate for bucket in self.buckets.values())
+        return f"速率 {rate:.1f}/s 并发 {self.in_flight}/{int(self.limit)}"
+
+
+controller = RateController(enabled=False)
+
+
+def configure_rate_control(enabled=True, max_concurrency=3, **options):
+    """设置本次运行的全局调度器（之后的导航和点击都经过它）"""
+    global controller
+    controller = RateController(enabled=enabled, max_concurrency=max(1, max_concurrency), **options)
+    return controller
+
+
+def _host(target):
+    """target 可以是URL或页面对象（点击按页面当前URL的主机计）"""
+    url = target if isinstance(target, str) else target.url
+    return urlparse(url).hostname or ''
+
+
+class _Gate:
+    __slots__ = ('controller', 'host', 'measure', 'started', 'status')
+
+    def __init__(self, controller, host, measure=True):
+        self.controller = controller
+        self.host = host
+        self.measure = measure
+        self.status = None
+
+    async def __aenter__(self):
+        await self.controller.enter(self.host)
+        self.started = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        failure = None
+        # Playwright 的超时和 HTTP 客户端（快速路径）的 asyncio 超时都计为超时
+        if exc_type is not None and issubclass(exc_type, (PlaywrightTimeoutError, asyncio.TimeoutError)):
+            failure = 'timeout'
+            exc.rate_counted = True
+        elif self.status in THROTTLE_STATUSES:
+            failure = f"http_{self.status}"
+        latency = time.monotonic() - self.started if self.measure else None
+        await self.controller.exit(self.host, latency, failure)
+        return False
+
+
+class _OpenGate:
+    __slots__ = ('status',)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def throttle(target, measure=True):
+    """导航或点击前获取许可：async with throttle(page): await button.click()
+
+    measure=False 用于包含多次操作和等待的长许可：耗时不代表站点响应速度，不用来调整速率
+    """
+    if not controller.enabled:
+        return _OpenGate()
+    return _Gate(controller, _host(target), measure)
+
+
+async def gated_goto(page: Page, url, **kwargs):
+    """经调度器的 page.goto，响应状态码参与速率调整"""
+    async with throttle(url) as gate:
+        response = await page.goto(url, **kwargs)
+        gate.status = response.status if response else None
+    return response
+
+
+def record_timeout(target, error):
+    """调用方捕获的异常若是超时（如等待元素超时）也反馈给调度器；已在导航/点击时计过的不重复计"""
+    if not controller.enabled or not isinstance(error, PlaywrightTimeoutError):
+        return
+    if getattr(error, 'rate_counted', False):
+        return
+    error.rate_counted = True
+    controller._on_failure(_host(target), 'timeout')
+
+
+def rate_status():
+    """进度条上显示的当前速率和在途数，未启用时为空"""
+    return controller.status_text() if controller.enabled else ''
+
+
+def rate_gauges():
+    """供 Prometheus 导出的当前指标"""
+    if not controller.enabled:
+        return {}
+    stats = controller.metrics()
+    return {
+        'rate_limit_requests_per_second': sum(stats['rates'].values()),
+        'rate_concurrency_limit': stats['concurrency_limit'],
+        'rate_in_flight': stats['in_flight'],
+        'rate_failures_total': sum(stats['failures'].values()),
+    }
+
+
+def print_rate_report():
+    if not controller.enabled:
+        return
+    stats = controller.metrics()
+    print("\n===== 速率调度统计 =====")
+    print(f"最终速率: {stats['rates']} 并发上限: {stats['concurrency_limit']} "
+          f"成功: {stats['successes']} 变慢: {stats['slow']} 失败: {stats['failures']}")
\ No newline at end of file
@@ -0,0 +1,138 @@
+from collections import Counter
+from urllib.parse import urlparse
+from playwright.async_api import BrowserContext, Route, Response
+
+# 站点自身域名（aggressive 模式下只放行这些域名）
+FIRST_PARTY_DOMAINS = ['starbucks.com', 'starbucksassets.com']
+
+# 常见分析/广告/埋点域名
+TRACKER_DOMAINS = [
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googleadservices.com',
+    'facebook.net', 'facebook.com', 'hotjar.com', 'optimizely.com', 'newrelic.com', 'nr-data.net',
+    'demdex.net', 'omtrdc.net', 'adobedtm.com', 'branch.io', 'segment.io', 'quantummetric.com',
+    'tiktok.com', 'bat.bing.com', 'pinterest.com', 'criteo.com', 'snapchat.com', 'twitter.com',
+]
+
+# 拦截策略：从激进到保守；safe 只拦截图片和媒体，保证加购和购物车流程不受影响
+ROUTING_PROFILES = {
+    'aggressive': {
+        'block_types': {'image', 'media', 'font', 'texttrack', 'manifest'},
+        'deny_domains': TRACKER_DOMAINS,
+        'first_party_only': True,
+    },
+    'balanced': {
+        'block_types': {'image', 'media', 'font'},
+        'deny_domains': TRACKER_DOMAINS,
+        'first_party_only': False,
+    },
+    'safe': {
+        'block_types': {'image', 'media'},
+        'deny_domains': [],
+        'first_party_only': False,
+    },
+    'off': {
+        'block_types': set(),
+        'deny_domains': [],
+        'first_party_only': False,
+    },
+}
+
+# 被拦截请求无法得知真实大小，按资源类型估算节省的字节数
+ESTIMATED_BYTES = {
+    'image': 80_000, 'media': 500_000, 'font': 40_000, 'texttrack': 5_000, 'manifest': 2_000,
+    'script': 60_000, 'xhr': 5_000, 'fetch': 5_000, 'ping': 500,
+}
+DEFAULT_ESTIMATED_BYTES = 10_000
+
+
+def _domain_matches(host, domains):
+    return any(host == d or host.endswith('.' + d) for d in domains)
+
+
+class RequestRouter:
+    """按资源类型和域名允许/拒绝列表拦截请求，并统计本次运行的拦截情况"""
+
+    def __init__(self, profile='off', allow_domains=None, deny_domains=None):
+        settings = ROUTING_PROFILES[profile]
+        self.profile = profile
+        self.block_types = set(settings['block_types'])
+        self.first_party_only = settings['first_party_only']
+        self.allow_domains = list(FIRST_PARTY_DOMAINS) + list(allow_domains or [])
+        self.deny_domains = list(settings['deny_domains']) + list(deny_domains or [])
+        self.blocked = 0
+        self.allowed = 0
+        self.bytes_saved = 0
+        self.bytes_received = 0
+        self.blocked_by = Counter()
+
+    @property
+    def enabled(self):
+        return bool(self.block_types or self.deny_domains or self.first_party_only)
+
+    def block_reason(self, url, resource_type):
+        """返回拦截原因，放行时返回None（允许列表中的域名只按资源类型判断）"""
+        host = urlparse(url).hostname or ''
+        if resource_type in self.block_types:
+            return f"type:{resource_type}"
+        if _domain_matches(host, self.allow_domains):
+            return None
+        if _domain_matches(host, self.deny_domains):
+            return "deny_domain"
+        if self.first_party_only and host:
+            return "third_party"
+        return None
+
+    async def install(self, context: BrowserContext):
+        if not self.enabled:
+            return
+        await context.route("**/*", self._handle_route)
+        context.on("response", self._on_response)
+
+    async def _handle_route(self, route: Route):
+        request = route.request
+        reason = self.block_reason(request.url, request.resource_type)
+        if reason:
+            self.blocked += 1
+            self.blocked_by[reason] += 1
+            self.bytes_saved += ESTIMATED_BYTES.get(request.resource_type, DEFAULT_ESTIMATED_BYTES)
+            await route.abort()
+        else:
+            self.allowed += 1
+            await route.continue_()
+
+    def _on_response(self, response: Response):
+        length = response.headers.get('content-length')
+        if length and length.isdigit():
+            self.bytes_received += int(length)
+
+    def report(self):
+        return {
+            'profile': self.profile,
+            'blocked': self.blocked,
+            'allowed': self.allowed,
+            'bytes_saved_estimated': self.bytes_saved,
+            'bytes_received': self.bytes_received,
+            'blocked_by': dict(self.blocked_by),
+        }
+
+
+router = RequestRouter()
+
+
+def configure_routing(profile, allow_domains=None, deny_domains=None):
+    """设置本次运行的全局拦截策略（之后创建的上下文都会安装）"""
+    global router
+    router = RequestRouter(profile, allow_domains, deny_domains)
+    return router
+
+
+def print_routing_report():
+    if not router.enabled:
+        return
+    stats = router.report()
+    print(f"\n===== 请求拦截统计（{stats['profile']}） =====")
+    print(f"拦截: {stats['blocked']} 放行: {stats['allowed']} "
+          f"估算节省: {stats['bytes_saved_estimated'] / 1024 / 1024:.1f}MB "
+          f"实际下载: {stats['bytes_received'] / 1024 / 1024:.1f}MB")
+    for reason, count in sorted(stats['blocked_by'].items(), key=lambda x: -x[1]):
+        print(f"  {reason}: {count}")
\ No newline at end of file
@@ -0,0 +1,33 @@
+from utils import configure_screenshots
+from page_handler import configure_site, site_host
+from waits import configure_jitter
+from request_router import configure_routing
+from rate_controller import configure_rate_control, rate_gauges
+from size_snapshot import configure_size_snapshot
+from instrumentation import configure_instrumentation, timing_report, print_timing_report, export_json, export_prometheus
+
+
+def configure_run(config, max_concurrency=None, rate_share=1):
+    """按完整的运行配置（DEFAULT_CONFIG 合并后）设置各模块的全局对象，主流程、分片进程和多门店模式共用
+
+    max_concurrency 为调度的并发上限（默认 config['concurrency']）；rate_share 为共用同一站点速率的进程数，
+    每个进程的速率按此均分。日志文件各模式不同，由调用方自行配置
+    """
+    configure_site(config['base_url'])
+    configure_jitter(*config['jitter_ms'])
+    configure_routing(config['routing_profile'], allow_domains=[site_host()])
+    configure_instrumentation(config['timing'], config['timing_samples'])
+    configure_screenshots(config['screenshot_interval_s'], config['screenshot_max'])
+    configure_rate_control(config['rate_control'], max_concurrency=max_concurrency or config['concurrency'],
+                           initial_rate=config['rate_initial'] / rate_share, max_rate=config['rate_max'] / rate_share)
+    configure_size_snapshot(config['size_snapshot'], config['size_snapshot_verify'])
+
+
+def export_timings(config, output_name):
+    """开启 timing 时输出本进程的阶段耗时报告，并导出 JSON 和 Prometheus textfile"""
+    if not config['timing']:
+        return
+    report = timing_report()
+    print_timing_report(report)
+    export_json(f"{output_name}_timings.json", report)
+    export_prometheus(f"{output_name}_timings.prom", report, gauges=rate_gauges())
\ No newline at end of file
@@ -0,0 +1,183 @@
+import re
+from collections import Counter
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
+from utils import log_error
+
+# 命名选择器及其备选（按声明顺序为初始优先级，运行中按命中次数重新排序）
+SELECTORS = {
+    'calories': ['div[class*="auxiliaryProductInfoFont"] span[data-e2e="calories"]', 'span[data-e2e="calories"]',
+                 'div:has-text("Calories") + div'],
+    'add_to_order_button': ['button[data-e2e="add-to-order-button"]', 'button:has-text("Add to order")'],
+    'decrease_quantity_button': ['button[data-e2e="decreaseQuantityButton"]', 'button[aria-label*="Decrease amount"]'],
+    'cart_item': ['div[data-e2e="cart-item"]', 'div[class*="cart-item"]'],
+    'cart_item_name': ['[data-e2e="cart-item-name"]', '[data-e2e="product-name"]', 'h3', 'h2'],
+    'cart_item_size': ['div[data-e2e="option-price-line"] p', 'div[data-e2e="cart-item-size"]'],
+    'cart_item_price': ['span[data-e2e="cart-item-price"]', 'div[class*="price"] span'],
+    'product_link': ['a.prodTile[href^="/menu/product/"]', 'a.block.linkOverlay__primary[href^="/menu/product/"]'],
+}
+
+HAS_TEXT_RE = re.compile(r'^(.*?):has-text\("(.*)"\)(?:\s*\+\s*(.+))?$')
+
+# 页面内按顺序尝试备选，返回 [命中的备选下标, 元素]，全部不匹配时为 [-1, null]
+# 备选为 {css, text, next}：text 不为空时要求元素文本包含该文本（对应 Playwright 的 :has-text，不区分大小写）；
+# next 不为空时取该元素紧邻的、匹配 next 的下一个兄弟元素（对应 css:has-text("...") + next），
+# 此时只看包含该文本的最内层元素，避免外层容器的兄弟被误选
+FIRST_MATCH_JS = """(root, alternatives) => {
+    for (let i = 0; i < alternatives.length; i++) {
+        const {css, text, next} = alternatives[i];
+        if (!text) {
+            const el = root.querySelector(css);
+            if (el) return [i, el];
+            continue;
+        }
+        const hasText = el => (el.textContent || '').toLowerCase().includes(text);
+        for (const el of root.querySelectorAll(css)) {
+            if (!hasText(el)) continue;
+            if (!next) return [i, el];
+            if (Array.from(el.querySelectorAll(css)).some(hasText)) continue;
+            const sibling = el.nextElementSibling;
+            if (sibling && sibling.matches(next)) return [i, sibling];
+        }
+    }
+    return [-1, null];
+}"""
+
+HIT_ATTRIBUTE = 'data-selector-hit'
+
+# 点击已解析元素的超时：页面重新渲染会丢掉标记，此时不应按 Playwright 默认的30秒等待
+CLICK_TIMEOUT_MS = 3000
+
+# 解析一个命名选择器：给命中的元素打上标记，供随后的 Playwright 操作直接定位
+RESOLVE_JS = f"""([name, alternatives]) => {{
+    const first = {FIRST_MATCH_JS};
+    for (const el of document.querySelectorAll(`[{HIT_ATTRIBUTE}="${{name}}"]`)) el.removeAttribute('{HIT_ATTRIBUTE}');
+    const [index, el] = first(document, alternatives);
+    if (el) el.setAttribute('{HIT_ATTRIBUTE}', name);
+    return index;
+}}"""
+
+READ_TEXT_JS = f"""(alternatives) => {{
+    const [index, el] = ({FIRST_MATCH_JS})(document, alternatives);
+    return [index, el ? el.textContent : null];
+}}"""
+
+
+def compile_alternative(selector):
+    """把 Playwright 的 css:has-text("...")（可带 + 兄弟选择器）写法编译为页面内可执行的 {css, text, next}"""
+    match = HAS_TEXT_RE.match(selector)
+    if match:
+        return {'selector': selector, 'css': match.group(1) or '*', 'text': match.group(2).lower(),
+                'next': match.group(3)}
+    return {'selector': selector, 'css': selector, 'text': None, 'next': None}
+
+
+class SelectorRegistry:
+    """命名选择器注册表：备选在一次页面内求值中依次尝试，统计每个备选的命中率并据此调整顺序"""
+
+    def __init__(self, definitions):
+        self.alternatives = {name: [compile_alternative(s) for s in selectors]
+                             for name, selectors in definitions.items()}
+        self.hits = {name: Counter() for name in definitions}
+        self.lookups = Counter()
+        self.misses = Counter()
+
+    def ordered(self, name):
+        """按命中次数从高到低排列的备选（次数相同时保持声明顺序）"""
+        hits = self.hits[name]
+        return sorted(self.alternatives[name], key=lambda alt: -hits[alt['selector']])
+
+    def selector_list(self, name):
+        """纯CSS备选列表（排序后），供页面内轮询等待使用"""
+        return [alt['selector'] for alt in self.ordered(name) if not alt['text']]
+
+    def record(self, name, alternatives, index):
+        """记录一次解析结果：index 为 alternatives 中命中的下标，-1 表示全部未命中"""
+        self.lookups[name] += 1
+        if index is None or index < 0:
+            self.misses[name] += 1
+        else:
+            self.hits[name][alternatives[index]['selector']] += 1
+
+    def report(self):
+        report = {}
+        for name, alternatives in self.alternatives.items():
+            lookups = self.lookups[name]
+            report[name] = {
+                'lookups': lookups,
+                'misses': self.misses[name],
+                'alternatives': [{
+                    'selector': alt['selector'],
+                    'hits': self.hits[name][alt['selector']],
+                    'hit_rate': round(self.hits[name][alt['selector']] / lookups, 3) if lookups else 0.0,
+                } for alt in self.ordered(name)],
+            }
+        return report
+
+
+registry = SelectorRegistry(SELECTORS)
+
+
+def selector_list(name):
+    return registry.selector_list(name)
+
+
+def page_alternatives(name):
+    """传入页面内脚本的备选（已排序）；脚本返回的命中下标交给 record_hits 统计"""
+    return registry.ordered(name)
+
+
+def record_hits(name, alternatives, indexes):
+    for index in indexes:
+        registry.record(name, alternatives, index)
+
+
+async def resolve(page: Page, name):
+    """一次页面内求值解析命名选择器，返回指向命中元素的标记选择器，全部未命中时返回None
+
+    标记在页面重新渲染后会丢失，点击请用 click_named（短超时并重新解析）
+    """
+    alternatives = registry.ordered(name)
+    index = await page.evaluate(RESOLVE_JS, [name, alternatives])
+    registry.record(name, alternatives, index)
+    return f'[{HIT_ATTRIBUTE}="{name}"]' if index >= 0 else None
+
+
+async def click_named(page: Page, name, timeout=CLICK_TIMEOUT_MS, retries=1):
+    """解析命名选择器并点击命中的元素，全部未命中时返回False
+
+    解析与点击之间页面重新渲染时标记随旧元素丢失，点击会在短超时后失败，这时重新解析再点；重试用尽仍超时则抛出
+    """
+    for attempt in range(retries + 1):
+        selector = await resolve(page, name)
+        if not selector:
+            return False
+        try:
+            await page.click(selector, timeout=timeout)
+            return True
+        except PlaywrightTimeoutError:
+            if attempt == retries:
+                raise
+    return False
+
+
+async def read_text(page: Page, name):
+    """读取命名选择器第一个命中元素的文本，全部未命中时返回None"""
+    alternatives = registry.ordered(name)
+    index, text = await page.evaluate(READ_TEXT_JS, alternatives)
+    registry.record(name, alternatives, index)
+    return text
+
+
+def print_selector_report():
+    """输出各选择器备选的命中率；有查询但从未命中的选择器多半是页面结构已变化"""
+    report = registry.report()
+    if not any(stats['lookups'] for stats in report.values()):
+        return
+    print("\n===== 选择器命中统计 =====")
+    for name, stats in report.items():
+        if not stats['lookups']:
+            continue
+        hit_rates = ' '.join(f"{alt['selector']}={alt['hit_rate']:.0%}" for alt in stats['alternatives'])
+        print(f"{name}: 查询={stats['lookups']} 未命中={stats['misses']} | {hit_rates}")
+        if stats['misses'] == stats['lookups']:
+            log_error(f"选择器 {name} 的所有备选均未命中，页面结构可能已变化", selector=name)
\ No newline at end of file
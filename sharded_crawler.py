@@ -0,0 +1,217 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import queue as queue_module
+from playwright.async_api import async_playwright
+from tqdm import tqdm
+from utils import log_error, configure_logging, flush_screenshots
+from page_handler import launch_browser, new_browser_context
+from category_tree import build_category_tree, build_full_menu_tree, dedupe_categories, dedupe_products
+from output_writer import OutputWriter, JsonlSink, build_sinks
+from run_setup import configure_run, export_timings
+from product_scraper import scrape_products_in_category, FIELDNAMES
+from page_pool import PagePool
+
+SHARD_DIR = 'shards'
+
+
+class QueueProgress:
+    """在worker进程内替代tqdm：把进度发回协调进程统一显示"""
+
+    def __init__(self, progress_queue, shard_id):
+        self.progress_queue = progress_queue
+        self.shard_id = shard_id
+
+    def update(self, n=1):
+        self.progress_queue.put(('progress', self.shard_id, n))
+
+    def set_description(self, desc):
+        pass
+
+    def set_postfix_str(self, text):
+        pass
+
+
+def load_url_list(path):
+    """从文件读取产品URL列表（每行一个URL），作为分片来源"""
+    products = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            url = line.strip()
+            if not url or url.startswith('#'):
+                continue
+            slug = url.rstrip('/').split('?')[0].split('/')
+            products.append({
+                'name': slug[-1].replace('-', ' ').title(),
+                'url': url,
+                'category': 'URL List'
+            })
+    return products
+
+
+async def discover_frontier(config, full_menu=False):
+    """启动一个浏览器遍历类别树，返回去重后的产品前沿"""
+    configure_run(config)
+    async with async_playwright() as p:
+        browser = await launch_browser(p, headless=config['headless'])
+        try:
+            page = await (await new_browser_context(browser)).new_page()
+            if full_menu:
+                categories = dedupe_categories(await build_full_menu_tree(page))
+            else:
+                tree = await build_category_tree(page, config['main_category'], config['second_category'])
+                categories = dedupe_categories([tree]) if tree else []
+                if config['third_category']:
+                    categories = [c for c in categories if config['third_category'] in c['name']]
+        finally:
+            await browser.close()
+    return [product for category in categories for product in category['products']]
+
+
+def read_done_urls(path):
+    """读取分片输出中已完成的产品URL（忽略崩溃时写坏的行）"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['url'])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+async def _run_shard(shard_id, products, out_path, progress_queue, config):
+    # 各分片进程各自调度，总速率上限按分片数均分
+    configure_run(config, rate_share=config['shard_count'])
+    # 每个分片进程写自己的日志文件，避免多进程同时轮转同一个文件
+    configure_logging(os.path.join(SHARD_DIR, f"errors_shard{shard_id}.jsonl"), fresh=False)
+
+    # 重新分配的分片：跳过上次已写出的产品
+    done_urls = read_done_urls(out_path)
+    pending = [p for p in products if p['url'] not in done_urls]
+    progress_queue.put(('reset', shard_id, len(products) - len(pending)))
+
+    writer = OutputWriter([JsonlSink(out_path)], batch_size=20, flush_interval=1.0)
+    await writer.start(fresh=False)
+    async with async_playwright() as p:
+        browser = await launch_browser(p, headless=config['headless'])
+        # 每个分片进程使用自己的会话目录，避免多个进程共用同一份 storage_state
+        session_dir = config['session_dir']
+        pool = await PagePool(browser, config['concurrency'], max_uses=config['page_max_uses'],
+                              memory_limit_mb=config['page_memory_limit_mb'],
+                              state_dir=os.path.join(session_dir, f"shard{shard_id}") if session_dir else None)
+        try:
+            await pool.start()
+            page = await (await new_browser_context(browser)).new_page()
+            shard_category = {'id': f"shard-{shard_id}", 'full_category': f"分片{shard_id}", 'products': pending}
+            await scrape_products_in_category(page, shard_category, writer, QueueProgress(progress_queue, shard_id),
+                                              concurrency=config['concurrency'],
+                                              price_mode=config['price_mode'],
+                                              batch_size=config['cart_batch_size'],
+                                              pool=pool)
+        finally:
+            await flush_screenshots()
+            await writer.close()
+            await pool.close()
+            await browser.close()
+            # 每个分片进程导出自己的耗时报告（shards/<输出名>_shard<i>_timings.*）
+            export_timings(config, os.path.splitext(out_path)[0])
+
+
+def run_shard(shard_id, products, out_path, progress_queue, config):
+    """worker进程入口：独立的事件循环、async_playwright 实例和浏览器上下文"""
+    asyncio.run(_run_shard(shard_id, products, out_path, progress_queue, config))
+
+
+def merge_shard_outputs(paths, output_name, sinks):
+    """合并所有分片输出，按 (url, size) 去重后写入最终输出目标"""
+    rows = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                rows.setdefault((row['url'], row['size']), row)
+
+    async def write_all():
+        writer = OutputWriter(build_sinks(sinks, output_name, FIELDNAMES))
+        await writer.start(fresh=True)
+        await writer.write(list(rows.values()))
+        await writer.close()
+
+    asyncio.run(write_all())
+    return len(rows)
+
+
+def run_sharded_crawl(products, shard_count, output_name, config, max_attempts=3):
+    """协调进程：把产品前沿切分为分片，每个分片一个worker进程，汇总进度，崩溃时只重新分配该分片"""
+    # 按产品标识去重（同一产品在不同类别下的URL只有 ?parent= 不同），保留首次出现
+    products = dedupe_products(products)
+    shard_count = max(1, min(shard_count, len(products)))
+    shards = [products[i::shard_count] for i in range(shard_count)]
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    out_paths = [os.path.join(SHARD_DIR, f"{output_name}_shard{i}.jsonl") for i in range(shard_count)]
+    for path in out_paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+    config = dict(config, shard_count=shard_count)
+    mp = multiprocessing.get_context('spawn')
+    progress_queue = mp.Queue()
+    attempts = [0] * shard_count
+    done = [0] * shard_count
+    processes = {}
+
+    def start(shard_id):
+        attempts[shard_id] += 1
+        process = mp.Process(target=run_shard, name=f"shard-{shard_id}",
+                             args=(shard_id, shards[shard_id], out_paths[shard_id], progress_queue, config))
+        process.start()
+        processes[shard_id] = process
+
+    def drain(timeout):
+        try:
+            kind, shard_id, value = progress_queue.get(timeout=timeout)
+        except queue_module.Empty:
+            return False
+        if kind == 'reset':
+            done[shard_id] = value
+        else:
+            done[shard_id] += value
+        progress_bar.n = sum(done)
+        progress_bar.set_postfix_str(' '.join(f"#{i}:{d}/{len(s)}" for i, (d, s) in enumerate(zip(done, shards))))
+        return True
+
+    print(f"共 {len(products)} 个产品，切分为 {shard_count} 个分片")
+    progress_bar = tqdm(total=len(products), desc="总体进度", position=0, leave=True)
+    for shard_id in range(shard_count):
+        start(shard_id)
+
+    while processes:
+        drain(0.5)
+        for shard_id, process in list(processes.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del processes[shard_id]
+            if process.exitcode == 0:
+                continue
+            if attempts[shard_id] < max_attempts:
+                log_error(f"分片{shard_id}进程异常退出（exitcode={process.exitcode}），重新分配")
+                start(shard_id)
+            else:
+                log_error(f"分片{shard_id}已重试{max_attempts}次仍失败，放弃")
+    while drain(0.1):
+        pass
+    progress_bar.close()
+
+    total_rows = merge_shard_outputs(out_paths, output_name, config['output_sinks'])
+    print(f"分片爬取完成，合并去重后共 {total_rows} 行，已保存到 {output_name}")
+    return total_rows
\ No newline at end of file
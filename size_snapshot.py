@@ -0,0 +1,144 @@
+import re
+from playwright.async_api import Page
+from utils import log_error
+from selector_registry import FIRST_MATCH_JS, page_alternatives, record_hits
+from network_capture import product_size_records
+
+# 页面水合后挂在 window 上的状态对象（与 fast_path 中解析的服务端嵌入状态对应）
+STATE_KEYS = ['__INITIAL_STATE__', '__PRELOADED_STATE__', '__BOOTSTRAP__', '__APOLLO_STATE__']
+
+# 一次页面内求值读取：所有规格选项（含 data-calories 属性）、当前选中规格及其卡路里（按 calories 备选）、水合状态
+SNAPSHOT_JS = f"""([calorieAlternatives, stateKeys]) => {{
+    const sizes = [];
+    let selected = null;
+    const select = document.querySelector('select[data-e2e="size-selector"]');
+    if (select) {{
+        selected = select.value;
+        for (const option of select.querySelectorAll('option:not([disabled]):not([value=""])')) {{
+            sizes.push({{name: option.value, calories: option.getAttribute('data-calories')}});
+        }}
+    }} else {{
+        const form = document.querySelector('form[data-e2e="size-selector"]');
+        if (form) {{
+            const checked = form.querySelector('input:checked');
+            for (const label of form.querySelectorAll('label')) {{
+                const name = label.getAttribute('data-e2e') || (label.textContent || '').trim().split(/\\s+/)[0];
+                if (!name) continue;
+                sizes.push({{name, calories: label.getAttribute('data-calories')}});
+                if (checked && (label.contains(checked) || label.htmlFor === checked.id)) selected = name;
+            }}
+        }}
+    }}
+    const [renderedIndex, renderedEl] = ({FIRST_MATCH_JS})(document, calorieAlternatives);
+    const rendered = renderedEl ? renderedEl.textContent : null;
+    const states = [];
+    const nextData = document.getElementById('__NEXT_DATA__');
+    if (nextData) {{
+        try {{ states.push(JSON.parse(nextData.textContent)); }} catch (e) {{}}
+    }}
+    for (const key of stateKeys) {{
+        try {{
+            if (window[key]) states.push(JSON.parse(JSON.stringify(window[key])));
+        }} catch (e) {{}}
+    }}
+    return {{hasSelector: !!(select || document.querySelector('form[data-e2e="size-selector"]')),
+            sizes, selected, rendered, renderedIndex, states}};
+}}"""
+
+
+def _clean(text):
+    text = (text or '').strip()
+    return text or None
+
+
+def calories_number(text):
+    """卡路里文本中的数值部分（"190 calories" 与 "190" 视为相同）"""
+    numbers = re.findall(r'\d+(?:\.\d+)?', text or '')
+    return numbers[0] if numbers else None
+
+
+class SizeExtractor:
+    """单次快照读取规格和卡路里，只对页面按需渲染的值才切换规格，并统计两种路径的命中与不一致"""
+
+    def __init__(self, enabled=True, verify=False):
+        self.enabled = enabled
+        self.verify = verify
+        self.snapshot_hits = 0
+        self.switches = 0
+        self.verified = 0
+        self.mismatches = 0
+
+    async def snapshot(self, page: Page, product=None):
+        """返回 {'sizes': [规格名], 'calories': {规格名: 卡路里或None}, 'selected': 当前规格}
+
+        没有规格选择器的产品视为单一规格 Standard，取页面当前显示的卡路里；
+        水合状态只取当前产品（product，缺省按页面URL识别）节点的规格，推荐等其他产品不参与
+        """
+        alternatives = page_alternatives('calories')
+        raw = await page.evaluate(SNAPSHOT_JS, [alternatives, STATE_KEYS])
+        record_hits('calories', alternatives, [raw['renderedIndex']])
+        rendered = _clean(raw['rendered'])
+        if not raw['hasSelector']:
+            return {'sizes': ['Standard'], 'calories': {'Standard': rendered}, 'selected': 'Standard'}
+
+        sizes = [s['name'] for s in raw['sizes']]
+        calories = dict.fromkeys(sizes)
+        if self.enabled:
+            state_calories = {}
+            product = product or {'url': page.url}
+            for state in raw['states']:
+                for size_name, record in product_size_records(state, product).items():
+                    if record['calories'] is not None:
+                        state_calories.setdefault(size_name.lower(), record['calories'])
+            for size in raw['sizes']:
+                calories[size['name']] = _clean(size['calories']) or state_calories.get(size['name'].lower())
+            # 当前选中规格的渲染值无需切换即可读取：快照缺值时补上，有值时核对，不一致以页面显示为准
+            selected = raw['selected']
+            if selected in calories and rendered:
+                if calories[selected] is None or not self.compare(selected, calories[selected], rendered):
+                    calories[selected] = rendered
+        elif raw['selected'] in calories:
+            calories[raw['selected']] = rendered
+        self.snapshot_hits += sum(1 for value in calories.values() if value is not None)
+        return {'sizes': sizes, 'calories': calories, 'selected': raw['selected']}
+
+    def needs_render(self, snapshot, size_name):
+        """该规格的卡路里是否需要切换规格后从页面读取"""
+        return self.verify or snapshot['calories'].get(size_name) is None
+
+    def compare(self, size_name, snapshot_value, rendered_value):
+        """核对快照值与切换规格后的渲染值，不一致时记录日志，返回是否一致"""
+        self.verified += 1
+        if calories_number(snapshot_value) == calories_number(rendered_value):
+            return True
+        self.mismatches += 1
+        log_error(f"规格{size_name}卡路里不一致: 快照={snapshot_value} 页面={rendered_value}",
+                  phase='size_snapshot', size=size_name)
+        return False
+
+    def report(self):
+        return {
+            'enabled': self.enabled,
+            'snapshot_hits': self.snapshot_hits,
+            'switches': self.switches,
+            'verified': self.verified,
+            'mismatches': self.mismatches,
+        }
+
+
+extractor = SizeExtractor()
+
+
+def configure_size_snapshot(enabled=True, verify=False):
+    """设置全局规格提取方式：enabled=False 时逐个切换规格读取，verify=True 时每个规格都切换并核对快照"""
+    extractor.enabled = enabled
+    extractor.verify = verify
+
+
+def print_size_report():
+    stats = extractor.report()
+    if not (stats['snapshot_hits'] or stats['switches']):
+        return
+    print("\n===== 规格提取统计 =====")
+    print(f"快照命中: {stats['snapshot_hits']} 切换规格读取: {stats['switches']} "
+          f"核对: {stats['verified']} 不一致: {stats['mismatches']}")
\ No newline at end of file
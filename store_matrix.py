@@ -0,0 +1,153 @@
+import asyncio
+import csv
+import os
+import time
+from playwright.async_api import async_playwright
+from tqdm import tqdm
+from utils import log_error, configure_logging, shutdown_logging, flush_screenshots
+from page_handler import launch_browser
+from request_router import print_routing_report
+from rate_controller import print_rate_report
+from run_setup import configure_run, export_timings
+from selector_registry import print_selector_report
+from product_scraper import scrape_products_in_category, FIELDNAMES
+from category_tree import dedupe_products
+from output_writer import OutputWriter, build_sinks
+from price_history import PriceHistory, HistorySink, print_history_report
+from page_pool import PagePool, print_pool_report
+
+STORE_FIELDNAMES = FIELDNAMES + ['store']
+MATRIX_KEY_FIELDS = ['category', 'product_name', 'size', 'url']
+
+
+def parse_store_list(value):
+    """解析门店编号列表：逗号分隔，或 @文件路径（每行一个编号）"""
+    if value.startswith('@'):
+        with open(value[1:], encoding='utf-8') as f:
+            items = [line.strip() for line in f]
+    else:
+        items = [item.strip() for item in value.split(',')]
+    stores = []
+    for item in items:
+        if item and not item.startswith('#') and item not in stores:
+            stores.append(item)
+    return stores
+
+
+class StoreWriter:
+    """单个门店的输出：给每行加上门店编号后转交共享写入任务，同时按门店汇总供生成价格矩阵"""
+
+    def __init__(self, store, writer: OutputWriter, matrix):
+        self.store = store
+        self.writer = writer
+        self.matrix = matrix
+        self.rows = 0
+
+    async def write(self, rows):
+        rows = [dict(row, store=self.store) for row in rows]
+        for row in rows:
+            entry = self.matrix.setdefault((row['url'], row['size']), {
+                field: row[field] for field in MATRIX_KEY_FIELDS})
+            entry[self.store] = row['price']
+        self.rows += len(rows)
+        await self.writer.write(rows)
+
+
+def write_price_matrix(path, matrix, stores):
+    """(产品, 规格) × 门店 的价格矩阵，缺失的单元格留空"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=MATRIX_KEY_FIELDS + stores, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(matrix.values())
+    return len(matrix)
+
+
+async def scrape_store(browser, store, products, store_writer: StoreWriter, config, position):
+    """在门店自己的上下文池中只重跑定价步骤（选规格、加购、读购物车），返回该门店的统计"""
+    stats = {'store': store, 'products': len(products), 'rows': 0, 'elapsed_s': 0.0, 'ok': False}
+    started = time.perf_counter()
+    session_dir = config['session_dir']
+    pool = await PagePool(browser, config['concurrency'], max_uses=config['page_max_uses'],
+                          memory_limit_mb=config['page_memory_limit_mb'],
+                          state_dir=os.path.join(session_dir, f"store_{store}") if session_dir else None,
+                          store=store)
+    progress_bar = tqdm(total=len(products), desc=f"门店{store}", position=position, leave=True)
+    try:
+        await pool.start()
+        # 每个槽位在池启动时已打开过该门店的菜单页
+        menu_page = await pool.slots[0].acquire()
+        store_category = {'id': f"store-{store}", 'full_category': f"门店{store}", 'products': products}
+        stats['ok'] = await scrape_products_in_category(menu_page, store_category, store_writer, progress_bar,
+                                                        concurrency=config['concurrency'],
+                                                        price_mode=config['price_mode'],
+                                                        batch_size=config['cart_batch_size'],
+                                                        pool=pool)
+    except Exception as e:
+        log_error(f"门店 {store} 爬取失败: {str(e)}", store=store)
+    finally:
+        progress_bar.close()
+        await pool.close()
+        print_pool_report(pool)
+        stats['rows'] = store_writer.rows
+        stats['elapsed_s'] = round(time.perf_counter() - started, 1)
+    return stats
+
+
+async def _run_store_matrix(products, stores, output_name, config):
+    # 所有门店共用同一站点：并发上限按门店数放大，速率仍由每主机令牌桶统一调度
+    configure_run(config, max_concurrency=config['concurrency'] * len(stores))
+    configure_logging(fresh=True)
+
+    sinks = build_sinks(config['output_sinks'], f"{output_name}_stores", STORE_FIELDNAMES)
+    history_sink = None
+    if config['history_db']:
+        # 行自带门店编号，按 (url, 规格, 门店) 记录版本；指纹跳过（skip_unchanged）只用于单门店爬取
+        if config['skip_unchanged']:
+            print("多门店模式不支持 skip_unchanged，所有产品仍完整定价")
+        history_sink = HistorySink(PriceHistory(config['history_db']),
+                                   delta_path=f"{output_name}_stores_delta_{time.strftime('%Y%m%d_%H%M%S')}.csv")
+        history_sink.set_frontier({name for product in products for name in product['category'].split(' | ')},
+                                  [product['url'] for product in products], stores)
+        sinks.append(history_sink)
+    writer = OutputWriter(sinks)
+    await writer.start(fresh=True)
+    matrix = {}
+    async with async_playwright() as p:
+        browser = await launch_browser(p, headless=config['headless'])
+        try:
+            results = await asyncio.gather(*(
+                scrape_store(browser, store, products, StoreWriter(store, writer, matrix), config, position)
+                for position, store in enumerate(stores)
+            ))
+        finally:
+            await flush_screenshots()
+            await writer.close()
+            await browser.close()
+            print_routing_report()
+            print_rate_report()
+            print_selector_report()
+            if history_sink:
+                print_history_report(history_sink)
+            export_timings(config, f"{output_name}_stores")
+            shutdown_logging()
+
+    matrix_path = f"{output_name}_store_matrix.csv"
+    cells = write_price_matrix(matrix_path, matrix, stores)
+    print_store_report(results)
+    print(f"价格矩阵共 {cells} 个（产品, 规格），已保存到 {matrix_path}")
+    return results
+
+
+def run_store_matrix(products, stores, output_name, config):
+    """产品目录只发现一次（由调用方传入），各门店并行、各自独立上下文只重跑定价，输出长表和价格矩阵"""
+    products = dedupe_products(products)
+    print(f"\n共 {len(products)} 个产品，{len(stores)} 个门店并行定价")
+    return asyncio.run(_run_store_matrix(products, stores, output_name, config))
+
+
+def print_store_report(results):
+    print("\n===== 门店定价统计 =====")
+    for stats in results:
+        rate = stats['products'] / stats['elapsed_s'] * 60 if stats['elapsed_s'] else 0
+        print(f"门店{stats['store']}: {'完成' if stats['ok'] else '失败'} 产品: {stats['products']} "
+              f"行: {stats['rows']} 用时: {stats['elapsed_s']}s 每分钟产品数: {rate:.1f}")
\ No newline at end of file
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fixture_site import FixtureSite, build_catalog, slugify, start_fixture_site
+
+
+@pytest.fixture
+def fixture_site():
+    """在后台线程启动离线测试站点（20个产品，每10个一个售罄），返回 (site, base_url)"""
+    site = FixtureSite(build_catalog(20, sold_out_every=10), ui_delay_ms=0)
+    server, base_url = start_fixture_site(site)
+    yield site, base_url
+    server.shutdown()
+    server.server_close()
+
+
+def product_link(site, base_url, product_id):
+    """与类别解析得到的产品链接结构相同的产品字典"""
+    product = site.products[product_id]
+    return {
+        'name': product['name'],
+        'url': f"{base_url}/menu/product/{product_id}/{slugify(product['name'])}?parent=%2F{product['main']}",
+        'category': f"{product['second']} > {product['third']}",
+    }
\ No newline at end of file
@@ -0,0 +1,43 @@
+import html
+import re
+
+from category_tree import dedupe_categories, dedupe_products
+from fixture_site import MENU_LAYOUT, FixtureSite, build_catalog
+
+SECTION_RE = re.compile(r'<section[^>]* id="([^"]+)"><h2>([^<]*)</h2>(.*?)</section>', re.S)
+LINK_RE = re.compile(r'href="([^"]+)"(?: data-e2e="([^"]+)")?>(?:<span class="hiddenVisually">([^<]+)</span>)?')
+
+
+def fixture_branches(site, base_url='http://fixture'):
+    """按测试站点的类别页生成与 collect_branch 相同结构的分支（不启动浏览器）"""
+    branches = []
+    for main_id, main_name, seconds in MENU_LAYOUT:
+        for second, _ in seconds:
+            categories = []
+            for section_id, third, body in SECTION_RE.findall(site.category_html(main_id, second)):
+                products = [{'name': html.unescape(name or hidden), 'url': base_url + html.unescape(href),
+                             'category': f"{second} > {html.unescape(third)}"}
+                            for href, name, hidden in LINK_RE.findall(body)]
+                categories.append({'id': section_id, 'name': html.unescape(third), 'products': products})
+            branches.append({'main': {'id': main_id, 'name': main_name}, 'second': {'name': second},
+                             'categories': categories})
+    return branches
+
+
+def test_product_shared_across_categories_is_scraped_once():
+    site = FixtureSite(build_catalog(20))
+    shared = next(product for product in site.products.values() if product['also'])
+    branches = fixture_branches(site)
+    listed = [product for tree in branches for category in tree['categories'] for product in category['products']
+              if f"/menu/product/{shared['id']}/" in product['url']]
+    # 同一产品出现在两个主类别下，链接只有 ?parent= 不同
+    assert len(listed) == 2 and listed[0]['url'] != listed[1]['url']
+
+    products = [product for category in dedupe_categories(branches) for product in category['products']]
+    assert len(products) == len(site.products)
+    merged = [product for product in products if f"/menu/product/{shared['id']}/" in product['url']]
+    assert len(merged) == 1
+    assert merged[0]['category'] == " | ".join(product['category'] for product in listed)
+
+    # 门店矩阵和分片爬取的产品前沿使用同一去重
+    assert len(dedupe_products(listed + products)) == len(site.products)
\ No newline at end of file
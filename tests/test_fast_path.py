@@ -0,0 +1,145 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import product_link
+from fast_path import FastPathClient, parse_product_page
+from fixture_site import FixtureSite, build_catalog, start_fixture_site
+from rate_controller import configure_rate_control, throttle
+
+PRODUCT = {'name': 'Iced Caffè Latte®', 'url': 'https://www.starbucks.com/menu/product/409/iced?parent=%2Fdrinks',
+           'category': 'Drinks > Cold Coffee'}
+
+
+def next_data_page(page_props):
+    return (f'<html><body><script id="__NEXT_DATA__" type="application/json">'
+            f'{json.dumps({"props": {"pageProps": page_props}})}</script></body></html>')
+
+
+def node(product_number, name, sizes, sold_out=False):
+    return {'productNumber': product_number, 'name': name, 'isSoldOut': sold_out,
+            'sizes': [{'sizeCode': size, 'price': price, 'calories': str(calories)}
+                      for size, price, calories in sizes]}
+
+
+def test_related_products_do_not_add_sizes_or_sold_out():
+    html = next_data_page({
+        'product': node(409, 'Iced Caffè Latte', [('Tall', 4.45, 130), ('Grande', 4.95, 190)]),
+        'recommendations': [node(2121206, 'Iced Coffee', [('Grande', 3.65, 80), ('Trenta', 4.25, 120)], sold_out=True)],
+    })
+    rows = parse_product_page(html, PRODUCT)
+    assert [(r['size'], r['price'], r['calories']) for r in rows] == [
+        ('Tall', '$4.45', '130'), ('Grande', '$4.95', '190')]
+
+
+def test_sold_out_read_from_product_node():
+    html = next_data_page({
+        'product': node(409, 'Iced Caffè Latte', [('Tall', None, 130), ('Grande', None, 190)], sold_out=True),
+        'recommendations': [node(2121206, 'Iced Coffee', [('Grande', 3.65, 80)])],
+    })
+    rows = parse_product_page(html, PRODUCT)
+    assert [(r['size'], r['price'], r['calories']) for r in rows] == [
+        ('Tall', 'soldout', '130'), ('Grande', 'soldout', '190')]
+
+
+def test_product_matched_by_name_in_window_state():
+    state = {'catalog': [node(None, 'Iced Coffee', [('Trenta', 4.25, 120)]),
+                         node(None, 'ICED CAFFÈ  LATTE', [('Venti', 5.45, 250)])]}
+    html = f'<script>window.__INITIAL_STATE__ = {json.dumps(state)};</script>'
+    rows = parse_product_page(html, PRODUCT)
+    assert [(r['size'], r['price']) for r in rows] == [('Venti', '$5.45')]
+
+
+def test_page_without_current_product_falls_back():
+    html = next_data_page({'recommendations': [node(1, 'Iced Coffee', [('Grande', 3.65, 80)]),
+                                               node(2, 'Cold Brew', [('Grande', 4.25, 5)])]})
+    assert parse_product_page(html, PRODUCT) == []
+
+
+def test_missing_price_falls_back_unless_not_required():
+    html = next_data_page({'product': node(409, 'Iced Caffè Latte', [('Tall', 4.45, 130), ('Grande', None, 190)])})
+    assert parse_product_page(html, PRODUCT) == []
+    rows = parse_product_page(html, PRODUCT, require_price=False)
+    assert [(r['size'], r['price']) for r in rows] == [('Tall', '$4.45'), ('Grande', 'N/A')]
+
+
+async def _scrape(products, timeout=5):
+    client = FastPathClient(pool_size=4, timeout=timeout)
+    await client.start()
+    try:
+        return [await client.scrape_product(product) for product in products], client
+    finally:
+        await client.close()
+
+
+def test_client_against_fixture_site(fixture_site):
+    site, base_url = fixture_site
+    # 108 的推荐中有售罄的 109，109 本身售罄
+    results, client = asyncio.run(_scrape([product_link(site, base_url, 108), product_link(site, base_url, 109)]))
+    available, sold_out = results
+    assert [(r['size'], r['price'], r['calories']) for r in available] == [
+        (s['name'], f"${s['price']:.2f}", str(s['calories'])) for s in site.products[108]['sizes']]
+    assert [(r['size'], r['price']) for r in sold_out] == [(s['name'], 'soldout') for s in site.products[109]['sizes']]
+    assert (client.hits, client.misses) == (2, 0)
+
+
+def test_client_miss_on_missing_page(fixture_site):
+    site, base_url = fixture_site
+    product = dict(product_link(site, base_url, 108), url=f"{base_url}/menu/product/999/missing")
+    results, client = asyncio.run(_scrape([product]))
+    assert results == [[]]
+    assert (client.hits, client.misses) == (0, 1)
+
+
+@pytest.fixture
+def rate_control():
+    controller = configure_rate_control(True, max_concurrency=2, initial_rate=50.0, max_rate=100.0, cooldown=0)
+    yield controller
+    configure_rate_control(False)
+
+
+def test_requests_go_through_rate_controller(fixture_site, rate_control):
+    site, base_url = fixture_site
+    asyncio.run(_scrape([product_link(site, base_url, 108), product_link(site, base_url, 109)]))
+    stats = rate_control.metrics()
+    assert stats['successes'] == 2 and stats['failures'] == {} and stats['in_flight'] == 0
+
+
+def test_timeouts_are_fed_back(rate_control):
+    site = FixtureSite(build_catalog(20), latency_ms=500)
+    server, base_url = start_fixture_site(site)
+    try:
+        results, client = asyncio.run(_scrape([product_link(site, base_url, 108)], timeout=0.1))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert results == [[]] and client.misses == 1
+    assert rate_control.metrics()['failures'] == {'timeout': 1}
+
+
+def test_cancelled_enter_releases_slot(rate_control):
+    async def run():
+        bucket = rate_control.bucket('example.com')
+        bucket.tokens = 0
+        bucket.rate = 0.01
+        task = asyncio.ensure_future(rate_control.enter('example.com'))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert rate_control.metrics()['in_flight'] == 0
+
+
+def test_unmeasured_permit_skips_latency_feedback(rate_control):
+    async def run():
+        rate_control.latency_target = 0.01
+        for measure in (False, True):
+            async with throttle('http://example.com/menu/cart', measure=measure):
+                await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    stats = rate_control.metrics()
+    assert stats['slow'] == 1 and stats['successes'] == 0 and stats['in_flight'] == 0
\ No newline at end of file
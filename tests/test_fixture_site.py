@@ -0,0 +1,36 @@
+import json
+import urllib.error
+import urllib.request
+from http.cookiejar import CookieJar
+
+import pytest
+
+from page_handler import menu_path
+
+
+def opener():
+    return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+
+def add_to_cart(client, base_url, product_id, size):
+    request = urllib.request.Request(f"{base_url}/api/cart/add", method='POST',
+                                     data=json.dumps({'product_id': product_id, 'size': size}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with client.open(request) as response:
+        return json.loads(response.read())
+
+
+def test_pricing_fails_without_selected_store(fixture_site):
+    site, base_url = fixture_site
+    product = site.products[101]
+    client = opener()
+    # 只打开产品页（新上下文未打开门店菜单页）：会话没有门店，加购被拒绝
+    client.open(f"{base_url}/menu/product/101/x").read()
+    with pytest.raises(urllib.error.HTTPError) as error:
+        add_to_cart(client, base_url, 101, product['sizes'][0]['name'])
+    assert error.value.code == 409
+    assert not any(site.carts.values())
+
+    # 同一会话打开门店菜单页后即可加购定价
+    client.open(f"{base_url}{menu_path()}").read()
+    assert add_to_cart(client, base_url, 101, product['sizes'][0]['name']) == {'count': 1}
\ No newline at end of file
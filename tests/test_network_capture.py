@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+from urllib.request import urlopen
+
+from conftest import product_link
+from fixture_site import FixtureSite, build_catalog, load_recorded, start_fixture_site
+from network_capture import get_product_sizes_from_network, merge_size_records
+
+RECORDED = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'recorded_iced_latte.json')
+PRODUCT = {'name': 'Iced Caffè Latte®', 'url': 'https://www.starbucks.com/menu/product/409/iced?parent=%2Fdrinks'}
+
+
+class RecordedCapture:
+    """按录制顺序从桩服务请求接口，得到与 ResponseCapture.payloads 相同结构的载荷"""
+
+    def __init__(self, base_url, paths):
+        self.base_url = base_url
+        self.paths = paths
+        self.payloads = []
+
+    async def drain(self):
+        for path in self.paths:
+            with urlopen(self.base_url + path) as response:
+                self.payloads.append({'url': self.base_url + path, 'payload': json.load(response)})
+
+
+def recorded_stub(paths=None):
+    site = FixtureSite(build_catalog(0), recorded=load_recorded([RECORDED]))
+    server, base_url = start_fixture_site(site)
+    with open(RECORDED, encoding='utf-8') as f:
+        recorded_paths = [entry['url'] for entry in json.load(f)]
+    return server, RecordedCapture(base_url, paths or recorded_paths)
+
+
+def test_recommendations_do_not_fill_prices():
+    server, capture = recorded_stub()
+    try:
+        rows = asyncio.run(get_product_sizes_from_network(capture, PRODUCT['name'], PRODUCT['url'], 'Cold Coffee'))
+    finally:
+        server.shutdown()
+        server.server_close()
+    # 推荐产品的响应先到，不过滤时 Grande 会取到 Iced Coffee 的 $3.65 并多出 Trenta
+    assert len(capture.payloads) == 3
+    assert [(r['size'], r['price'], r['calories']) for r in rows] == [
+        ('Tall', '$4.45', '130'), ('Grande', '$4.95', '190'), ('Venti', '$5.45', '250')]
+
+
+def test_unfiltered_merge_takes_first_payload():
+    with open(RECORDED, encoding='utf-8') as f:
+        payloads = json.load(f)
+    assert merge_size_records(payloads)['Grande']['price'] == '$3.65'
+    assert 'Trenta' not in merge_size_records(payloads, PRODUCT)
+
+
+def test_only_other_products_falls_back_to_cart():
+    server, capture = recorded_stub(['/bff/ordering/recommendations/409/iced'])
+    try:
+        rows = asyncio.run(get_product_sizes_from_network(capture, PRODUCT['name'], PRODUCT['url'], 'Cold Coffee'))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert rows == []
+
+
+def test_fixture_product_api(fixture_site):
+    site, base_url = fixture_site
+    product = product_link(site, base_url, 108)
+    with urlopen(f"{base_url}/bff/ordering/product/108") as response:
+        payloads = [{'url': response.url, 'payload': json.load(response)}]
+    records = merge_size_records(payloads, product)
+    assert records == {s['name']: {'price': f"${s['price']:.2f}", 'calories': str(s['calories'])}
+                       for s in site.products[108]['sizes']}
\ No newline at end of file
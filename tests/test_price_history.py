@@ -0,0 +1,82 @@
+import csv
+
+from price_history import HistorySink, PriceHistory
+
+URL_A = 'https://www.starbucks.com/menu/product/101/iced'
+URL_B = 'https://www.starbucks.com/menu/product/102/hot'
+CATEGORY = 'Drinks > Cold Coffee > Iced Coffee'
+
+
+def row(url, size, price, store=None, category=CATEGORY):
+    result = {'category': category, 'product_name': url.rsplit('/', 2)[-2], 'size': size, 'calories': '100',
+              'price': price, 'url': url}
+    if store:
+        result['store'] = store
+    return result
+
+
+def run(path, batches, frontier=None, store='1'):
+    sink = HistorySink(PriceHistory(str(path), store=store), delta_path=str(path) + '.delta.csv')
+    sink.open()
+    for batch in batches:
+        sink.write_batch(batch)
+    if frontier:
+        sink.set_frontier(*frontier)
+    run_id = sink.history.run_id
+    sink.close()
+    return sink, run_id
+
+
+def current(path, store='1'):
+    history = PriceHistory(str(path))
+    try:
+        rows = history.conn.execute("SELECT url, size, price FROM versions WHERE store = ? AND valid_to IS NULL "
+                                    "ORDER BY url, size", (store,)).fetchall()
+        return [tuple(r) for r in rows]
+    finally:
+        history.close()
+
+
+def test_unchanged_rows_are_not_versioned(tmp_path):
+    db = tmp_path / 'history.db'
+    run(db, [[row(URL_A, 'Tall', '$3.00'), row(URL_A, 'Grande', '$3.50')]])
+    sink, _ = run(db, [[row(URL_A, 'Tall', '$3.00'), row(URL_A, 'Grande', '$3.75')]])
+    assert sink.changed == 1
+    assert current(db) == [(URL_A, 'Grande', '$3.75'), (URL_A, 'Tall', '$3.00')]
+
+
+def test_disappearing_size_is_closed(tmp_path):
+    db = tmp_path / 'history.db'
+    run(db, [[row(URL_A, 'Tall', '$3.00'), row(URL_A, 'Trenta', '$4.50')]])
+    sink, _ = run(db, [[row(URL_A, 'Tall', '$3.00')]])
+    assert sink.history.removed == 1
+    assert current(db) == [(URL_A, 'Tall', '$3.00')]
+    with open(str(db) + '.delta.csv', encoding='utf-8') as f:
+        delta = list(csv.DictReader(f))
+    assert [(d['size'], d['price'], d['previous_price']) for d in delta] == [('Trenta', '', '$4.50')]
+
+
+def test_disappearing_product_closed_only_when_category_fully_crawled(tmp_path):
+    db = tmp_path / 'history.db'
+    run(db, [[row(URL_A, 'Tall', '$3.00')], [row(URL_B, 'Tall', '$2.00')]])
+    # 未登记前沿（如只重爬失败队列）：不关闭
+    run(db, [[row(URL_A, 'Tall', '$3.00')]])
+    assert len(current(db)) == 2
+    # 失败的产品仍在前沿中：不关闭
+    run(db, [[row(URL_A, 'Tall', '$3.00')]], frontier=([CATEGORY], [URL_A, URL_B]))
+    assert len(current(db)) == 2
+    # 其他类别的完整爬取：不关闭
+    run(db, [[row(URL_A, 'Tall', '$3.00')]], frontier=(['Food > Bakery > Muffins'], [URL_A]))
+    assert len(current(db)) == 2
+    run(db, [[row(URL_A, 'Tall', '$3.00')]], frontier=([CATEGORY], [URL_A]))
+    assert current(db) == [(URL_A, 'Tall', '$3.00')]
+
+
+def test_rows_keep_their_own_store(tmp_path):
+    db = tmp_path / 'history.db'
+    run(db, [[row(URL_A, 'Tall', '$3.00', store='1')], [row(URL_A, 'Tall', '$3.20', store='2')]], store='')
+    sink, _ = run(db, [[row(URL_A, 'Tall', '$3.00', store='1')]],
+                  frontier=([CATEGORY], [URL_A], ['1', '2']), store='')
+    assert sink.history.removed == 0
+    assert current(db, '1') == [(URL_A, 'Tall', '$3.00')]
+    assert current(db, '2') == [(URL_A, 'Tall', '$3.20')]
\ No newline at end of file
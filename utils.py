@@ -1,11 +1,157 @@
+import asyncio
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
 import time
 import sys
+import uuid
+
+ERROR_LOG = 'scrape_error_log.jsonl'
+
+# 当前任务的日志上下文（类别、产品、阶段），每个worker任务互不影响
+_log_context = contextvars.ContextVar('log_context', default={})
+_logger = logging.getLogger('starbucks_scraper')
+_listener = None
+run_id = uuid.uuid4().hex[:8]
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录一行JSON：时间、级别、运行ID、上下文字段和消息"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%d %H:%M:%S'),
+            'level': record.levelname,
+            'run': run_id,
+        }
+        entry.update(getattr(record, 'context', {}))
+        entry['message'] = record.getMessage()
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(path=ERROR_LOG, fresh=True, max_bytes=5 * 1024 * 1024, backup_count=5, new_run_id=None):
+    """启动后台日志线程：记录经队列交给 QueueListener，由它写入按大小轮转的文件
+
+    fresh=True 时把上次运行的日志轮转为备份文件，而不是直接清空
+    """
+    global _listener, run_id
+    shutdown_logging()
+    if new_run_id:
+        run_id = new_run_id
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                   encoding='utf-8', delay=True)
+    if fresh and os.path.exists(path) and os.path.getsize(path):
+        handler.doRollover()
+    handler.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    _logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+
+
+# 进程退出前写完队列中剩余的日志
+atexit.register(lambda: shutdown_logging())
+
+
+def shutdown_logging():
+    """写完队列中剩余的记录并停止后台线程"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def bind_context(**fields):
+    """为当前任务绑定日志上下文字段（如 category、product、phase）"""
+    _log_context.set({**_log_context.get(), **fields})
+
+
+def current_context():
+    return _log_context.get()
+
+
+def log_error(message, **fields):
+    """记录错误信息（非阻塞：只入队，由后台线程写文件）"""
+    if _listener is None:
+        configure_logging(fresh=False)
+    _logger.error(message, extra={'context': {**_log_context.get(), **fields}})
+
+
+class ScreenshotLimiter:
+    """错误截图限流：两次截图至少间隔 min_interval 秒，每次运行最多 max_count 张"""
+
+    def __init__(self, min_interval=30.0, max_count=20):
+        self.min_interval = min_interval
+        self.max_count = max_count
+        self.taken = 0
+        self.skipped = 0
+        self.last_at = None
+        self.pending = set()
+
+    def allow(self):
+        now = time.monotonic()
+        if self.taken >= self.max_count or (self.last_at is not None and now - self.last_at < self.min_interval):
+            self.skipped += 1
+            return False
+        self.taken += 1
+        self.last_at = now
+        return True
+
+
+screenshots = ScreenshotLimiter()
+
+
+def configure_screenshots(min_interval, max_count):
+    """设置错误截图的最小间隔（秒）和每次运行的上限，max_count=0 表示不截图"""
+    screenshots.min_interval = min_interval
+    screenshots.max_count = max_count
+
+
+async def _save_screenshot(path, data):
+    try:
+        await asyncio.to_thread(_write_bytes, path, data)
+    except Exception as e:
+        log_error(f"保存截图 {path} 失败: {str(e)}")
+
+
+def _write_bytes(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+async def capture_screenshot(page, prefix, timeout=5000):
+    """截取可视区域后返回，写盘放到后台任务中不等待；超出限流时直接跳过
+
+    截图必须在返回前完成：调用方随后可能跳转、回收或关闭这个标签页
+    """
+    if not screenshots.allow():
+        return
+    path = f"{prefix}_{int(time.time())}.png"
+    try:
+        data = await page.screenshot(timeout=timeout)
+    except Exception as e:
+        log_error(f"截图 {path} 失败: {str(e)}")
+        return
+    task = asyncio.ensure_future(_save_screenshot(path, data))
+    screenshots.pending.add(task)
+    task.add_done_callback(screenshots.pending.discard)
+
+
+async def flush_screenshots(timeout=10):
+    """等待仍在进行的截图完成（关闭浏览器前调用）"""
+    if screenshots.pending:
+        await asyncio.wait(list(screenshots.pending), timeout=timeout)
+    if screenshots.skipped:
+        print(f"错误截图: 保存 {screenshots.taken} 张，限流跳过 {screenshots.skipped} 张")
 
-def log_error(message):
-    """记录错误信息到日志文件"""
-    with open('hotcoffeeerror_log.txt', 'a', encoding='utf-8') as f:
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        f.write(f"[{timestamp}] {message}\n")
 
 def print_progress(step, total, message):
     """打印进度信息"""
@@ -0,0 +1,150 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+from playwright.async_api import Page
+from selector_registry import FIRST_MATCH_JS, selector_list
+
+# 各等待条件的超时时间（毫秒）
+TIMEOUTS = {
+    'menu_ready': 15000,
+    'calories_change': 3000,
+    'dialog_open': 3000,
+    'dialog_close': 3000,
+    'cart_ready': 10000,
+    'cart_change': 5000,
+    'grid_ready': 5000,
+}
+
+# 每个条件实际等待耗时记录：{条件名: [(耗时秒, 是否满足), ...]}
+_wait_records = defaultdict(list)
+
+
+class JitterPolicy:
+    """模拟人工操作的随机停顿策略，默认关闭，不作为每次操作的固定开销"""
+
+    def __init__(self, min_ms=0, max_ms=0):
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+
+    async def pause(self):
+        if self.max_ms <= 0:
+            return
+        await asyncio.sleep(random.uniform(self.min_ms, self.max_ms) / 1000)
+
+
+jitter = JitterPolicy()
+
+
+def configure_jitter(min_ms, max_ms):
+    """设置全局随机停顿区间（毫秒），max_ms<=0 表示关闭"""
+    jitter.min_ms = min_ms
+    jitter.max_ms = max_ms
+
+
+def _record(name, started, satisfied):
+    _wait_records[name].append((time.perf_counter() - started, satisfied))
+
+
+async def wait_for_condition(page: Page, name, predicate, arg=None, timeout=None) -> bool:
+    """等待页面内JS条件成立，成立即返回；超时返回False，不抛异常"""
+    started = time.perf_counter()
+    try:
+        await page.wait_for_function(predicate, arg=arg, timeout=timeout or TIMEOUTS[name])
+        _record(name, started, True)
+        return True
+    except Exception:
+        _record(name, started, False)
+        return False
+
+
+async def wait_for_state(page: Page, name, selector, state='visible', timeout=None) -> bool:
+    """等待元素进入指定状态（visible/hidden/attached/detached）"""
+    started = time.perf_counter()
+    try:
+        await page.wait_for_selector(selector, state=state, timeout=timeout or TIMEOUTS[name])
+        _record(name, started, True)
+        return True
+    except Exception:
+        _record(name, started, False)
+        return False
+
+
+async def wait_for_text_change(page: Page, name, alternatives, old_text, timeout=None) -> bool:
+    """等待第一个命中的备选（page_alternatives）的文本与 old_text 不同（如切换规格后卡路里刷新）"""
+    return await wait_for_condition(
+        page, name,
+        f"""([alternatives, oldText]) => {{
+            const [index, el] = ({FIRST_MATCH_JS})(document, alternatives);
+            return !!el && el.textContent !== oldText;
+        }}""", [alternatives, old_text], timeout)
+
+
+CART_SIGNATURE_JS = """(selectors) => {
+    for (const sel of selectors) {
+        const items = document.querySelectorAll(sel);
+        if (items.length) return Array.from(items, el => el.innerText).join('||');
+    }
+    return '';
+}"""
+
+
+async def cart_signature(page: Page):
+    """购物车内容签名（条目文本拼接），用于判断数量是否已更新"""
+    return await page.evaluate(CART_SIGNATURE_JS, selector_list('cart_item'))
+
+
+async def wait_for_cart_change(page: Page, old_signature, timeout=None) -> bool:
+    """等待购物车内容签名变化（如减少数量后）"""
+    return await wait_for_condition(
+        page, 'cart_change',
+        """([selectors, oldSignature]) => {
+            let signature = '';
+            for (const sel of selectors) {
+                const items = document.querySelectorAll(sel);
+                if (items.length) { signature = Array.from(items, el => el.innerText).join('||'); break; }
+            }
+            return signature !== oldSignature;
+        }""", [selector_list('cart_item'), old_signature], timeout)
+
+
+async def wait_for_cart_ready(page: Page, timeout=None) -> bool:
+    """等待购物车页面渲染出条目或空购物车提示"""
+    return await wait_for_condition(
+        page, 'cart_ready',
+        """(selectors) => selectors.some(sel => document.querySelector(sel))
+            || document.body.innerText.includes('Start your next order')""", selector_list('cart_item'), timeout)
+
+
+async def wait_for_grid_ready(page: Page, section_id, timeout=None) -> bool:
+    """等待三级类别下每个产品格子都渲染出产品链接（懒加载完成）"""
+    return await wait_for_condition(
+        page, 'grid_ready',
+        """(sectionId) => {
+            const items = document.querySelectorAll(`section[id="${sectionId}"] li.gridItem`);
+            return items.length > 0 && Array.from(items).every(li => li.querySelector('a[href^="/menu/product/"]'));
+        }""", section_id, timeout)
+
+
+def wait_report():
+    """汇总各等待条件的次数、超时次数、平均和最大耗时"""
+    report = {}
+    for name, records in _wait_records.items():
+        durations = [d for d, _ in records]
+        report[name] = {
+            'count': len(records),
+            'timeouts': sum(1 for _, ok in records if not ok),
+            'avg_ms': round(sum(durations) / len(durations) * 1000, 1),
+            'max_ms': round(max(durations) * 1000, 1),
+        }
+    return report
+
+
+def print_wait_report():
+    report = wait_report()
+    if not report:
+        return
+    print("\n===== 等待耗时统计 =====")
+    for name, stats in sorted(report.items()):
+        print(f"{name}: 次数={stats['count']} 超时={stats['timeouts']} "
+              f"平均={stats['avg_ms']}ms 最大={stats['max_ms']}ms")
\ No newline at end of file